@@ -6,32 +6,297 @@
 '''
 from app.lib.constants import Constants
 from .base_controller import BaseController
-from PyQt5.QtCore import Qt, pyqtSignal
-from PyQt5.QtGui import QPainter
+from PyQt5.QtCore import QRect, QRectF, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QPainter, QRegion, QTransform
+import collections
+import os
+import time
 
 
 class CanvasController(BaseController):
     '''
         Canvas Controller
 
+        Mouse moves are coalesced, the points that arrive between frames are
+        drawn in one go at most once per frame. A HUD of frame statistics
+        can be shown over the canvas, see setHudVisible
+
         Args:
-            brush (Brush): brush
+            canvas  (Canvas): canvas
+            brush   (Brush):  brush
+            latency (int):    The longest a point waits to be drawn, in ms
     '''
     update = pyqtSignal(object)
 
-    def __init__(self, canvas, brush, parent):
+    class Hud:
+        '''
+            Frame statistics drawn over the top left of the canvas: frames a
+            second, how long the last paint took, the area invalidated and
+            the input events handled since the frame before, the size of the
+            undo history and the resident memory of the process. Counting
+            is a few additions per event, and the resident memory is read
+            at most once a second
+
+            Args:
+                metrics (QFontMetrics): The metrics of the font drawn with
+        '''
+        MARGIN = 8
+        PADDING = 6
+        RSS_INTERVAL = 1.0
+        # The widest each line gets, so the HUD doesn't change size
+        TEMPLATES = ("000 fps, paint 000.0 ms", "dirty 000000.0 kpx",
+                     "input 0000 events/frame", "undo 00000.0 KiB",
+                     "rss 000000.0 MiB")
+
+        def __init__(self, metrics):
+            self.paints = collections.deque()
+            self.paintMs = 0.0
+            self.dirtyArea = 0
+            self.inputEvents = 0
+            self.frameArea = 0
+            self.frameInputs = 0
+            self.rss = None
+            self.rssTime = None
+            self.lineHeight = metrics.height()
+            self.rect = QRect(
+                self.MARGIN, self.MARGIN,
+                max(metrics.horizontalAdvance(line)
+                    for line in self.TEMPLATES) + self.PADDING * 2,
+                self.lineHeight * len(self.TEMPLATES) + self.PADDING * 2)
+
+        def getRect(self):
+            '''
+                Returns:
+                    (QRect): Where the HUD is drawn, in widget coordinates
+            '''
+            return self.rect
+
+        def beginFrame(self, now: float):
+            '''
+                Start a frame, the area and events counted since the last
+                one are its own
+
+                Args:
+                    now (float): The time, from time.perf_counter
+            '''
+            self.paints.append(now)
+            while now - self.paints[0] > 1:
+                self.paints.popleft()
+            self.frameArea, self.dirtyArea = self.dirtyArea, 0
+            self.frameInputs, self.inputEvents = self.inputEvents, 0
+
+        def getResidentMemory(self, now: float):
+            '''
+                The resident memory of the process, from /proc where there is
+                one, read at most once a second
+
+                Args:
+                    now (float): The time, from time.perf_counter
+
+                Returns:
+                    (int): Bytes, None where it can't be read
+            '''
+            if self.rssTime is None or now - self.rssTime >= self.RSS_INTERVAL:
+                self.rssTime = now
+                try:
+                    with open('/proc/self/statm') as statm:
+                        self.rss = int(statm.read().split()[1]) * os.sysconf(
+                            'SC_PAGE_SIZE')
+                except (OSError, ValueError):
+                    self.rss = None
+            return self.rss
+
+        @staticmethod
+        def getSizeText(size):
+            '''
+                Args:
+                    size (int): Bytes
+
+                Returns:
+                    (str): The size in KiB, or MiB from 1 MiB
+            '''
+            if size < 1024 * 1024:
+                return "%.1f KiB" % (size / 1024)
+            return "%.1f MiB" % (size / 1024 / 1024)
+
+        def paint(self, painter, canvas, now: float):
+            '''
+                Draw the HUD
+
+                Args:
+                    painter (QPainter): A painter on the widget, untransformed
+                    canvas  (Canvas):   The canvas shown
+                    now     (float):    The time, from time.perf_counter
+            '''
+            rss = self.getResidentMemory(now)
+            lines = (
+                "%d fps, paint %.1f ms" % (len(self.paints), self.paintMs),
+                "dirty %.1f kpx" % (self.frameArea / 1000),
+                "input %d events/frame" % (self.frameInputs),
+                "undo %s" % (self.getSizeText(canvas.history.getSize())),
+                "rss %s" % ("?" if rss is None else self.getSizeText(rss)))
+            painter.fillRect(self.rect, QColor(0, 0, 0, 160))
+            painter.setPen(Qt.white)
+            for index, line in enumerate(lines):
+                painter.drawText(
+                    QRect(self.rect.left() + self.PADDING,
+                          self.rect.top() + self.PADDING +
+                          index * self.lineHeight,
+                          self.rect.width() - self.PADDING * 2,
+                          self.lineHeight), Qt.AlignLeft | Qt.AlignVCenter,
+                    line)
+
+    def __init__(self,
+                 canvas,
+                 brush,
+                 parent,
+                 latency=Constants.INPUT_LATENCY_MS):
         super().__init__(parent)    # TODO add a signal for a paint event
         self.setMinimumSize(400, 400)
         self.brush = brush
         self.canvas = canvas
+        self.scaledImages = {}
+        self.pendingPoint = None
+        self.frameTimer = QTimer(self)
+        self.frameTimer.setSingleShot(True)
+        self.frameTimer.timeout.connect(self.renderFrame)
+        self.setInputLatency(latency)
+        self.hud = None
+        # The HUD refreshes itself while idle, as nothing else repaints
+        self.hudTimer = QTimer(self)
+        self.hudTimer.setInterval(1000)
+        self.hudTimer.timeout.connect(self.invalidateHud)
+        # Repaints are driven by the canvas reporting what changed
+        self.canvas.changed.connect(self.invalidate)
 
     def clear(self):
         self.canvas.clear()
-        super().update()
 
     def undo(self):
         self.canvas.undo()
-        super().update()
+
+    def redo(self):
+        self.canvas.redo()
+
+    def getViewSize(self):
+        '''
+            The size the canvas image is shown at, fitted to the widget
+
+            Returns:
+                (QSize)
+        '''
+        return self.canvas.image.size().scaled(self.size(), Qt.KeepAspectRatio)
+
+    def getTransform(self):
+        '''
+            The transform from canvas image coordinates to widget coordinates,
+            the image is scaled to fit and centered
+
+            Returns:
+                (QTransform)
+        '''
+        image = self.canvas.image
+        view = self.getViewSize()
+        return QTransform(view.width() / image.width(), 0, 0,
+                          view.height() / image.height(),
+                          (self.width() - view.width()) // 2,
+                          (self.height() - view.height()) // 2)
+
+    def mapToCanvas(self, point):
+        '''
+            Map a point on the widget to a point on the canvas image
+
+            Args:
+                point (QPoint): The point in widget coordinates
+
+            Returns:
+                (QPoint)
+        '''
+        return self.getTransform().inverted()[0].map(point)
+
+    def getScaledImage(self):
+        '''
+            Get a smooth scaled copy of the composited layers at the current
+            view size, these are cached per zoom level and kept up to date as
+            the canvas changes
+
+            Returns:
+                (QImage)
+        '''
+        view = self.getViewSize()
+        key = (view.width(), view.height())
+        if key not in self.scaledImages:
+            if len(self.scaledImages) >= Constants.VIEW_CACHE_LEVELS:
+                del self.scaledImages[next(iter(self.scaledImages))]
+            self.scaledImages[key] = self.canvas.getComposite().scaled(view)
+        return self.scaledImages[key]
+
+    def releaseViewCache(self):
+        '''
+            Drop the cached scaled copies of the canvas image
+        '''
+        self.scaledImages = {}
+
+    def invalidate(self, rect):
+        '''
+            Schedule a repaint of a region of the canvas image, refreshing
+            the same region of any cached scaled copies
+
+            Args:
+                rect (QRect): The region in canvas image coordinates
+        '''
+        if rect.isEmpty():
+            return
+        image = self.canvas.getComposite()
+        for scaled in self.scaledImages.values():
+            scale = QTransform.fromScale(scaled.width() / image.width(),
+                                         scaled.height() / image.height())
+            target = QRectF(
+                scale.mapRect(QRectF(rect)).toAlignedRect().adjusted(
+                    -1, -1, 1, 1))
+            painter = QPainter(scaled)
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+            image.paint(painter, target, scale.inverted()[0].mapRect(target))
+            painter.end()
+        rect = self.getTransform().mapRect(QRectF(rect)).toAlignedRect()
+        super().update(rect.adjusted(-1, -1, 1, 1))
+        if self.hud:
+            self.hud.dirtyArea += rect.width() * rect.height()
+            self.invalidateHud()
+
+    def setHudVisible(self, visible: bool):
+        '''
+            Show or hide the HUD of frame statistics
+
+            Args:
+                visible (bool): If it's shown
+        '''
+        if visible == bool(self.hud):
+            return
+        if visible:
+            self.hud = CanvasController.Hud(self.fontMetrics())
+            self.hudTimer.start()
+            self.invalidateHud()
+        else:
+            super().update(self.hud.getRect())
+            self.hud = None
+            self.hudTimer.stop()
+
+    def isHudVisible(self):
+        '''
+            Returns:
+                (bool): If the HUD is shown
+        '''
+        return self.hud is not None
+
+    def invalidateHud(self):
+        '''
+            Schedule a repaint of the HUD, Qt merges it with the repaint of
+            the canvas in the same frame
+        '''
+        if self.hud:
+            super().update(self.hud.getRect())
 
     def isBrush(self):
         '''
@@ -51,39 +316,86 @@ class CanvasController(BaseController):
         '''
         return self.brush.getBrushType() == Constants.BrushTypes.LINE
 
+    def isFill(self):
+        '''
+            A helper check for if the brush is currently a fill
+
+            Returns:
+                (bool)
+        '''
+        return self.brush.getBrushType() == Constants.BrushTypes.FILL
+
     def mousePressEvent(self, event):
         '''
             Handle a mouse press event
         '''
-        if event.button() == Qt.LeftButton:
+        if self.hud:
+            self.hud.inputEvents += 1
+        if event.button() == Qt.LeftButton and self.isFill():
+            # A fill is complete on the click, with its own undo step
+            self.canvas.fill(self.mapToCanvas(event.pos()), self.brush)
+            self.update.emit(self.canvas.state)
+        elif event.button() == Qt.LeftButton:
             # On click preserve the current image
             self.canvas.snapshotImage()
-            self.canvas.brushOnCanvas(event.pos())
             if self.isBrush():
-                self.canvas.draw(event.pos(), self.brush)
-            super().update()
+                self.canvas.beginStroke(self.mapToCanvas(event.pos()),
+                                        self.brush)
+            else:
+                self.canvas.brushOnCanvas(self.mapToCanvas(event.pos()))
             self.update.emit(self.canvas.state)
 
     def mouseMoveEvent(self, event):
         '''
             Handle a mouse move event
         '''
+        if self.hud:
+            self.hud.inputEvents += 1
         if event.buttons() and Qt.LeftButton and self.canvas.isDrawing():
+            point = self.mapToCanvas(event.pos())
             if self.isBrush():
-                self.canvas.draw(event.pos(), self.brush)
+                self.canvas.extendStroke(point)
             if self.isLine():
-                self.canvas.drawPreview(event.pos(), self.brush)
-            super().update()
-            self.update.emit(self.canvas.state)
+                self.pendingPoint = point
+            if not self.frameTimer.isActive():
+                self.frameTimer.start()
+
+    def renderFrame(self):
+        '''
+            Draw the mouse moves that have arrived since the last frame
+        '''
+        if not self.canvas.isDrawing():
+            return
+        if self.isBrush():
+            self.canvas.flushStroke()
+        if self.isLine() and self.pendingPoint is not None:
+            self.canvas.drawPreview(self.pendingPoint, self.brush)
+            self.pendingPoint = None
+        self.update.emit(self.canvas.state)
+
+    def setInputLatency(self, latency: int):
+        '''
+            Set how long mouse moves are collected for before being drawn
+
+            Args:
+                latency (int): The longest a point waits to be drawn, in ms
+        '''
+        self.frameTimer.setInterval(latency)
 
     def mouseReleaseEvent(self, event):
         '''
             Handle a mouse release event
         '''
+        if self.hud:
+            self.hud.inputEvents += 1
         if event.button() == Qt.LeftButton:
+            # The stroke is flushed as the brush leaves the canvas, and a
+            # line is drawn to the release point, so the frame isn't needed
+            self.frameTimer.stop()
+            self.pendingPoint = None
             if self.isLine():
-                self.canvas.drawActual(event.pos(), self.brush)
-                super().update()
+                self.canvas.drawActual(self.mapToCanvas(event.pos()),
+                                       self.brush)
             self.canvas.brushAwayFromCanvas()
             self.update.emit(self.canvas.state)
 
@@ -91,23 +403,32 @@ class CanvasController(BaseController):
         '''
             Handle a paint event
         '''
-        # Draws the rectangular portion source of the given image into the
-        # target rectangle in the paint device.
-        QPainter(self).drawImage(self.rect(), self.canvas.image,
-                                 self.canvas.image.rect())
-        super().update()
-
-    def resizeEvent(self, _):
-        '''
-            On resize, reset the image
-        '''
-        self.canvas.setSize(self.size())
-        self.canvas.reset()
-        super().update()
-
-    def showEvent(self, _):
-        '''
-            On show, reset the image
-        '''
-        self.canvas.reset()
-        super().update()
+        start = time.perf_counter() if self.hud else None
+        painter = QPainter(self)
+        transform = self.getTransform()
+        document = transform.mapRect(QRectF(self.canvas.image.rect()))
+        # Fill the invalidated region around the image
+        for rect in QRegion(event.rect()).subtracted(
+                QRegion(document.toAlignedRect())).rects():
+            painter.fillRect(rect, self.palette().dark())
+        # Draws only the invalidated region of the cached composite of the
+        # layers, when it is scaled down this comes from the cached scaled
+        # copy rather than the composite
+        target = QRectF(event.rect()).intersected(document)
+        if transform.m11() < 1 and Constants.VIEW_CACHE_LEVELS:
+            painter.drawImage(target, self.getScaledImage(),
+                              target.translated(-document.topLeft()))
+        else:
+            self.canvas.getComposite().paint(
+                painter, target, transform.inverted()[0].mapRect(target))
+        # Previews live on an overlay drawn over the image
+        overlay = self.canvas.getOverlay()
+        if overlay:
+            painter.setTransform(transform)
+            overlay.paint(painter)
+        if self.hud:
+            now = time.perf_counter()
+            self.hud.beginFrame(now)
+            self.hud.paintMs = (now - start) * 1000
+            painter.resetTransform()
+            self.hud.paint(painter, self.canvas, now)
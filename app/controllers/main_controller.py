@@ -6,44 +6,246 @@
         Matthew Barber <mfmbarber@gmail.com>
 '''
 from app.lib.constants import Constants
+from app.lib.effects import EFFECTS
+from app.lib.project_file import ProjectFile
+from app.lib.throttle import StateThrottle
 from app.models.brush import Brush
 from app.models.canvas import Canvas
-from app.views.components.dialogs import AboutDialog, QuitDialog
+from app.models.memory_budget import MemoryBudget
+from app.views.components.dialogs import (AboutDialog, CloseDialog,
+                                          EffectDialog, QuitDialog)
 from app.views.layouts import MainLayout
 from .brush_settings_controller import BrushSettingsController
 from .canvas_controller import CanvasController
 from PyQt5.QtCore import QSize, pyqtSignal
 from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import QAction, QFileDialog, QWidget
+from PyQt5.QtWidgets import QAction, QFileDialog, QTabWidget, QWidget
+import os
 
 
 class MainController(QWidget):
     update = pyqtSignal(object)
     '''
         Painter Main Controller
+
+        Each open document is a tab with its own canvas and history. They
+        all draw with the one brush, so share its cached pen, run their
+        work on the global thread pool and count against the same memory
+        budgets for undo and tiles
     '''
+    OPACITY_STEP = 0.1
+
     def __init__(self):
         super().__init__()
         self.setMinimumSize(600, 600)
         self.brush = Brush()
-        self.canvas = Canvas(QSize(600, 400))
+        self.historyBudget = MemoryBudget(Constants.HISTORY_BUDGET)
+        self.tileBudget = MemoryBudget(Constants.TILE_MEMORY_CAP)
+        self.documents = QTabWidget(self)
+        self.documents.setDocumentMode(True)
+        self.documents.setTabsClosable(True)
+        self.documents.tabCloseRequested.connect(self.closeDocument)
+        self.documents.currentChanged.connect(self.documentChanged)
+        self.untitled = 0
+        self.hudVisible = False
         self.controllers = {}
+        # Controllers can report state for every input event, the status
+        # only needs to show the latest a few times a second
+        self.stateThrottle = StateThrottle(Constants.STATE_UPDATE_RATE, self)
+        self.stateThrottle.publish.connect(self.update.emit)
         self.initControllers()
 
     def initControllers(self):
         '''
             Initializes the controllers that the MainController relies on
         '''
-        self.addController('canvas',
-                           CanvasController(self.canvas, self.brush, self),
-                           self.canvasUpdate)
+        self.addDocument()
         self.addController('brush_settings',
                            BrushSettingsController(self.brush, self),
                            self.brushSettingsUpdate)
 
         self.setLayout(
-            MainLayout(self.getController('canvas'),
-                       self.getController('brush_settings')))
+            MainLayout(self.documents, self.getController('brush_settings')))
+
+    def addDocument(self, name=None):
+        '''
+            Open a new, blank, document in a tab and switch to it
+
+            Args:
+                name (str): The name of the tab
+
+            Returns:
+                (CanvasController)
+        '''
+        canvas = Canvas(QSize(*Constants.CANVAS_SIZE), self.historyBudget,
+                        self.tileBudget)
+        controller = CanvasController(canvas, self.brush, self)
+        controller.update.connect(self.canvasUpdate)
+        controller.setHudVisible(self.hudVisible)
+        if name is None:
+            self.untitled += 1
+            name = "Untitled %d" % (self.untitled)
+        self.documents.setCurrentIndex(
+            self.documents.addTab(controller, name))
+        return controller
+
+    def closeDocument(self, index: int):
+        '''
+            Close the document in a tab, asking to save it first if it has
+            unsaved changes
+
+            Args:
+                index (int): The index of the tab
+        '''
+        controller = self.documents.widget(index)
+        if not self.isUnsaved(controller.canvas):
+            self.removeDocument(controller)
+            return
+        CloseDialog(self.documents.tabText(index),
+                    lambda: self.saveThenRemove(controller),
+                    lambda: self.removeDocument(controller), self).exec_()
+
+    def saveThenRemove(self, controller):
+        '''
+            Save a document, and remove it once the save has finished. It is
+            kept open if the save fails, or if it is drawn on while saving
+
+            Args:
+                controller (CanvasController): The document's controller
+        '''
+        canvas = controller.canvas
+        revision = canvas.revision
+        worker = self.save(canvas)
+        if worker is None:
+            return
+
+        def finished(path):
+            if self.documents.indexOf(controller) == -1:
+                return
+            if canvas.revision != revision:
+                self.report("%s changed while saving, it was kept open" %
+                            (os.path.basename(path)), True)
+                return
+            self.removeDocument(controller)
+
+        worker.signals.finished.connect(finished)
+
+    def removeDocument(self, controller):
+        '''
+            Remove a document's tab and release its canvas, there is always
+            at least one document open
+
+            Args:
+                controller (CanvasController): The document's controller
+        '''
+        self.documents.removeTab(self.documents.indexOf(controller))
+        controller.canvas.close()
+        controller.deleteLater()
+        if not self.documents.count():
+            self.addDocument()
+
+    def documentChanged(self, index: int):
+        '''
+            When the tab changes only the visible document keeps the scaled
+            copies it renders from
+
+            Args:
+                index (int): The index of the visible tab
+        '''
+        for other in range(self.documents.count()):
+            if other != index:
+                self.documents.widget(other).releaseViewCache()
+
+    def getCanvasController(self):
+        '''
+            Get the controller of the visible document
+
+            Returns:
+                (CanvasController)
+        '''
+        return self.documents.currentWidget()
+
+    def getCanvas(self):
+        '''
+            Get the canvas of the visible document, actions work on this
+
+            Returns:
+                (Canvas)
+        '''
+        return self.getCanvasController().canvas
+
+    def isEdited(self):
+        '''
+            Check to see if any document has unsaved edits
+
+            Returns:
+                (bool)
+        '''
+        return bool(self.getUnsaved())
+
+    @staticmethod
+    def isUnsaved(canvas):
+        '''
+            Check to see if a canvas has edits that haven't been saved
+
+            Args:
+                canvas (Canvas): The canvas
+
+            Returns:
+                (bool)
+        '''
+        return canvas.isEdited() and not canvas.isSaved()
+
+    def getUnsaved(self):
+        '''
+            The documents with edits that haven't been saved
+
+            Returns:
+                (list): Their controllers, in tab order
+        '''
+        return [
+            self.documents.widget(index)
+            for index in range(self.documents.count())
+            if self.isUnsaved(self.documents.widget(index).canvas)
+        ]
+
+    def saveAll(self, then):
+        '''
+            Save every document with unsaved edits, asking where for each,
+            and call back once all of the saves have finished. Nothing is
+            called back if a save is cancelled or fails
+
+            Args:
+                then (func): Called once every save has finished
+
+            Returns:
+                (bool): Whether every save was started
+        '''
+        workers = []
+        for controller in self.getUnsaved():
+            # Show each document as it's asked about
+            self.documents.setCurrentWidget(controller)
+            worker = self.save(controller.canvas)
+            if worker is None:
+                self.report("Not every document was saved", True)
+                return False
+            workers.append(worker)
+        pending = set(workers)
+        failures = []
+
+        def finished(worker):
+            pending.discard(worker)
+            if not pending and not failures:
+                then()
+
+        for worker in workers:
+            worker.signals.finished.connect(
+                lambda _, worker=worker: finished(worker))
+            # The save reports its own failure
+            worker.signals.failed.connect(failures.append)
+        if not workers:
+            then()
+        return True
 
     def getAboutAction(self, parent):
         '''
@@ -69,7 +271,37 @@ class MainController(QWidget):
                 (QAction)
         '''
         return self.createAction(QIcon(Constants.Icons.NEW.value), "&New",
-                                 self.canvas.clear, "Ctrl+N", parent)
+                                 lambda: self.getCanvas().clear(), "Ctrl+N",
+                                 parent)
+
+    def getNewTabAction(self, parent):
+        '''
+            New tab, opens a blank document alongside the others
+
+            Args:
+                parent (class): Owner of the action
+
+            Returns:
+                (QAction)
+        '''
+        return self.createAction(QIcon(Constants.Icons.NEW.value),
+                                 "New &Tab", lambda: self.addDocument(),
+                                 "Ctrl+T", parent)
+
+    def getCloseTabAction(self, parent):
+        '''
+            Close tab, closes the visible document
+
+            Args:
+                parent (class): Owner of the action
+
+            Returns:
+                (QAction)
+        '''
+        return self.createAction(
+            QIcon(), "&Close Tab",
+            lambda: self.closeDocument(self.documents.currentIndex()),
+            "Ctrl+W", parent)
 
     def getOpenAction(self, parent):
         '''
@@ -85,14 +317,36 @@ class MainController(QWidget):
         def openImage():
             '''
                 Callback for the open action, this triggers the file dialog
-                captues the output, and updates thte canvas with this
+                captues the output, and loads this onto the canvas in the
+                background
             '''
             filePath, _ = QFileDialog.getOpenFileName(
                 self, "Open Image", "", Constants.ALLOWED_FILE_TYPES)
             if not filePath:
                 return
-            self.canvas.clear()
-            self.canvas.setImage(filePath)
+            # An edited document is kept, the image opens in a new one
+            name = os.path.basename(filePath)
+            if self.getCanvas().isEdited():
+                self.addDocument(name)
+            else:
+                self.documents.setTabText(self.documents.currentIndex(), name)
+            canvas = self.getCanvas()
+            canvas.clear()
+            if ProjectFile.isProject(filePath):
+                # Only the index is read, the tiles load as they are shown
+                try:
+                    canvas.openProject(filePath)
+                except (OSError, ValueError) as error:
+                    self.report("Open failed: %s" % (error), True)
+                else:
+                    self.report("Opened %s" % (filePath))
+                return
+            worker = canvas.open(filePath)
+            self.report("Opening %s..." % (filePath))
+            worker.signals.finished.connect(
+                lambda _: self.report("Opened %s" % (filePath)))
+            worker.signals.failed.connect(
+                lambda error: self.report("Open failed: %s" % (error), True))
 
         return self.createAction(QIcon(Constants.Icons.OPEN.value), "&Open",
                                  openImage, "Ctrl+O", parent)
@@ -101,8 +355,8 @@ class MainController(QWidget):
 
         return self.createAction(
             QIcon(Constants.Icons.EXIT.value), "&Quit",
-            lambda: QuitDialog(self.save
-                               if self.canvas.isEdited() else None).exec_(),
+            lambda: QuitDialog(self.saveAll
+                               if self.isEdited() else None).exec_(),
             "Ctrl+Q", parent)
 
     def getSaveAction(self, parent):
@@ -121,7 +375,141 @@ class MainController(QWidget):
 
     def getUndoAction(self, parent):
         return self.createAction(QIcon(Constants.Icons.UNDO.value), "&Undo",
-                                 self.canvas.undo, "Ctrl+Z", parent)
+                                 lambda: self.getCanvas().undo(), "Ctrl+Z",
+                                 parent)
+
+    def getRedoAction(self, parent):
+        return self.createAction(QIcon(Constants.Icons.REDO.value), "&Redo",
+                                 lambda: self.getCanvas().redo(),
+                                 "Ctrl+Shift+Z", parent)
+
+    def getHudAction(self, parent):
+        '''
+            HUD, shows or hides the frame statistics over every document
+
+            Args:
+                parent (class): Owner of the action
+
+            Returns:
+                (QAction)
+        '''
+        action = self.createAction(QIcon(), "Frame &HUD", self.setHudVisible,
+                                   "F3", parent)
+        action.setCheckable(True)
+        action.setChecked(self.hudVisible)
+        return action
+
+    def setHudVisible(self, visible: bool):
+        '''
+            Show or hide the HUD of frame statistics on every document
+
+            Args:
+                visible (bool): If it's shown
+        '''
+        self.hudVisible = visible
+        for index in range(self.documents.count()):
+            self.documents.widget(index).setHudVisible(visible)
+
+    def getEffectActions(self):
+        '''
+            An action for each of the effects, for the effects menu
+
+            Returns:
+                (list): Callables that take the owner of the action
+        '''
+        return [
+            lambda parent, effect=effect: self.getEffectAction(effect, parent)
+            for effect in EFFECTS
+        ]
+
+    def getEffectAction(self, effect, parent):
+        '''
+            Effect action, previews the effect in a dialog that applies it
+
+            Args:
+                effect (type):  The class of the effect
+                parent (class): Owner of the action
+
+            Returns:
+                (QAction)
+        '''
+        def openDialog():
+            instance = effect()
+            canvas = self.getCanvas()
+            EffectDialog(effect.name,
+                         lambda: canvas.previewEffect(instance),
+                         lambda: self.applyEffect(instance, canvas),
+                         canvas.clearOverlay, self).exec_()
+
+        return self.createAction(QIcon(), "%s..." % (effect.name), openDialog,
+                                 None, parent)
+
+    def getLayerActions(self):
+        '''
+            The actions for the layers menu, they work on the active layer of
+            the visible document
+
+            Returns:
+                (list): Callables that take the owner of the action, None for
+                        a separator
+        '''
+        def createLayerAction(name, callback, shortcut=None):
+            return lambda parent: self.createAction(
+                QIcon(), name, lambda: self.layerChanged(callback(
+                    self.getCanvas())), shortcut, parent)
+
+        def getActive(canvas):
+            return canvas.getActiveLayer()
+
+        return [
+            createLayerAction("New &Layer",
+                              lambda canvas: canvas.addLayer(),
+                              "Ctrl+Shift+N"),
+            createLayerAction("&Delete Layer",
+                              lambda canvas: canvas.removeLayer()), None,
+            createLayerAction(
+                "Select Layer &Above",
+                lambda canvas: canvas.setActiveLayer(getActive(canvas) + 1),
+                "Ctrl+]"),
+            createLayerAction(
+                "Select Layer &Below",
+                lambda canvas: canvas.setActiveLayer(getActive(canvas) - 1),
+                "Ctrl+["),
+            createLayerAction(
+                "&Show/Hide Layer", lambda canvas: canvas.setLayerVisible(
+                    getActive(canvas), not canvas.getLayers()[getActive(
+                        canvas)].visible), "Ctrl+H"), None,
+            createLayerAction(
+                "&More Opaque", lambda canvas: canvas.setLayerOpacity(
+                    getActive(canvas), canvas.getLayers()[getActive(canvas)].
+                    opacity + self.OPACITY_STEP)),
+            createLayerAction(
+                "&Less Opaque", lambda canvas: canvas.setLayerOpacity(
+                    getActive(canvas), canvas.getLayers()[getActive(canvas)].
+                    opacity - self.OPACITY_STEP)), None
+        ] + [
+            createLayerAction(
+                "Blend: %s" % (mode.name.title()),
+                lambda canvas, mode=mode: canvas.setLayerBlendMode(
+                    getActive(canvas), mode))
+            for mode in Constants.BlendModes
+        ]
+
+    def layerChanged(self, result=None):
+        '''
+            Report the active layer of the visible document after a layer
+            action
+
+            Args:
+                result (object): What the action returned, unused
+        '''
+        canvas = self.getCanvas()
+        layers = canvas.getLayers()
+        layer = layers[canvas.getActiveLayer()]
+        self.report("%s (%d of %d), %d%% %s%s" % (
+            layer.name, canvas.getActiveLayer() + 1, len(layers),
+            round(layer.opacity * 100), layer.blendMode.name.title(),
+            "" if layer.visible else ", hidden"))
 
     def canvasUpdate(self, state):
         '''
@@ -129,14 +517,29 @@ class MainController(QWidget):
             Args:
                 state (CanvasState): The current state of the canvas
         '''
-        self.update.emit(state)
+        self.stateThrottle.push(state)
 
     def brushSettingsUpdate(self, state):
         '''
             Args:
                 state (BrushState): The current state of the brush
         '''
-        self.update.emit(state)
+        self.stateThrottle.push(state)
+
+    def report(self, message: str, sticky: bool = False):
+        '''
+            Show a message in the status bar, through the same throttle as
+            the states so messages can't outpace it either. A sticky message,
+            e.g. an error, is shown straight away and kept for a while
+
+            Args:
+                message (str):  The message
+                sticky  (bool): Whether the message can't be dropped
+        '''
+        if sticky:
+            self.stateThrottle.hold(message, Constants.MESSAGE_HOLD_MS)
+            return
+        self.stateThrottle.push(message)
 
     def addController(self, name, controller, updateCallback):
         '''
@@ -185,14 +588,54 @@ class MainController(QWidget):
         action.triggered.connect(callback)
         return action
 
-    def save(self):
+    def applyEffect(self, effect, canvas=None):
+        '''
+            Callback for the effect dialog, applies the effect to the canvas
+            in the background reporting its progress
+
+            Args:
+                effect (Effect): The effect
+                canvas (Canvas): The canvas, the visible document's if None
+
+            Returns:
+                (EffectJob)
+        '''
+        job = (canvas or self.getCanvas()).applyEffect(effect)
+        job.signals.progress.connect(lambda progress: self.report(
+            "Applying %s... %d%%" % (effect.name, progress)))
+        job.signals.finished.connect(
+            lambda _: self.report("Applied %s" % (effect.name)))
+        job.signals.failed.connect(lambda error: self.report(
+            "%s failed: %s" % (effect.name, error), True))
+        return job
+
+    def save(self, canvas=None):
         '''
             Callback for the save action, this triggers the file dialog
             captues the current canvas image, writing this to the file path
+            in the background
+
+            Args:
+                canvas (Canvas): The canvas, the visible document's if None
+
+            Returns:
+                (QRunnable): The worker saving it, None if no file was
+                             chosen
         '''
         filePath, _ = QFileDialog.getSaveFileName(self, "Save Image", "",
                                                   Constants.ALLOWED_FILE_TYPES)
         if filePath:
-            self.canvas.save(filePath)
-            return True
-        return False
+            canvas = canvas or self.getCanvas()
+            for index in range(self.documents.count()):
+                if self.documents.widget(index).canvas is canvas:
+                    self.documents.setTabText(index,
+                                              os.path.basename(filePath))
+            worker = canvas.save(filePath)
+            worker.signals.progress.connect(lambda progress: self.report(
+                "Saving %s... %d%%" % (filePath, progress)))
+            worker.signals.finished.connect(
+                lambda path: self.report("Saved %s" % (path)))
+            worker.signals.failed.connect(
+                lambda error: self.report("Save failed: %s" % (error), True))
+            return worker
+        return None
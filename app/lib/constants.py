@@ -5,6 +5,7 @@
     Author:
         Matthew Barber <mfmbarber@gmail.com>
 '''
+from PyQt5.QtGui import QPainter
 from PyQt5.QtWidgets import QDialogButtonBox, QSizePolicy
 from enum import Enum, auto
 
@@ -14,11 +15,30 @@ class Locations(Enum):
 
 class Constants:
 
-    ALLOWED_FILE_TYPES = "PNG(*.png);;JPG(*.jpg *.jpeg);;All Files (*.*)"
+    ALLOWED_FILE_TYPES = ("PNG(*.png);;JPG(*.jpg *.jpeg);;"
+                          "PyPainter Project(*.painter);;All Files (*.*)")
 
     AUTO_WIDTH_AUTO_HEIGHT = (QSizePolicy.Expanding, QSizePolicy.Expanding)
     AUTO_WIDTH_FIXED_HEIGHT = (QSizePolicy.Expanding, QSizePolicy.Fixed)
 
+    CANVAS_SIZE = (1920, 1080)
+
+    EFFECT_PREVIEW_SIZE = 512
+
+    FILL_TOLERANCE = 32
+
+    HISTORY_BUDGET = 64 * 1024 * 1024
+
+    INPUT_LATENCY_MS = 16
+
+    MESSAGE_HOLD_MS = 3000
+
+    STATE_UPDATE_RATE = 10
+
+    TILE_MEMORY_CAP = 512 * 1024 * 1024
+
+    VIEW_CACHE_LEVELS = 2
+
     IMAGES_LOCATION = Locations.IMAGES.value
 
     class DialogButtonRoles(Enum):
@@ -34,12 +54,26 @@ class Constants:
         NO = QDialogButtonBox.NoRole
         NONE = QDialogButtonBox.NoButton
 
+    class BlendModes(Enum):
+        '''
+            An ENUM to wrap around the composition modes layers blend with
+        '''
+        NORMAL = QPainter.CompositionMode_SourceOver
+        MULTIPLY = QPainter.CompositionMode_Multiply
+        SCREEN = QPainter.CompositionMode_Screen
+        OVERLAY = QPainter.CompositionMode_Overlay
+        DARKEN = QPainter.CompositionMode_Darken
+        LIGHTEN = QPainter.CompositionMode_Lighten
+        DIFFERENCE = QPainter.CompositionMode_Difference
+        ADD = QPainter.CompositionMode_Plus
+
     class BrushTypes(Enum):
         '''
             An ENUM to wrap around the brush types
         '''
         BRUSH = auto()
         LINE = auto()
+        FILL = auto()
 
     class Icons(Enum):
         BRUSH = Locations.ICONS.value + "brush.png"
@@ -49,6 +83,7 @@ class Constants:
         NEW = Locations.ICONS.value + "new.png"
         OPEN = Locations.ICONS.value + "open.png"
         PALETTE = Locations.ICONS.value + "palette.png"
+        REDO = Locations.ICONS.value + "redo.png"
         ROUND = Locations.ICONS.value + "circle.png"
         SAVE = Locations.ICONS.value + "save.png"
         SQUARE = Locations.ICONS.value + "square.png"
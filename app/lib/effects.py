@@ -0,0 +1,258 @@
+'''
+    Effects
+    Filters that work on NumPy pixel arrays, a strip of rows at a time
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+from app.lib.pixels import Pixels
+from scipy import ndimage
+import numpy
+
+
+class Effect:
+    '''
+        Base class for effects. An effect is applied to strips of the image
+        independently, so an effect that reads neighbouring pixels declares
+        how many rows either side of a strip it needs in getHalo
+    '''
+    name = ''
+
+    def prepare(self, array):
+        '''
+            Look at the whole image before it is split in to strips, for
+            effects that depend on it as a whole
+
+            Args:
+                array (numpy.ndarray): (height, width, 4) uint8, see Pixels
+        '''
+
+    def getHalo(self):
+        '''
+            The rows either side of a strip the effect reads
+
+            Returns:
+                (int)
+        '''
+        return 0
+
+    def scaled(self, factor: float):
+        '''
+            The effect for a copy of the image scaled by a factor, e.g. for a
+            preview
+
+            Args:
+                factor (float): The scale of the copy
+
+            Returns:
+                (Effect)
+        '''
+        return self
+
+    def getParameters(self):
+        '''
+            The arguments the effect was made with, enough to make it again
+
+            Returns:
+                (dict)
+        '''
+        return {}
+
+    def apply(self, array):
+        '''
+            Apply the effect
+
+            Args:
+                array (numpy.ndarray): (height, width, 4) uint8, see Pixels
+
+            Returns:
+                (numpy.ndarray): A new array the same shape
+        '''
+        raise NotImplementedError
+
+
+class ColourEffect(Effect):
+    '''
+        Base class for effects on the colour of each pixel alone, the alpha
+        is kept. Layers are premultiplied, so transparent pixels are made
+        straight for the effect and premultiplied again after it
+    '''
+    def apply(self, array):
+        opaque = Pixels.isOpaque(array)
+        result = self.applyColours(
+            array if opaque else Pixels.unpremultiply(array))
+        result[..., Pixels.ALPHA] = array[..., Pixels.ALPHA]
+        return result if opaque else Pixels.premultiply(result)
+
+    def applyColours(self, array):
+        '''
+            Apply the effect to straight colours
+
+            Args:
+                array (numpy.ndarray): (height, width, 4) uint8, see Pixels
+
+            Returns:
+                (numpy.ndarray): A new array the same shape, its alpha is
+                                 replaced with the array's
+        '''
+        raise NotImplementedError
+
+
+class Invert(ColourEffect):
+    '''
+        Inverts the colours
+    '''
+    name = 'Invert'
+
+    def applyColours(self, array):
+        return numpy.invert(array)
+
+
+class Greyscale(ColourEffect):
+    '''
+        Replaces the colours with their luma
+    '''
+    name = 'Greyscale'
+
+    def applyColours(self, array):
+        # Rec. 601 weights in 256ths, to stay in integers
+        channels = array.astype(numpy.uint16)
+        luma = (channels[..., Pixels.RED] * 77 +
+                channels[..., Pixels.GREEN] * 150 +
+                channels[..., Pixels.BLUE] * 29) >> 8
+        return numpy.repeat(luma.astype(numpy.uint8)[..., None], 4, axis=2)
+
+
+class Levels(ColourEffect):
+    '''
+        Maps an input range of levels on to the full range, with a gamma
+        curve. Without a range, the darkest and lightest percent of the
+        image are clipped
+
+        Args:
+            black (int):   The level mapped to black
+            white (int):   The level mapped to white
+            gamma (float): The gamma of the curve between them
+    '''
+    name = 'Levels'
+    CLIP_PERCENT = 1
+    SAMPLE_STEP = 4
+
+    def __init__(self, black=None, white=None, gamma: float = 1.0):
+        self.black = black
+        self.white = white
+        self.gamma = gamma
+        self.table = None
+
+    def getParameters(self):
+        return {'black': self.black, 'white': self.white, 'gamma': self.gamma}
+
+    def prepare(self, array):
+        black, white = self.black, self.white
+        if black is None or white is None:
+            # A sample of the pixels is plenty to place the percentiles,
+            # transparent pixels have no colour to count
+            sample = array[::self.SAMPLE_STEP, ::self.SAMPLE_STEP]
+            if not Pixels.isOpaque(sample):
+                sample = Pixels.unpremultiply(sample)
+                sample = sample[sample[..., Pixels.ALPHA] > 0]
+            colours = sample[..., [Pixels.RED, Pixels.GREEN, Pixels.BLUE]]
+            if not colours.size:
+                colours = numpy.array([0, 255])
+            low, high = numpy.percentile(
+                colours, (self.CLIP_PERCENT, 100 - self.CLIP_PERCENT))
+            black = low if black is None else black
+            white = high if white is None else white
+        white = max(white, black + 1)
+        levels = numpy.clip(
+            (numpy.arange(256) - black) / (white - black), 0, 1)
+        self.table = numpy.round(levels**(1 / self.gamma) * 255).astype(
+            numpy.uint8)
+
+    def apply(self, array):
+        if self.table is None:
+            self.prepare(array)
+        return super().apply(array)
+
+    def applyColours(self, array):
+        return self.table[array]
+
+
+class Blur(Effect):
+    '''
+        A gaussian blur. It blurs premultiplied colours and alpha together,
+        so the edges of strokes on a transparent layer soften without dark
+        fringes
+
+        Args:
+            radius (float): The standard deviation of the blur in pixels
+    '''
+    name = 'Blur'
+    TRUNCATE = 3.0
+
+    def __init__(self, radius: float = 4.0):
+        self.radius = radius
+
+    def getHalo(self):
+        return int(self.TRUNCATE * self.radius + 0.5)
+
+    def scaled(self, factor: float):
+        return type(self)(self.radius * factor)
+
+    def getParameters(self):
+        return {'radius': self.radius}
+
+    def apply(self, array):
+        result = ndimage.gaussian_filter(array, (self.radius, self.radius, 0),
+                                         mode='nearest',
+                                         truncate=self.TRUNCATE)
+        return self.keepPremultiplied(array, result)
+
+    @staticmethod
+    def keepPremultiplied(array, result):
+        '''
+            Keep an opaque array opaque, and the colours of a premultiplied
+            result within its alpha
+
+            Args:
+                array  (numpy.ndarray): The array the effect was applied to
+                result (numpy.ndarray): The result, changed in place
+
+            Returns:
+                (numpy.ndarray): The result
+        '''
+        if Pixels.isOpaque(array):
+            result[..., Pixels.ALPHA] = 255
+        else:
+            numpy.minimum(result, result[..., Pixels.ALPHA, None], out=result)
+        return result
+
+
+class Sharpen(Blur):
+    '''
+        An unsharp mask, the difference from a blurred copy is added back
+
+        Args:
+            radius (float): The standard deviation of the blur in pixels
+            amount (float): How much of the difference to add
+    '''
+    name = 'Sharpen'
+
+    def __init__(self, radius: float = 2.0, amount: float = 1.0):
+        super().__init__(radius)
+        self.amount = amount
+
+    def scaled(self, factor: float):
+        return type(self)(self.radius * factor, self.amount)
+
+    def getParameters(self):
+        return {'radius': self.radius, 'amount': self.amount}
+
+    def apply(self, array):
+        blurred = super().apply(array).astype(numpy.int16)
+        result = array + (array - blurred) * self.amount
+        result = numpy.clip(result, 0, 255).astype(numpy.uint8)
+        return self.keepPremultiplied(array, result)
+
+
+EFFECTS = (Blur, Sharpen, Invert, Levels, Greyscale)
@@ -0,0 +1,305 @@
+'''
+    Instruments
+    Opt in timing of the drawing hot path, with a histogram of the calls to
+    each method, and a cProfile or tracemalloc capture alongside. Nothing is
+    wrapped until the instruments are installed, so they cost nothing when
+    they are off
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import bisect
+import cProfile
+import functools
+import importlib
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+
+# The methods timed, as (module, class, method). Brush strokes are drawn
+# by flushStroke, once a frame, and lines and single points by __drawing__
+TARGETS = (
+    ('app.models.canvas', 'Canvas', '__drawing__'),
+    ('app.models.canvas', 'Canvas', 'flushStroke'),
+    ('app.models.canvas', 'Canvas', 'snapshotImage'),
+    ('app.models.canvas', 'Canvas', 'setImage'),
+    ('app.controllers.canvas_controller', 'CanvasController', 'paintEvent'),
+    ('app.views.components.brush_settings', 'BrushPreview', 'drawPreview'),
+)
+MODES = ('timing', 'profile', 'memory')
+ENVIRONMENT = 'PAINTER_INSTRUMENTS'
+OUTPUT_ENVIRONMENT = 'PAINTER_INSTRUMENTS_OUTPUT'
+OUTPUT = 'painter-instruments.json'
+# The top entries kept from a profile or a memory snapshot
+TOP = 25
+MEMORY_FRAMES = 8
+
+
+class Instruments:
+    '''
+        Times the methods in TARGETS once installed, and writes what it
+        found to a JSON file when finished
+
+        Args:
+            mode   (str): timing, profile to also run cProfile or memory to
+                          also trace allocations with tracemalloc
+            output (str): The JSON file, a profile is written next to it
+    '''
+    class Histogram:
+        '''
+            The count, total and spread of the durations of a method, in
+            buckets from 0.05ms up to 100ms and one for everything slower
+        '''
+        BOUNDS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 100)
+
+        def __init__(self):
+            self.buckets = [0] * (len(self.BOUNDS) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+        def record(self, duration: float):
+            '''
+                Record a call
+
+                Args:
+                    duration (float): How long it took, in ms
+            '''
+            self.buckets[bisect.bisect_left(self.BOUNDS, duration)] += 1
+            self.count += 1
+            self.total += duration
+            self.max = max(self.max, duration)
+
+        def getMean(self):
+            '''
+                Returns:
+                    (float): The mean duration in ms
+            '''
+            return self.total / self.count if self.count else 0.0
+
+        def getPercentile(self, percent: float):
+            '''
+                The bucket a percentile of the calls fall in
+
+                Args:
+                    percent (float): The percentile, 0 to 100
+
+                Returns:
+                    (float): The upper bound of the bucket in ms, the slowest
+                             call if it is past the last
+            '''
+            rank = percent / 100 * self.count
+            seen = 0
+            for bound, count in zip(self.BOUNDS, self.buckets):
+                seen += count
+                if seen >= rank and seen:
+                    return min(bound, self.max)
+            return self.max
+
+        def toDict(self):
+            '''
+                Returns:
+                    (dict)
+            '''
+            labels = [f"<={bound}" for bound in self.BOUNDS]
+            labels.append(f">{self.BOUNDS[-1]}")
+            return {
+                'count': self.count,
+                'totalMs': round(self.total, 3),
+                'meanMs': round(self.getMean(), 4),
+                'p50Ms': round(self.getPercentile(50), 3),
+                'p99Ms': round(self.getPercentile(99), 3),
+                'maxMs': round(self.max, 3),
+                'histogram': dict(zip(labels, self.buckets))
+            }
+
+    def __init__(self, mode: str = 'timing', output: str = OUTPUT):
+        if mode not in MODES:
+            raise ValueError(f"Unknown instruments mode: {mode}")
+        self.mode = mode
+        self.output = output
+        self.histograms = {}
+        self.originals = []
+        self.profile = None
+        self.started = None
+
+    @staticmethod
+    def fromEnvironment(mode=None, output=None):
+        '''
+            The instruments asked for on the command line or in the
+            environment, PAINTER_INSTRUMENTS=1 (or a mode) turns them on and
+            PAINTER_INSTRUMENTS_OUTPUT changes the file written
+
+            Args:
+                mode   (str): The mode from the command line, if any
+                output (str): The file from the command line, if any
+
+            Returns:
+                (Instruments): None if they are off
+        '''
+        mode = mode or os.environ.get(ENVIRONMENT, '')
+        if mode in ('', '0'):
+            return None
+        return Instruments(
+            'timing' if mode == '1' else mode,
+            output or os.environ.get(OUTPUT_ENVIRONMENT, OUTPUT))
+
+    def isInstalled(self):
+        '''
+            Returns:
+                (bool): If the methods are being timed
+        '''
+        return bool(self.originals)
+
+    def install(self):
+        '''
+            Wrap the methods in TARGETS and start capturing, install before
+            the windows are made so any connections are to the wrappers
+        '''
+        if self.isInstalled():
+            return
+        for module, owner, method in TARGETS:
+            owner = getattr(importlib.import_module(module), owner)
+            original = owner.__dict__[method]
+            self.originals.append((owner, method, original))
+            setattr(owner, method,
+                    self.wrap(f"{owner.__name__}.{method}", original))
+        self.started = time.perf_counter()
+        if self.mode == 'profile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        if self.mode == 'memory':
+            tracemalloc.start(MEMORY_FRAMES)
+
+    def uninstall(self):
+        '''
+            Put the methods back and stop capturing
+        '''
+        for owner, method, original in reversed(self.originals):
+            setattr(owner, method, original)
+        self.originals = []
+        if self.profile:
+            self.profile.disable()
+        if self.mode == 'memory' and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def wrap(self, name: str, function):
+        '''
+            Time a function in to the histogram for a name
+
+            Args:
+                name     (str):  The name of the histogram
+                function (func): The function
+
+            Returns:
+                (func)
+        '''
+        histogram = self.histograms.setdefault(name, Instruments.Histogram())
+        clock = time.perf_counter
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.record((clock() - start) * 1000)
+
+        return timed
+
+    def getHistograms(self):
+        '''
+            Returns:
+                (dict): The histogram of each method by name
+        '''
+        return self.histograms
+
+    def getMemory(self):
+        '''
+            The memory traced so far, only in memory mode
+
+            Returns:
+                (tuple): The current and peak size traced in bytes, or None
+        '''
+        if self.mode != 'memory' or not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.get_traced_memory()
+
+    def getProfile(self):
+        '''
+            The functions taking the most time, only in profile mode
+
+            Returns:
+                (list): A line for each of the TOP functions by cumulative
+                        time
+        '''
+        if not self.profile:
+            return []
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(TOP)
+        return [line for line in stream.getvalue().splitlines() if line]
+
+    def getAllocations(self):
+        '''
+            Where the memory still allocated was allocated, only in memory
+            mode
+
+            Returns:
+                (list): The TOP lines by size, as dicts
+        '''
+        if self.mode != 'memory' or not tracemalloc.is_tracing():
+            return []
+        statistics = tracemalloc.take_snapshot().statistics('traceback')
+        return [{
+            'sizeKiB': round(statistic.size / 1024, 1),
+            'count': statistic.count,
+            'traceback': statistic.traceback.format()
+        } for statistic in statistics[:TOP]]
+
+    def toDict(self):
+        '''
+            Returns:
+                (dict): Everything captured
+        '''
+        result = {
+            'mode': self.mode,
+            'seconds': round(time.perf_counter() - self.started, 3)
+            if self.started else 0.0,
+            'methods': {
+                name: histogram.toDict()
+                for name, histogram in sorted(self.histograms.items())
+            }
+        }
+        if self.mode == 'profile':
+            result['profile'] = self.getProfile()
+        memory = self.getMemory()
+        if memory:
+            result['tracedKiB'] = round(memory[0] / 1024, 1)
+            result['peakTracedKiB'] = round(memory[1] / 1024, 1)
+            result['allocations'] = self.getAllocations()
+        return result
+
+    def dump(self):
+        '''
+            Write everything captured to the output, and the profile next to
+            it in profile mode so it can be opened with pstats or snakeviz
+        '''
+        if self.profile:
+            self.profile.disable()
+            self.profile.dump_stats(os.path.splitext(self.output)[0] +
+                                    '.prof')
+        with open(self.output, 'w') as output:
+            json.dump(self.toDict(), output, indent=2)
+
+    def finish(self):
+        '''
+            Dump what was captured and uninstall, when the app quits
+        '''
+        if not self.isInstalled():
+            return
+        self.dump()
+        self.uninstall()
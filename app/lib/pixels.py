@@ -0,0 +1,141 @@
+'''
+    Pixels
+    NumPy views of image memory, for bulk pixel operations
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import ctypes
+import sys
+
+import numpy
+from PyQt5 import sip
+from PyQt5.QtGui import QImage
+
+
+class Pixels:
+    '''
+        Converts between 32 bit QImages and (height, width, 4) uint8 arrays
+        without copying the pixels. A Format_RGB32 pixel is stored as the
+        integer 0xffRRGGBB, so the order of the channels in memory follows
+        the byte order of the machine, see CHANNELS
+    '''
+    FORMATS = (QImage.Format_RGB32, QImage.Format_ARGB32,
+               QImage.Format_ARGB32_Premultiplied)
+    CHANNELS = 'BGRA' if sys.byteorder == 'little' else 'ARGB'
+    BLUE = CHANNELS.index('B')
+    GREEN = CHANNELS.index('G')
+    RED = CHANNELS.index('R')
+    ALPHA = CHANNELS.index('A')
+
+    @staticmethod
+    def view(image, writable: bool = False):
+        '''
+            A view of an image's pixels, the view keeps the image alive. A
+            writable view detaches the image from any copies sharing its
+            data, so writes only land in this image
+
+            Args:
+                image    (QImage): A 32 bit image
+                writable (bool):   Whether the view can be written to
+
+            Returns:
+                (numpy.ndarray): (height, width, 4) uint8, with the rows
+                                 strided by the image's bytes per line
+
+            Throws:
+                ValueError : The image isn't a 32 bit format
+        '''
+        if image.format() not in Pixels.FORMATS:
+            raise ValueError("Can't view pixels of format %d" %
+                             (image.format()))
+        address = int(image.bits() if writable else image.constBits())
+        data = (ctypes.c_uint8 * image.sizeInBytes()).from_address(address)
+        # The buffer holds the image so the memory outlives the view
+        data.image = image
+        array = numpy.ndarray((image.height(), image.width(), 4),
+                              numpy.uint8,
+                              data,
+                              strides=(image.bytesPerLine(), 4, 1))
+        array.flags.writeable = writable
+        return array
+
+    @staticmethod
+    def toImage(array, format=QImage.Format_RGB32):
+        '''
+            Wrap an array in an image without copying it, the image holds
+            the array so its memory outlives the image. Qt's own copies of
+            the image don't, so copy or paste it to keep it past the image
+            returned. Arrays that are flipped or skip pixels are copied
+
+            Args:
+                array  (numpy.ndarray): (height, width, 4) uint8, laid out
+                                        as CHANNELS
+                format (QImage.Format): A 32 bit format to read it as
+
+            Returns:
+                (QImage)
+
+            Throws:
+                ValueError : The array isn't (height, width, 4) uint8
+        '''
+        if (array.ndim != 3 or array.shape[2] != 4
+                or array.dtype != numpy.uint8):
+            raise ValueError("Expected a (height, width, 4) uint8 array")
+        if array.strides[1:] != (4, 1) or array.strides[0] <= 0:
+            # The rows can't be described by a stride, so they are copied
+            array = numpy.ascontiguousarray(array)
+        image = QImage(sip.voidptr(array.ctypes.data), array.shape[1],
+                       array.shape[0], array.strides[0], format)
+        # QImage doesn't reference the memory it's given
+        image.array = array
+        return image
+
+    @staticmethod
+    def isOpaque(array):
+        '''
+            Whether every pixel of an array is opaque, premultiplied and
+            straight colours are the same then
+
+            Args:
+                array (numpy.ndarray): (height, width, 4) uint8
+
+            Returns:
+                (bool)
+        '''
+        return bool(array[..., Pixels.ALPHA].min(initial=255) == 255)
+
+    @staticmethod
+    def unpremultiply(array):
+        '''
+            The straight colours of a premultiplied array, transparent pixels
+            are black
+
+            Args:
+                array (numpy.ndarray): (height, width, 4) uint8, premultiplied
+
+            Returns:
+                (numpy.ndarray): A new array the same shape
+        '''
+        alpha = array[..., Pixels.ALPHA, None].astype(numpy.uint32)
+        result = (array * numpy.uint32(255) + alpha // 2) // numpy.maximum(
+            alpha, 1)
+        result = numpy.minimum(result, 255).astype(numpy.uint8)
+        result[..., Pixels.ALPHA] = array[..., Pixels.ALPHA]
+        return result
+
+    @staticmethod
+    def premultiply(array):
+        '''
+            Premultiply the colours of an array by its alpha
+
+            Args:
+                array (numpy.ndarray): (height, width, 4) uint8, straight
+
+            Returns:
+                (numpy.ndarray): A new array the same shape
+        '''
+        alpha = array[..., Pixels.ALPHA, None].astype(numpy.uint32)
+        result = ((array * alpha + 127) // 255).astype(numpy.uint8)
+        result[..., Pixels.ALPHA] = array[..., Pixels.ALPHA]
+        return result
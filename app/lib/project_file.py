@@ -0,0 +1,182 @@
+'''
+    Project File
+    The native document format, an append only file of chunks with an index
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import json
+import os
+import struct
+import zlib
+
+from PyQt5.QtGui import QImage
+
+
+class ProjectFile:
+    '''
+        Reads a project file. A project is a header, then chunks, then an
+        index of the chunks and a footer pointing at the index:
+
+            header   MAGIC, VERSION
+            chunks   a zlib compressed tile each
+            log      the stroke log, see StrokeLog.toBytes
+            index    zlib compressed JSON, the document, its layers and the
+                     keyframes of its stroke log, with the (offset, length)
+                     of the chunk of each tile and of the log
+            footer   FOOTER, the offset and length of the index
+
+        Saving again appends the tiles that have changed and a new index and
+        footer, so the chunks of unchanged tiles are left where they are and
+        the last footer in the file is the current one. Chunks are read on
+        demand, so a project can be opened without decoding any tiles
+
+        Args:
+            path (str): The path of the project
+
+        Throws:
+            OSError : The file can't be read
+    '''
+    EXTENSION = '.painter'
+    MAGIC = b'PAINTER\0'
+    VERSION = 1
+    HEADER = struct.Struct('<8sI')
+    FOOTER = struct.Struct('<QQ8s')
+    FOOTER_MAGIC = b'PNTRINDX'
+    COMPRESSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+
+    @staticmethod
+    def isProject(path: str):
+        '''
+            Check to see if a path is for a project, by its extension
+
+            Args:
+                path (str): The path
+
+            Returns:
+                (bool)
+        '''
+        return os.path.splitext(path)[1].lower() == ProjectFile.EXTENSION
+
+    def readIndex(self):
+        '''
+            Read the index from the footer at the end of the file
+
+            Returns:
+                (dict): The document, see ProjectWorker.writeIndex
+
+            Throws:
+                ValueError : The file isn't a project or is damaged
+        '''
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.HEADER.size + self.FOOTER.size:
+            raise ValueError("%s is not a project" % (self.path))
+        magic, version = self.HEADER.unpack(self.read(0, self.HEADER.size))
+        if magic != self.MAGIC:
+            raise ValueError("%s is not a project" % (self.path))
+        if version > self.VERSION:
+            raise ValueError("%s needs a newer version of PyPainter" %
+                             (self.path))
+        offset, length, magic = self.FOOTER.unpack(
+            self.read(size - self.FOOTER.size, self.FOOTER.size))
+        if magic != self.FOOTER_MAGIC or offset + length > size:
+            raise ValueError("%s is damaged" % (self.path))
+        try:
+            return json.loads(zlib.decompress(self.read(offset, length)))
+        except (zlib.error, ValueError):
+            raise ValueError("%s is damaged" % (self.path))
+
+    def read(self, offset: int, length: int):
+        '''
+            Read bytes from the file, safe to do from any thread
+
+            Args:
+                offset (int): Where to read from
+                length (int): How many bytes to read
+
+            Returns:
+                (bytes)
+        '''
+        return os.pread(self.file.fileno(), length, offset)
+
+    def readTile(self, location, size: int, format):
+        '''
+            Read and decode the chunk of a tile
+
+            Args:
+                location (list):          The (offset, length) of the chunk
+                size     (int):           The width and height of the tile
+                format   (QImage.Format): The format of the tile
+
+            Returns:
+                (QImage)
+        '''
+        return ProjectFile.decodeTile(self.read(*location), size, format)
+
+    @staticmethod
+    def encodeTile(image):
+        '''
+            Compress a tile in to a chunk
+
+            Args:
+                image (QImage): The tile
+
+            Returns:
+                (bytes)
+        '''
+        return zlib.compress(image.constBits().asstring(image.sizeInBytes()),
+                             ProjectFile.COMPRESSION)
+
+    @staticmethod
+    def decodeTile(data: bytes, size: int, format):
+        '''
+            Decompress a chunk in to a tile
+
+            Args:
+                data   (bytes):         The chunk
+                size   (int):           The width and height of the tile
+                format (QImage.Format): The format of the tile
+
+            Returns:
+                (QImage)
+        '''
+        data = zlib.decompress(data)
+        # The image doesn't own the bytes, so it is copied before they go
+        return QImage(data, size, size, len(data) // size, format).copy()
+
+    @staticmethod
+    def getKey(name: str):
+        '''
+            The key of a tile from its name in the index
+
+            Args:
+                name (str): "column,row"
+
+            Returns:
+                (tuple)
+        '''
+        column, row = name.split(',')
+        return (int(column), int(row))
+
+    @staticmethod
+    def getName(key):
+        '''
+            The name of a tile in the index
+
+            Args:
+                key (tuple): The (column, row) of the tile
+
+            Returns:
+                (str)
+        '''
+        return '%d,%d' % key
+
+    def close(self):
+        '''
+            Close the file
+        '''
+        self.file.close()
@@ -0,0 +1,69 @@
+'''
+    Throttle
+    Rate limiting for signals that can fire faster than they are useful
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class StateThrottle(QObject):
+    '''
+        Publishes states at most a number of times a second, the first state
+        is published straight away and any that arrive in the interval after
+        it are dropped, bar the latest which is published at the end of it.
+        A state that mustn't be dropped, e.g. an error, can be held instead
+
+        Args:
+            rate (int): The most states to publish a second
+    '''
+    publish = pyqtSignal(object)
+
+    def __init__(self, rate: int, parent=None):
+        super().__init__(parent)
+        self.latest = None
+        self.pending = False
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.interval = 1000 // rate
+        self.timer.setInterval(self.interval)
+        self.timer.timeout.connect(self.flush)
+
+    def push(self, state):
+        '''
+            Offer a state to be published
+
+            Args:
+                state (State): The state
+        '''
+        if self.timer.isActive():
+            self.latest = state
+            self.pending = True
+            return
+        self.publish.emit(state)
+        self.timer.start()
+
+    def hold(self, state, milliseconds: int):
+        '''
+            Publish a state straight away and keep it for a time, states
+            offered meanwhile are dropped bar the latest, published once the
+            time is up
+
+            Args:
+                state        (State): The state
+                milliseconds (int):   How long to keep it
+        '''
+        self.publish.emit(state)
+        self.timer.start(max(milliseconds, self.interval))
+
+    def flush(self):
+        '''
+            Publish the latest state at the end of an interval, if one arrived
+        '''
+        if not self.pending:
+            return
+        self.pending = False
+        self.publish.emit(self.latest)
+        self.latest = None
+        self.timer.start(self.interval)
@@ -66,6 +66,16 @@ class Brush:
         '''
         return self.size
 
+    def getTolerance(self):
+        '''
+            Returns how far a colour can be from the one filled and still be
+            filled, per channel
+
+            Returns:
+                (int)
+        '''
+        return self.tolerance
+
     def getCapType(self):
         '''
             Returns the current cap on the brush
@@ -119,12 +129,20 @@ class Brush:
             Setter for colour
         '''
         self.colour = colour    # TODO: validation
+        self.pen = None
 
     def setSize(self, size: int):
         '''
             Setter for size
         '''
         self.size = size
+        self.pen = None
+
+    def setTolerance(self, tolerance: int):
+        '''
+            Setter for fill tolerance
+        '''
+        self.tolerance = tolerance
 
     def setLineType(self, type):
         '''
@@ -134,6 +152,7 @@ class Brush:
         if line not in self.lineTypes.values():
             raise ValueError('%s is not a valid line type' % (line))
         self.line = line
+        self.pen = None
 
     def setCapType(self, type):
         '''
@@ -143,6 +162,7 @@ class Brush:
         if cap not in self.capTypes.values():
             raise ValueError('%s is not a valid cap type' % (cap))
         self.cap = cap
+        self.pen = None
 
     def setJoinType(self, type):
         '''
@@ -152,6 +172,7 @@ class Brush:
         if join not in self.joinTypes.values():
             raise ValueError('%s is not a valid join type' % (join))
         self.join = join
+        self.pen = None
 
     def setDefaults(self):
         '''
@@ -163,15 +184,21 @@ class Brush:
         self.cap = Qt.RoundCap
         self.join = Qt.RoundJoin
         self.type = Constants.BrushTypes.BRUSH
+        self.tolerance = Constants.FILL_TOLERANCE
+        self.pen = None
 
     def getPen(self):
         '''
-            Returns a QPen using the current attributes
+            Returns a QPen using the current attributes, the pen is cached
+            until an attribute changes
 
             Returns:
                 (QPen)
         '''
-        return QPen(self.colour, self.size, self.line, self.cap, self.join)
+        if self.pen is None:
+            self.pen = QPen(self.colour, self.size, self.line, self.cap,
+                            self.join)
+        return self.pen
 
     def getPreviewPen(self):
         '''
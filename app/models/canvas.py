@@ -2,20 +2,47 @@
     Canvas Model
     A model for representing the canvas
 '''
+from app.lib.constants import Constants
+from app.lib.pixels import Pixels
+from app.lib.project_file import ProjectFile
+from app.workers.effect_worker import EffectJob
+from app.workers.open_worker import OpenWorker
+from app.workers.project_worker import ProjectWorker
+from app.workers.save_worker import SaveWorker
+from .history import History
+from .layer_stack import LayerStack
+from .memory_budget import MemoryBudget
 from .state import State
-from PyQt5.QtCore import Qt, QPoint
-from PyQt5.QtGui import QImage, QPainter
+from .stroke_log import StrokeLog
+from .tiled_image import TiledImage
+from PyQt5.QtCore import (QObject, Qt, QPoint, QRect, QRectF, QSize,
+                          QThreadPool, pyqtSignal)
+from PyQt5.QtGui import QColor, QImage, QPainter, QPolygon
+from scipy import ndimage
+import itertools
+import numpy
+import os
 
 
-class Canvas:
+class Canvas(QObject):
     '''
-        The canvas
+        The canvas, emits changed with the region of the image that changed
+
+        The canvas is a stack of layers, image is the tiled image of the
+        active layer which is the one drawn on, filled and undone. The
+        layers are shown and saved composited together, see LayerStack
+
+        Alongside the pixels, every change is recorded in a stroke log that
+        can render the document again, see StrokeLog and fromLog
 
         Args:
-            size (QSize): The size of the canvas
+            size       (QSize):        The size of the canvas
+            budget     (MemoryBudget): The budget for the undo history,
+                                       shared between documents
+            tileBudget (MemoryBudget): The budget for resident tiles,
+                                       shared between documents
     '''
-    previous = []
-    isSaved = False
+    changed = pyqtSignal(QRect)
 
     class CanvasState(State):
         '''
@@ -38,10 +65,202 @@ class Canvas:
             else:
                 return "Ready..."
 
-    def __init__(self, size):
+    class Overlay:
+        '''
+            A line drawn over the canvas without touching the image
+
+            Args:
+                fromPoint (QPoint): The start point
+                toPoint   (QPoint): The end point
+                pen       (QPen):   The pen to draw with
+        '''
+        def __init__(self, fromPoint, toPoint, pen):
+            self.fromPoint = fromPoint
+            self.toPoint = toPoint
+            self.pen = pen
+            self.rect = Canvas.getPenRect(fromPoint, toPoint, pen)
+
+        def getRect(self):
+            '''
+                The region of the canvas covered by the overlay
+
+                Returns:
+                    (QRect)
+            '''
+            return self.rect
+
+        def paint(self, painter):
+            '''
+                Draw the overlay with a painter in canvas coordinates
+
+                Args:
+                    painter (QPainter): The painter to draw with
+            '''
+            painter.setPen(self.pen)
+            if self.fromPoint != self.toPoint:
+                painter.drawLine(self.fromPoint, self.toPoint)
+            else:
+                painter.drawPoint(self.toPoint)
+
+    class ImageOverlay:
+        '''
+            An image drawn over the canvas without touching it, e.g. the
+            preview of an image that is being opened
+
+            Args:
+                image (QImage): The image to draw
+                rect  (QRect):  The region of the canvas to draw it in
+        '''
+        def __init__(self, image, rect):
+            self.image = image
+            self.rect = rect
+
+        def getRect(self):
+            '''
+                The region of the canvas covered by the overlay
+
+                Returns:
+                    (QRect)
+            '''
+            return self.rect
+
+        def paint(self, painter):
+            '''
+                Draw the overlay with a painter in canvas coordinates
+
+                Args:
+                    painter (QPainter): The painter to draw with
+            '''
+            painter.drawImage(self.rect, self.image)
+
+    class Stroke:
+        '''
+            A continuous stroke of the brush, holding a single painter for
+            each tile it crosses and a pen for its whole length
+
+            Args:
+                image  (TiledImage): The image to draw on
+                pen    (QPen):       The pen to draw with
+                point  (QPoint):     The point the stroke starts at
+                moment (float):      When the point arrived, see
+                                     StrokeLog.getTime
+        '''
+        def __init__(self, image, pen, point, moment: float):
+            self.image = image
+            self.pen = pen
+            self.painters = {}
+            self.lastPoint = None
+            self.lastTime = None
+            self.points = [point]
+            self.times = [moment]
+
+        def getPoints(self):
+            '''
+                The points waiting to be drawn, joined on to the end of what
+                has been drawn so far
+
+                Returns:
+                    (list)
+            '''
+            if self.lastPoint is None:
+                return self.points
+            return [self.lastPoint] + self.points
+
+        def getTimes(self):
+            '''
+                When each of the points from getPoints arrived
+
+                Returns:
+                    (list)
+            '''
+            if self.lastTime is None:
+                return self.times
+            return [self.lastTime] + self.times
+
+        def getRect(self):
+            '''
+                The region the points waiting to be drawn will cover
+
+                Returns:
+                    (QRect)
+            '''
+            rect = QPolygon(self.getPoints()).boundingRect()
+            return Canvas.getPenRect(rect.topLeft(), rect.bottomRight(),
+                                     self.pen)
+
+        def paint(self):
+            '''
+                Draw the points waiting to be drawn as a single polyline on
+                each of the tiles they cross
+            '''
+            points = self.getPoints()
+            polygon = QPolygon(points)
+            for key in self.image.getKeys(self.getRect()):
+                if key not in self.painters:
+                    self.painters[key] = self.image.getPainter(key)
+                    self.painters[key].setPen(self.pen)
+                if len(points) == 1:
+                    self.painters[key].drawPoint(points[0])
+                else:
+                    self.painters[key].drawPolyline(polygon)
+            self.lastPoint = self.points[-1]
+            self.lastTime = self.times[-1]
+            self.points = []
+            self.times = []
+
+        def end(self):
+            '''
+                Finish with the painters
+            '''
+            for key, painter in self.painters.items():
+                self.image.endPainter(key, painter)
+            self.painters = {}
+
+    def __init__(self, size, budget=None, tileBudget=None):
+        super().__init__()
         self.size = size
         self.state = self.CanvasState()
+        self.tileBudget = tileBudget or MemoryBudget(
+            Constants.TILE_MEMORY_CAP)
+        self.history = History(budget
+                               or MemoryBudget(Constants.HISTORY_BUDGET))
+        self.layers = None
+        self.log = None
+        self.active = 0
+        self.image = None
+        self.arranged = False
+        self.project = None
+        self.projectSaves = []
+        self.overlay = None
+        self.stroke = None
+        self.revision = 0
+        self.saved = False
+        self.workers = set()
+        self.opening = None
+        self.effect = None
+        self.closed = False
+        self.effectRevision = None
         self.clear()
+        # The composite is marked dirty before anything repaints from it
+        self.changed.connect(lambda rect: self.layers.invalidate(rect))
+        self.changed.connect(self.checkEffect)
+
+    @staticmethod
+    def getPenRect(fromPoint, toPoint, pen):
+        '''
+            The region a pen covers drawing from one point to another
+
+            Args:
+                fromPoint (QPoint): The start point
+                toPoint   (QPoint): The end point
+                pen       (QPen):   The pen to draw with
+
+            Returns:
+                (QRect)
+        '''
+        pad = int(pen.widthF()) + 1
+        return QRect(fromPoint, toPoint).normalized().adjusted(
+            -pad, -pad, pad, pad)
 
     def __drawing__(self, fromPoint, toPoint, pen):
         '''
@@ -51,49 +270,492 @@ class Canvas:
                 fromPoint (QPoint): The start point
                 toPoint   (QPoint): The end point
                 pen       (QPen):   The pen to draw with
+
+            Returns:
+                (QRect): The region that was drawn on, padded by the pen width
         '''
         self.state.lastPoint = toPoint
-        self.isSaved = False
-        painter = QPainter(self.image)
-        painter.setPen(pen)
-        if fromPoint != toPoint:
-            painter.drawLine(fromPoint, toPoint)
-        else:
-            painter.drawPoint(toPoint)
+        points = [toPoint] if fromPoint == toPoint else [fromPoint, toPoint]
+        return self.drawSegment(QPolygon(points), pen)
+
+    def drawSegment(self, polygon, pen, times=None):
+        '''
+            Draw a run of points as a polyline, or a dot if there is only
+            one, and record it in the stroke log
+
+            Args:
+                polygon (QPolygon): The points, a QPolygonF to draw in
+                                    between pixels
+                pen     (QPen):     The pen to draw with
+                times   (list):     When each point arrived, see
+                                    StrokeLog.addSegment
+
+            Returns:
+                (QRect): The region that was drawn on, padded by the pen width
+        '''
+        self.saved = False
+        self.revision += 1
+        bounds = QRectF(polygon.boundingRect()).toAlignedRect()
+        rect = self.getPenRect(bounds.topLeft(), bounds.bottomRight(), pen)
+        self.history.record(self.image, rect)
+        for painter in self.image.painters(rect):
+            painter.setPen(pen)
+            if len(polygon) == 1:
+                painter.drawPoint(polygon[0])
+            else:
+                painter.drawPolyline(polygon)
+        self.log.addSegment(self.getLayerId(), pen, polygon, times)
+        self.changed.emit(rect)
+        return rect
 
     def undo(self):
         '''
             Return the canvas to a previous state
+
+            Returns:
+                (QRect): The region that was reverted
+        '''
+        self.endStroke()
+        self.commit()
+        if not self.history.isEmpty():
+            self.log.undo()
+        rect = self.history.undo()
+        self.revision += 1
+        self.changed.emit(rect)
+        return rect
+
+    def redo(self):
+        '''
+            Make the last change that was undone again
+
+            Returns:
+                (QRect): The region that was changed
         '''
-        if self.previous:
-            self.setImage(self.previous.pop())
+        self.endStroke()
+        self.commit()
+        if not self.history.isRedoEmpty():
+            self.log.redo()
+        rect = self.history.redo()
+        self.revision += 1
+        self.changed.emit(rect)
+        return rect
 
     def snapshotImage(self):
         '''
-            Snapshot the current state of the canvas
+            Snapshot the current state of the canvas, drawing from here on is
+            recorded as a single change that can be undone
         '''
-        self.previous.append(QImage(self.image))
-        if len(self.previous) > 50:
-            self.previous.pop(0)
+        self.commit()
+        self.history.begin(self.image)
+        self.log.begin(self.getLayerId())
+
+    def commit(self):
+        '''
+            Finish recording the current change, in the history and the
+            stroke log
+        '''
+        self.log.commit(self.history.commit())
 
     def clear(self):
         '''
             Re-initialize the canvas
         '''
-        image = QImage(self.size, QImage.Format_RGB32)
-        image.fill(Qt.white)
-        self.previous = []
-        self.image = image
+        self.endStroke()
+        layers = LayerStack(self.size, self.tileBudget)
+        self.history.clear()
+        self.replaceLayers(layers)
+        self.revision += 1
+        self.changed.emit(self.image.rect())
+
+    def replaceLayers(self, layers, project=None, log=None):
+        '''
+            Swap the layers for others, releasing the old layers' tiles,
+            stroke log and project file. The top layer becomes active
+
+            Args:
+                layers  (LayerStack):  The new layers
+                project (ProjectFile): The project the layers are from
+                log     (StrokeLog):   The log of the layers, empty if not
+                                       given
+        '''
+        if self.layers is not None:
+            self.layers.close()
+        if self.log is not None:
+            self.log.close()
+        if project is not self.project:
+            self.closeProject()
+        self.layers = layers
+        self.log = log or StrokeLog(layers.imageSize)
+        self.project = project
+        self.arranged = False
+        self.setActiveLayer(len(layers) - 1)
+
+    def closeProject(self):
+        '''
+            Close the project the canvas was opened from or last saved to,
+            once the save that's running, which may read from it, is done
+        '''
+        project, self.project = self.project, None
+        if project is None:
+            return
+        if not self.projectSaves:
+            project.close()
+            return
+        worker = self.projectSaves[0]
+        worker.signals.finished.connect(lambda _: project.close())
+        worker.signals.failed.connect(lambda _: project.close())
+
+    def getLayers(self):
+        '''
+            Get the layers of the canvas, bottom first
+
+            Returns:
+                (LayerStack)
+        '''
+        return self.layers
+
+    def getActiveLayer(self):
+        '''
+            Get the position of the layer that is drawn on
+
+            Returns:
+                (int)
+        '''
+        return self.active
+
+    def getLayerId(self):
+        '''
+            Get the id of the layer that is drawn on, see LayerStack.Layer
+
+            Returns:
+                (int)
+        '''
+        return self.layers[self.active].id
+
+    def setActiveLayer(self, index: int):
+        '''
+            Choose the layer that is drawn on, clamped to the stack
+
+            Args:
+                index (int): The position of the layer, 0 is the bottom
+
+            Returns:
+                (LayerStack.Layer)
+        '''
+        self.endStroke()
+        self.commit()
+        self.active = min(max(index, 0), len(self.layers) - 1)
+        self.image = self.layers[self.active].image
+        return self.layers[self.active]
+
+    def addLayer(self, name=None):
+        '''
+            Add a transparent layer above the active layer and make it active
+
+            Args:
+                name (str): The name of the layer, numbered if not given
+
+            Returns:
+                (LayerStack.Layer)
+        '''
+        layer = self.layers.createLayer(name)
+        self.layers.insert(self.active + 1, layer)
+        self.log.record(
+            StrokeLog.Arrange(layer.id, 'add', (self.active + 1, layer.name)))
+        self.arrangeLayers()
+        return self.setActiveLayer(self.active + 1)
+
+    def removeLayer(self, index=None):
+        '''
+            Remove a layer and the changes made to it from the history, the
+            background can't be removed
+
+            Args:
+                index (int): The position of the layer, the active layer if
+                             None
+
+            Returns:
+                (QRect): The region the layer covered
+        '''
+        index = self.active if index is None else index
+        if index == 0:
+            return QRect()
+        self.endStroke()
+        self.commit()
+        layer = self.layers.remove(index)
+        rect = layer.image.getBounds()
+        self.history.forget(layer.image)
+        self.log.forget(layer.id)
+        self.log.record(StrokeLog.Arrange(layer.id, 'remove'))
+        layer.image.close()
+        self.setActiveLayer(self.active - (index <= self.active))
+        self.arrangeLayers(rect)
+        return rect
+
+    def setLayerVisible(self, index: int, visible: bool):
+        '''
+            Show or hide a layer
+
+            Args:
+                index   (int):  The position of the layer
+                visible (bool): Whether it is shown
+
+            Returns:
+                (QRect): The region of the canvas that changed
+        '''
+        self.layers[index].visible = visible
+        self.log.record(
+            StrokeLog.Arrange(self.layers[index].id, 'visible', visible))
+        return self.arrangeLayers(self.getLayerRect(index))
+
+    def setLayerOpacity(self, index: int, opacity: float):
+        '''
+            Set how opaque a layer is
+
+            Args:
+                index   (int):   The position of the layer
+                opacity (float): From 0 to 1
+
+            Returns:
+                (QRect): The region of the canvas that changed
+        '''
+        self.layers[index].opacity = min(max(opacity, 0.0), 1.0)
+        self.log.record(
+            StrokeLog.Arrange(self.layers[index].id, 'opacity',
+                              self.layers[index].opacity))
+        return self.arrangeLayers(self.getLayerRect(index))
+
+    def setLayerBlendMode(self, index: int, blendMode):
+        '''
+            Set how a layer blends with the layers below it
+
+            Args:
+                index     (int):                  The position of the layer
+                blendMode (Constants.BlendModes): The blend mode
+
+            Returns:
+                (QRect): The region of the canvas that changed
+        '''
+        self.layers[index].blendMode = blendMode
+        self.log.record(
+            StrokeLog.Arrange(self.layers[index].id, 'blendMode', blendMode))
+        return self.arrangeLayers(self.getLayerRect(index))
+
+    def arrangeLayers(self, rect=QRect()):
+        '''
+            Record a change to the layers themselves, these aren't undoable
+            but count as an edit
+
+            Args:
+                rect (QRect): The region of the canvas that changed
+
+            Returns:
+                (QRect)
+        '''
+        self.arranged = True
+        self.saved = False
+        self.revision += 1
+        if not rect.isEmpty():
+            self.changed.emit(rect)
+        return rect
+
+    def getLayerRect(self, index: int):
+        '''
+            The region of the canvas a layer can change, the background
+            covers the whole canvas even where it isn't allocated
+
+            Args:
+                index (int): The position of the layer
+
+            Returns:
+                (QRect)
+        '''
+        if index == 0:
+            return self.image.rect()
+        return self.layers[index].image.getBounds()
+
+    def getComposite(self):
+        '''
+            Get the layers composited together, this is what is shown
+
+            Returns:
+                (TiledImage)
+        '''
+        return self.layers.getComposite()
 
     def setImage(self, image):
         '''
-            Set the canvas to a QImage
+            Set the canvas to a QImage, the canvas keeps its size so the
+            image is centered and only scaled down if it doesn't fit
 
             Args:
                 image (QImage): The image for the canvas
         '''
-        self.image = QImage(image).scaled(self.size, Qt.KeepAspectRatio,
-                                          Qt.SmoothTransformation)
+        self.endStroke()
+        image = QImage(image)
+        if (image.width() > self.size.width()
+                or image.height() > self.size.height()):
+            image = image.scaled(self.size, Qt.KeepAspectRatio,
+                                 Qt.SmoothTransformation)
+        if image.hasAlphaChannel():
+            background = QImage(image.size(), QImage.Format_RGB32)
+            background.fill(Qt.white)
+            painter = QPainter(background)
+            painter.drawImage(0, 0, image)
+            painter.end()
+            image = background
+        # Only the tiles the image covers are allocated
+        document = TiledImage(self.size, budget=self.tileBudget)
+        document.paste(
+            QPoint((self.size.width() - image.width()) // 2,
+                   (self.size.height() - image.height()) // 2), image)
+        self.history.clear()
+        self.clearOverlay()
+        self.replaceLayers(LayerStack(self.size, self.tileBudget, document))
+        # The keyframe shares the tiles until the background is drawn on
+        self.log.record(
+            StrokeLog.Keyframe(self.getLayerId(), QPoint(),
+                               document.snapshot(budget=self.tileBudget)))
+        self.revision += 1
+        self.changed.emit(document.rect())
+
+    def setPreviewImage(self, image):
+        '''
+            Show a preview of an image over the canvas, where it will be
+            placed by setImage, until the image itself is set
+
+            Args:
+                image (QImage): A low resolution copy of the image
+        '''
+        # The preview is decoded at a fraction of the size of the image
+        size = image.size() * OpenWorker.PREVIEW_SCALE
+        if (size.width() > self.size.width()
+                or size.height() > self.size.height()):
+            size = size.scaled(self.size, Qt.KeepAspectRatio)
+        self.clearOverlay()
+        self.overlay = Canvas.ImageOverlay(
+            image,
+            QRect((self.size.width() - size.width()) // 2,
+                  (self.size.height() - size.height()) // 2, size.width(),
+                  size.height()))
+        self.changed.emit(self.overlay.getRect())
+
+    def open(self, path):
+        '''
+            Open an image from a file in the background, a preview is shown
+            as soon as it is decoded and is swapped for the image when ready
+
+            Args:
+                path (str): Path to open
+
+            Returns:
+                (OpenWorker): The worker, to follow the progress of the open
+        '''
+        worker = OpenWorker(path, self.size)
+        self.opening = worker
+
+        def isCurrent():
+            return self.opening is worker
+
+        worker.signals.preview.connect(
+            lambda image: isCurrent() and self.setPreviewImage(image))
+        worker.signals.finished.connect(
+            lambda image: isCurrent() and self.setImage(image))
+        worker.signals.failed.connect(
+            lambda _: isCurrent() and self.clearOverlay())
+        self.startWorker(worker)
+        return worker
+
+    def openProject(self, path):
+        '''
+            Open a project, only its index is read up front. The tiles are
+            decoded from the file the first time they are shown or drawn on
+
+            Args:
+                path (str): Path to open
+
+            Throws:
+                OSError : The project can't be read
+                ValueError : The file isn't a project or is damaged
+        '''
+        project = ProjectFile(path)
+        index = project.readIndex()
+        self.endStroke()
+        self.opening = None
+        size = QSize(index['width'], index['height'])
+        layers = []
+        for position, entry in enumerate(index['layers']):
+            image, chunks = self.loadImage(project, entry, size)
+            layer = LayerStack.Layer(image, entry['name'], entry['opacity'],
+                                     Constants.BlendModes[entry['blendMode']],
+                                     entry['visible'],
+                                     entry.get('id', position))
+            layer.chunks = chunks
+            layers.append(layer)
+        keyframes = [
+            self.loadImage(project, entry,
+                           QSize(entry['width'], entry['height']))
+            for entry in index.get('keyframes', [])
+        ]
+        if 'log' in index:
+            log = StrokeLog.fromBytes(project.read(*index['log']),
+                                      [image for image, _ in keyframes])
+            for keyframe, (_, chunks) in zip(log.getKeyframes(), keyframes):
+                keyframe.chunks = chunks
+        else:
+            log = StrokeLog(size)
+        stack = LayerStack(size, self.tileBudget, layers[0].image)
+        stack.layers = layers
+        stack.created = max(layer.id for layer in layers)
+        self.size = size
+        self.history.clear()
+        self.clearOverlay()
+        self.replaceLayers(stack, project, log)
+        self.setActiveLayer(index['active'])
+        self.revision += 1
+        self.saved = True
+        self.changed.emit(self.image.rect())
+
+    def loadImage(self, project, entry, size):
+        '''
+            Make a tiled image whose tiles are read from a project the first
+            time they are needed
+
+            Args:
+                project (ProjectFile): The project
+                entry   (dict):        The image in the index, a layer or a
+                                       keyframe
+                size    (QSize):       The size of the image
+
+            Returns:
+                (tuple): The (TiledImage, dict) of the image and the chunks
+                         of its tiles
+        '''
+        image = TiledImage(size, QColor(entry['fill']),
+                           QImage.Format(entry['format']), self.tileBudget)
+        chunks = {
+            ProjectFile.getKey(name): tuple(location)
+            for name, location in entry['tiles'].items()
+        }
+        self.setLoader(image, project, chunks, chunks)
+        return image, chunks
+
+    @staticmethod
+    def setLoader(image, project, chunks, keys):
+        '''
+            Leave tiles of an image to be read from a project the first time
+            they are needed
+
+            Args:
+                image   (TiledImage):  The image
+                project (ProjectFile): The project
+                chunks  (dict):        The location of each tile by key
+                keys    (iterable):    The keys of the tiles to leave
+        '''
+        format = image.format()
+        image.setLoader(
+            lambda key: project.readTile(chunks[key], TiledImage.TILE_SIZE,
+                                         format), keys)
 
     def draw(self, toPoint, brush):
         '''
@@ -103,12 +765,84 @@ class Canvas:
                 toPoint (QPoint): The point to paint to
                 brush   (Brush):  The brush model to use
 
+            Returns:
+                (QRect): The region that was drawn on
+
             Throws:
                 RuntimeError : Must set brush on canvas
         '''
         if not self.isDrawing():
             raise RuntimeError("Canvas.brushOnCanvas must be called")
-        self.__drawing__(self.state.lastPoint, toPoint, brush.getPen())
+        return self.__drawing__(self.state.lastPoint, toPoint, brush.getPen())
+
+    def beginStroke(self, point, brush):
+        '''
+            Set a brush on the canvas and start a stroke, drawing the point
+            it starts at. The stroke keeps one painter and pen until it ends
+
+            Args:
+                point (QPoint): The point to start at
+                brush (Brush):  The brush model to use
+
+            Returns:
+                (QRect): The region that was drawn on
+        '''
+        self.endStroke()
+        self.brushOnCanvas(point)
+        self.stroke = Canvas.Stroke(self.image, brush.getPen(), point,
+                                    self.log.getTime())
+        return self.flushStroke()
+
+    def extendStroke(self, point):
+        '''
+            Add a point to the stroke, points are batched up until the stroke
+            is flushed
+
+            Args:
+                point (QPoint): The point to extend the stroke to
+
+            Throws:
+                RuntimeError : Must begin a stroke
+        '''
+        if self.stroke is None:
+            raise RuntimeError("Canvas.beginStroke must be called")
+        self.state.lastPoint = point
+        self.stroke.points.append(point)
+        self.stroke.times.append(self.log.getTime())
+
+    def flushStroke(self):
+        '''
+            Draw the points the stroke has been extended to since it was last
+            flushed, in one go
+
+            Returns:
+                (QRect): The region that was drawn on
+        '''
+        if self.stroke is None or not self.stroke.points:
+            return QRect()
+        self.saved = False
+        self.revision += 1
+        rect = self.stroke.getRect()
+        self.history.record(self.image, rect)
+        polygon = QPolygon(self.stroke.getPoints())
+        times = self.stroke.getTimes()
+        self.stroke.paint()
+        self.log.addSegment(self.getLayerId(), self.stroke.pen, polygon, times)
+        self.changed.emit(rect)
+        return rect
+
+    def endStroke(self):
+        '''
+            Flush and finish the current stroke, if there is one
+
+            Returns:
+                (QRect): The region that was drawn on
+        '''
+        rect = self.flushStroke()
+        if self.stroke is not None:
+            self.stroke.end()
+            self.stroke = None
+        return rect
 
     def drawActual(self, toPoint, brush):
         '''
@@ -118,56 +852,588 @@ class Canvas:
                 toPoint (QPoint): The point to paint to
                 brush   (Brush):  The brush model to use
 
+            Returns:
+                (QRect): The region that was drawn on, including the preview
+
             Throws:
                 RuntimeError : Must set brush on canvas
         '''
         if not self.isDrawing():
             raise RuntimeError("Canvas.brushOnCanvas must be called")
-        if self.state.hasPreview:
-            self.undo()
-            self.state.hasPreview = False
-        self.__drawing__(self.state.initialPoint, toPoint, brush.getPen())
+        return self.clearOverlay().united(
+            self.__drawing__(self.state.initialPoint, toPoint,
+                             brush.getPen()))
 
     def drawPreview(self, toPoint, brush):
         '''
-            Draw a preview to a point, with a brush
+            Draw a preview to a point, with a brush, on the overlay so the
+            image itself is left untouched
 
             Args:
                 toPoint (QPoint): The point to paint to
                 brush   (Brush):  The brush model to use
 
+            Returns:
+                (QRect): The region of the new preview and the previous one
+
             Throws:
                 RuntimeError : Must set brush on canvas
         '''
         if not self.isDrawing():
             raise RuntimeError("Canvas.brushOnCanvas must be called")
-        if self.state.hasPreview:
-            self.undo()
-            self.state.hasPreview = False
-        self.snapshotImage()
-        self.__drawing__(self.state.initialPoint, toPoint,
-                         brush.getPreviewPen())
+        rect = self.clearOverlay()
+        self.state.lastPoint = toPoint
         self.state.hasPreview = True
+        self.overlay = Canvas.Overlay(self.state.initialPoint, toPoint,
+                                      brush.getPreviewPen())
+        self.changed.emit(self.overlay.getRect())
+        return rect.united(self.overlay.getRect())
+
+    def clearOverlay(self):
+        '''
+            Remove the overlay from the canvas
+
+            Returns:
+                (QRect): The region the overlay covered
+        '''
+        if self.overlay is None:
+            return QRect()
+        rect = self.overlay.getRect()
+        self.overlay = None
+        self.state.hasPreview = False
+        self.changed.emit(rect)
+        return rect
+
+    def getOverlay(self):
+        '''
+            Get the overlay drawn over the canvas, if there is one
+
+            Returns:
+                (Canvas.Overlay)
+        '''
+        return self.overlay
 
     def getImage(self):
         '''
-            Get the QImage attribute
+            Get the canvas flattened in to a single QImage
 
             Returns:
                 (QImage)
         '''
-        return self.image
+        return self.layers.toImage()
+
+    @staticmethod
+    def getFillRegion(image, point, tolerance: int, alpha: bool = False):
+        '''
+            The pixels connected to a point, horizontally or vertically,
+            whose colour is within a tolerance of the point's. The region
+            spreads a tile at a time from the point's tile, so only the tiles
+            it reaches are read, and never as one flattened copy
+
+            Args:
+                image     (TiledImage): The image
+                point     (QPoint):     The point to fill from
+                tolerance (int):        How far each channel can be from the
+                                        point's
+                alpha     (bool):       Compare the alpha channel too, for
+                                        images with transparency
+
+            Returns:
+                (tuple): The (dict, QRect) of a bool mask by key of each tile
+                         the region reaches, the size of the tile's part of
+                         the image or None where it's all reached, and the
+                         bounds of the region
+        '''
+        size = TiledImage.TILE_SIZE
+        bounds = image.rect()
+        columns = (image.width() - 1) // size
+        rows = (image.height() - 1) // size
+        first = (point.x() // size, point.y() // size)
+        for _, array in image.arrays(QRect(point, QSize(1, 1))):
+            target = array.view(numpy.uint32)[0, 0, 0]
+            seed = [int(value) for value in array[0, 0]]
+        channels = [Pixels.RED, Pixels.GREEN, Pixels.BLUE]
+        channels += [Pixels.ALPHA] * alpha
+
+        def getSimilar(array):
+            if not tolerance:
+                return array.view(numpy.uint32)[..., 0] == target
+            similar = numpy.ones(array.shape[:2], bool)
+            for channel in channels:
+                values = array[..., channel]
+                if seed[channel] > tolerance:
+                    similar &= values >= seed[channel] - tolerance
+                if seed[channel] + tolerance < 255:
+                    similar &= values <= seed[channel] + tolerance
+            return similar
+
+        def getLabels(key):
+            # Each connected area of similar pixels in the tile gets its own
+            # label. A tile that is all similar, as most are in a large
+            # fill, is True and one with none is False
+            for _, array in image.arrays(image.getTileRect(key)):
+                pixels = array.view(numpy.uint32)[..., 0]
+                # A tile of one colour is only compared once
+                similar = getSimilar(array[:1, :1] if (
+                    pixels == pixels[0, 0]).all() else array)
+            return True if similar.all() else (
+                False if not similar.any() else ndimage.label(similar)[0])
+
+        def spread(key, left, right, top, bottom):
+            # Seed the neighbours across each edge the region grew to
+            x, y = key
+            if x > 0 and left.size:
+                queue.append(((x - 1, y), left, numpy.full_like(
+                    left, size - 1)))
+            if x < columns and right.size:
+                queue.append(((x + 1, y), right, numpy.zeros_like(right)))
+            if y > 0 and top.size:
+                queue.append(((x, y - 1), numpy.full_like(top, size - 1),
+                              top))
+            if y < rows and bottom.size:
+                queue.append(((x, y + 1), numpy.zeros_like(bottom), bottom))
+
+        labelled = {}
+        reached = {}
+        masks = {}
+        queue = [(first, numpy.array([point.y() % size]),
+                  numpy.array([point.x() % size]))]
+        while queue:
+            key, ys, xs = queue.pop()
+            if key in masks and masks[key] is None:
+                continue
+            if key not in labelled:
+                labelled[key] = getLabels(key)
+            labels = labelled[key]
+            if labels is False:
+                continue
+            if labels is True:
+                masks[key] = None
+                part = image.getTileRect(key).intersected(bounds)
+                across = numpy.arange(part.height())
+                along = numpy.arange(part.width())
+                spread(key, across, across, along, along)
+                continue
+            # Areas already reached have already spread
+            seen = reached.setdefault(key, set())
+            found = [label for label in numpy.unique(labels[ys, xs]).tolist()
+                     if label and label not in seen]
+            if not found:
+                continue
+            seen.update(found)
+            if len(found) == 1:
+                added = labels == found[0]
+            else:
+                reaching = numpy.zeros(labels.max() + 1, bool)
+                reaching[found] = True
+                added = reaching[labels]
+            if key in masks:
+                masks[key] |= added
+            else:
+                masks[key] = added
+            spread(key, numpy.flatnonzero(added[:, 0]),
+                   numpy.flatnonzero(added[:, -1]),
+                   numpy.flatnonzero(added[0]), numpy.flatnonzero(added[-1]))
+        rect = QRect()
+        for key, mask in masks.items():
+            part = image.getTileRect(key).intersected(bounds)
+            if mask is not None:
+                ys = numpy.flatnonzero(mask.any(axis=1))
+                xs = numpy.flatnonzero(mask.any(axis=0))
+                part = QRect(QPoint(xs[0], ys[0]), QPoint(
+                    xs[-1], ys[-1])).translated(part.topLeft())
+            rect |= part
+        return masks, rect
+
+    def fill(self, point, brush):
+        '''
+            Flood fill from a point with the brush colour, as a single change
+            that can be undone
+
+            Args:
+                point (QPoint): The point to fill from
+                brush (Brush):  The brush model to use
+
+            Returns:
+                (QRect): The region that was filled, empty if the point is
+                         off the canvas
+        '''
+        return self.floodFill(point, QColor(brush.getColour()),
+                              brush.getTolerance())
+
+    def floodFill(self, point, colour, tolerance: int):
+        '''
+            Flood fill from a point with a colour, as a single change that
+            can be undone
+
+            Args:
+                point     (QPoint): The point to fill from
+                colour    (QColor): The colour to fill with
+                tolerance (int):    How far each channel can be from the
+                                    point's, see getFillRegion
+
+            Returns:
+                (QRect): The region that was filled, empty if the point is
+                         off the canvas
+        '''
+        if not self.image.rect().contains(point):
+            return QRect()
+        self.endStroke()
+        masks, rect = self.getFillRegion(
+            self.image, point, tolerance,
+            self.image.format() != QImage.Format_RGB32)
+        self.snapshotImage()
+        # Each run of tiles along a row is recorded in one go
+        keys = sorted(masks, key=lambda key: (key[1], key[0]))
+        for _, run in itertools.groupby(
+                enumerate(keys), lambda item: (item[1][1],
+                                               item[1][0] - item[0])):
+            run = [key for _, key in run]
+            self.history.record(
+                self.image,
+                self.image.getTileRect(run[0]).united(
+                    self.image.getTileRect(run[-1])))
+        for key, mask in masks.items():
+            if mask is None:
+                self.image.fillRect(self.image.getTileRect(key), colour.rgb())
+                continue
+            for _, array in self.image.arrays(self.image.getTileRect(key),
+                                              True):
+                numpy.copyto(array.view(numpy.uint32)[..., 0], colour.rgb(),
+                             where=mask)
+        self.log.add(
+            StrokeLog.Fill(self.getLayerId(), point, colour.rgb(), tolerance))
+        self.commit()
+        self.saved = False
+        self.revision += 1
+        self.changed.emit(rect)
+        return rect
+
+    def previewEffect(self, effect):
+        '''
+            Show an effect over the canvas, applied to a downsampled copy of
+            the active layer so it is quick enough to do straight away. The
+            other layers are composited over and under it as they are
+
+            Args:
+                effect (Effect): The effect
+        '''
+        limit = QSize(Constants.EFFECT_PREVIEW_SIZE,
+                      Constants.EFFECT_PREVIEW_SIZE)
+        size = self.image.size()
+        if size.width() > limit.width() or size.height() > limit.height():
+            size = size.scaled(limit, Qt.KeepAspectRatio)
+        effect = effect.scaled(size.width() / self.image.width())
+        array = Pixels.view(self.image.scaled(size))
+        effect.prepare(array)
+        result = effect.apply(array)
+        preview = self.layers.preview(
+            size, self.active, Pixels.toImage(result, self.image.format()))
+        self.clearOverlay()
+        self.overlay = Canvas.ImageOverlay(preview, self.image.rect())
+        self.changed.emit(self.overlay.getRect())
+
+    def applyEffect(self, effect):
+        '''
+            Apply an effect to the canvas in the background, the result lands
+            as a single change that can be undone. The effect is cancelled if
+            the canvas changes before it is done
+
+            Args:
+                effect (Effect): The effect
+
+            Returns:
+                (EffectJob): The job, to follow its progress or cancel it
+        '''
+        self.endStroke()
+        if self.effect is not None:
+            self.effect.cancel()
+        job = EffectJob(effect, self.getArray())
+        self.effect = job
+        self.effectRevision = self.revision
+
+        def finish(result=None):
+            if self.effect is not job:
+                return
+            self.effect = None
+            self.clearOverlay()
+            if result is not None:
+                self.setArray(result, QPoint(),
+                              StrokeLog.Effect(self.getLayerId(), effect))
+
+        job.signals.finished.connect(finish)
+        job.signals.failed.connect(lambda _: finish())
+        job.start()
+        return job
+
+    def checkEffect(self, rect):
+        '''
+            Cancel the effect being applied if the canvas has changed since
+            it started
+
+            Args:
+                rect (QRect): The region that changed
+        '''
+        if self.effect is not None and self.effectRevision != self.revision:
+            self.effect.cancel("The canvas changed")
+
+    def getArray(self, rect=None):
+        '''
+            Get a region of the canvas as a NumPy array, see Pixels for the
+            layout. The array is a copy, use image.arrays to work on the
+            tiles in place
+
+            Args:
+                rect (QRect): The region, the whole canvas if not given
+
+            Returns:
+                (numpy.ndarray): (height, width, 4) uint8
+        '''
+        rect = self.image.rect() if rect is None else rect.intersected(
+            self.image.rect())
+        return Pixels.view(self.image.copy(rect), True)
+
+    def setArray(self, array, point=QPoint(), event=None):
+        '''
+            Write an array in to the canvas, as a single change that can be
+            undone
+
+            Args:
+                array (numpy.ndarray):   (height, width, 4) uint8, see Pixels
+                point (QPoint):          Where to write the top left pixel
+                event (StrokeLog.Event): What made the array, for the stroke
+                                         log to replay, a keyframe of the
+                                         array if not given
+
+            Returns:
+                (QRect): The region that was written
+        '''
+        image = Pixels.toImage(array, self.image.format())
+        rect = QRect(point, image.size()).intersected(self.image.rect())
+        self.endStroke()
+        self.snapshotImage()
+        self.history.record(self.image, rect)
+        self.image.paste(point, image)
+        if event is None:
+            keyframe = TiledImage(image.size(), self.image.fill,
+                                  image.format(), self.tileBudget)
+            keyframe.paste(QPoint(), image)
+            event = StrokeLog.Keyframe(self.getLayerId(), point, keyframe)
+        self.log.add(event)
+        self.commit()
+        self.saved = False
+        self.revision += 1
+        self.changed.emit(rect)
+        return rect
 
     def save(self, path):
         '''
-            Save the QImage to a file
+            Save the QImage to a file in the background, the canvas is only
+            marked as saved if the file is written and nothing has been drawn
+            since the save started. A path with the project extension is
+            saved as a project, see saveProject
 
             Args:
                 path (str): Path to save to
+
+            Returns:
+                (SaveWorker): The worker, to follow the progress of the save
+        '''
+        if ProjectFile.isProject(path):
+            return self.saveProject(path)
+        # The snapshot shares the tiles until the canvas is next drawn on,
+        # unless a stroke is painting on them, and is flattened by the worker
+        worker = SaveWorker(self.layers.snapshot(self.stroke is not None),
+                            path)
+        revision = self.revision
+        worker.signals.finished.connect(lambda _: self.markSaved(revision))
+        self.startWorker(worker)
+        return worker
+
+    def saveProject(self, path):
+        '''
+            Save the canvas as a project in the background. Saving over the
+            project the canvas was opened from or last saved to only appends
+            the tiles drawn on since, otherwise the tiles that haven't
+            changed are copied across without decoding them. Saves are
+            queued so each knows where the last left the tiles
+
+            Args:
+                path (str): Path to save to
+
+            Returns:
+                (ProjectWorker): The worker, to follow the progress of the
+                                 save
+        '''
+        worker = ProjectWorker(path)
+        self.projectSaves.append(worker)
+        if len(self.projectSaves) == 1:
+            self.startProjectSave()
+        return worker
+
+    def startProjectSave(self):
+        '''
+            Start the first queued project save, with the tiles that have
+            changed as of now
+        '''
+        worker = self.projectSaves[0]
+        stack = self.layers
+        layers = list(stack)
+        edited = [layer.image.takeEdited() for layer in layers]
+        keyframes = self.log.getKeyframes()
+        append = self.project is not None and os.path.abspath(
+            self.project.path) == os.path.abspath(worker.path)
+        worker.setDocument(self.getDocument(layers, edited, keyframes),
+                           self.project, append)
+        revision = self.revision
+
+        def finish(path):
+            if stack is self.layers and not self.closed:
+                try:
+                    project = ProjectFile(path)
+                except OSError:
+                    project = None
+                loading = False
+                for saved, placed in zip(layers + keyframes,
+                                         worker.locations):
+                    saved.chunks = placed if project else {}
+                    # Tiles that haven't been loaded are read from the
+                    # saved project, so the one before it can be closed
+                    unloaded = saved.image.getUnloaded()
+                    if project and unloaded:
+                        self.setLoader(saved.image, project, placed,
+                                       unloaded)
+                    loading = loading or bool(unloaded)
+                # Without the saved project the tiles left to load are still
+                # read from the one before, it's left open for them
+                if self.project is not None and (project or not loading):
+                    self.project.close()
+                self.project = project
+                self.markSaved(revision)
+            self.nextProjectSave()
+
+        def fail(error):
+            # The tiles will be written by the next save instead
+            for layer, keys in zip(layers, edited):
+                layer.image.edited |= keys
+            self.nextProjectSave()
+
+        worker.signals.finished.connect(finish)
+        worker.signals.failed.connect(fail)
+        self.startWorker(worker)
+
+    def nextProjectSave(self):
+        '''
+            Drop the project save that has finished and start the next
+        '''
+        self.projectSaves.pop(0)
+        if self.projectSaves:
+            self.startProjectSave()
+
+    def getDocument(self, layers, edited, keyframes):
+        '''
+            Describe the canvas for a ProjectWorker, with copies of the tiles
+            that need writing, those that have been drawn on or that aren't
+            in the project yet, and the stroke log
+
+            Args:
+                layers    (list): The layers
+                edited    (list): The keys of the tiles drawn on in each layer
+                keyframes (list): The keyframes of the stroke log
+
+            Returns:
+                (dict): See ProjectWorker.setDocument
+        '''
+        document = {
+            'width': self.size.width(),
+            'height': self.size.height(),
+            'active': self.active,
+            'layers': [],
+            'keyframes': [],
+            'log': self.log.toBytes()
+        }
+        for layer, keys in zip(layers, edited):
+            image = layer.image
+            keys = keys | (image.keys() - layer.chunks.keys())
+            document['layers'].append({
+                'id': layer.id,
+                'name': layer.name,
+                'opacity': layer.opacity,
+                'blendMode': layer.blendMode.name,
+                'visible': layer.visible,
+                'format': int(image.format()),
+                'fill': QColor(image.fill).name(QColor.HexArgb),
+                # Tiles a stroke is painting on are copied now
+                'tiles': image.copyTiles(keys, self.stroke is not None),
+                'chunks': dict(layer.chunks)
+            })
+        for keyframe in keyframes:
+            image = keyframe.image
+            # Keyframes are never drawn on, only new ones need writing
+            document['keyframes'].append({
+                'width': image.width(),
+                'height': image.height(),
+                'format': int(image.format()),
+                'fill': QColor(image.fill).name(QColor.HexArgb),
+                'tiles': image.copyTiles(image.keys() - keyframe.chunks.keys()),
+                'chunks': dict(keyframe.chunks)
+            })
+        return document
+
+    def getLog(self):
+        '''
+            Get the stroke log of the canvas
+
+            Returns:
+                (StrokeLog)
+        '''
+        return self.log
+
+    @staticmethod
+    def fromLog(log, scale: float = 1.0, budget=None, tileBudget=None):
         '''
-        # TODO: Throw is path doesn't exist / isn't writable
-        self.image.save(path)
-        self.isSaved = True
+            Render a document again from its stroke log, on a new canvas.
+            At a scale of one the result matches the canvas the log was
+            recorded from, at other scales strokes are drawn with their
+            points and pen widths scaled and keyframes are resampled
+
+            Args:
+                log        (StrokeLog):    The log to replay
+                scale      (float):        The scale to render at
+                budget     (MemoryBudget): See Canvas
+                tileBudget (MemoryBudget): See Canvas
+
+            Returns:
+                (Canvas)
+        '''
+        canvas = Canvas(log.size * scale, budget, tileBudget)
+        for event in list(log):
+            event.replay(canvas, scale)
+        canvas.commit()
+        return canvas
+
+    def startWorker(self, worker):
+        '''
+            Start a worker on the thread pool, holding on to it until it has
+            finished so its signals are delivered
+
+            Args:
+                worker (QRunnable): A worker with finished and failed signals
+        '''
+        self.workers.add(worker)
+        worker.signals.finished.connect(lambda _: self.workers.discard(worker))
+        worker.signals.failed.connect(lambda _: self.workers.discard(worker))
+        QThreadPool.globalInstance().start(worker)
+
+    def markSaved(self, revision: int):
+        '''
+            Mark the canvas as saved, if it is still at the revision saved
+
+            Args:
+                revision (int): The revision of the canvas that was saved
+        '''
+        if revision == self.revision:
+            self.saved = True
 
     def isEdited(self):
         '''
@@ -176,7 +1442,7 @@ class Canvas:
             Returns:
                 (bool)
         '''
-        return True if self.previous else False
+        return self.arranged or not self.history.isEmpty()
 
     def isSaved(self):
         '''
@@ -185,7 +1451,7 @@ class Canvas:
             Returns:
                 (bool)
         '''
-        return self.isSaved
+        return self.saved
 
     def isDrawing(self):
         '''
@@ -211,21 +1477,38 @@ class Canvas:
         '''
             Remove a brush from the canvas
         '''
+        self.endStroke()
+        self.commit()
+        self.clearOverlay()
         self.state.isDrawing = False
         self.state.initialPoint = None
         self.state.lastPoint = None
 
-    def reset(self):
-        '''
-            Reset the image using the current image
-        '''
-        self.setImage(self.image)
-
     def setSize(self, size):
         '''
-            Set the size of the canvas
+            Set the size of the canvas, this is applied when it is cleared
 
             Args:
                 size (QSize): The size to use for the canvas
         '''
         self.size = size
+
+    def close(self):
+        '''
+            Release the memory held by the canvas, its history and tiles, any
+            scratch file they spilled to and its project file, rather than
+            waiting for it to be collected. Work in the background is
+            cancelled, except a project save that's running, and a closed
+            canvas reads as blank
+        '''
+        self.endStroke()
+        if self.effect is not None:
+            self.effect.cancel()
+        self.opening = None
+        self.overlay = None
+        del self.projectSaves[1:]
+        self.closeProject()
+        self.closed = True
+        self.history.close()
+        self.log.close()
+        self.layers.close()
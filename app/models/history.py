@@ -0,0 +1,485 @@
+'''
+    History
+    A model for recording undoable changes to an image as compressed deltas
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import zlib
+from collections import deque
+
+import numpy
+from app.workers.compress_worker import CompressWorker
+from PyQt5.QtCore import QRect
+from PyQt5.QtGui import QImage
+
+
+class History:
+    '''
+        Undo and redo history that only stores the regions of the image that
+        a change touched, compressed, within a memory budget. The tiles of
+        the history line up with the tiles of the image. Undoing a change
+        records the tiles it reverts so it can be redone, and a new change
+        drops everything that could be redone. Each change remembers the
+        image it was recorded from, so a canvas with layers has one history
+
+        A large change, e.g. a fill over a detailed image, is kept
+        uncompressed while it's the latest, and compressed on a thread of its
+        own once another change follows it, so neither making nor undoing it
+        waits on zlib
+
+        Args:
+            budget (MemoryBudget): The budget the history counts against,
+                                   it can be shared with other histories
+    '''
+    TILE_SIZE = 64
+    # Changes with more tiles to compress than this are compressed on the
+    # compression thread
+    BACKGROUND_TILES = 16
+
+    class Delta:
+        '''
+            The tiles of an image touched by a single change
+
+            Args:
+                image (TiledImage): The image being recorded
+        '''
+        def __init__(self, image):
+            self.image = image
+            self.format = image.format()
+            self.pending = {}
+            self.tiles = []
+            self.size = 0
+
+        def record(self, rect):
+            '''
+                Preserve the tiles of the image under rect before they are
+                drawn on, tiles already preserved are skipped. Where the image
+                is a single colour, as a fill leaves it, only the colour is
+                kept
+
+                Args:
+                    rect (QRect): The region about to be changed
+            '''
+            image = self.image
+            bounds = image.rect()
+            size = History.TILE_SIZE
+            left, top = rect.left() // size, rect.top() // size
+            right, bottom = rect.right() // size, rect.bottom() // size
+            if all((x, y) in self.pending for y in range(top, bottom + 1)
+                   for x in range(left, right + 1)):
+                return
+            # The tiles of the history sit within the tiles of the image
+            snapped = QRect(left * size, top * size,
+                            (right - left + 1) * size,
+                            (bottom - top + 1) * size).intersected(bounds)
+            for part, array in image.arrays(snapped):
+                pixels = array.view(numpy.uint32)[..., 0]
+                key = (part.left() // image.TILE_SIZE,
+                       part.top() // image.TILE_SIZE)
+                source = image.getTile(key)
+                origin = image.getTileRect(key).topLeft()
+                colour = int(pixels[0, 0])
+                cells = [(x, y)
+                         for y in range(part.top() // size,
+                                        part.bottom() // size + 1)
+                         for x in range(part.left() // size,
+                                        part.right() // size + 1)]
+                if (pixels[0] == colour).all() and (pixels == colour).all():
+                    if not any(cell in self.pending for cell in cells):
+                        # The part is kept as one colour, under its first
+                        # cell, the others are marked as kept
+                        self.pending.update(dict.fromkeys(cells))
+                        self.pending[cells[0]] = (part, colour)
+                        continue
+                for x, y in cells:
+                    if (x, y) in self.pending:
+                        continue
+                    tile = QRect(x * size, y * size, size,
+                                 size).intersected(bounds)
+                    local = tile.translated(-part.topLeft())
+                    block = pixels[local.top():local.bottom() + 1,
+                                   local.left():local.right() + 1]
+                    # Most detailed tiles differ within their first row
+                    if (block[0] == block[0, 0]).all() and (
+                            block == block[0, 0]).all():
+                        self.pending[(x, y)] = (tile, int(block[0, 0]))
+                    else:
+                        self.pending[(x, y)] = (tile, source.copy(
+                            tile.translated(-origin)))
+
+        def compress(self, now: bool = True):
+            '''
+                Take the pending tiles in to the delta, compressing them or
+                keeping them as they are to be compressed later, see
+                getUncompressed
+
+                Args:
+                    now (bool): Whether to compress the tiles now
+            '''
+            for tile in self.pending.values():
+                if tile is None:
+                    continue
+                rect, image = tile
+                if isinstance(image, int):
+                    self.tiles.append((rect, 0, image))
+                    self.size += 4
+                    continue
+                if not now:
+                    self.tiles.append((rect, image.bytesPerLine(), image))
+                    self.size += image.sizeInBytes()
+                    continue
+                data = zlib.compress(
+                    image.constBits().asstring(image.sizeInBytes()),
+                    CompressWorker.LEVEL)
+                self.tiles.append((rect, image.bytesPerLine(), data))
+                self.size += len(data)
+            self.pending = {}
+
+        def getUncompressed(self):
+            '''
+                The tiles kept as they are
+
+                Returns:
+                    (list): (index, QImage) of each
+            '''
+            return [(index, tile[2]) for index, tile in enumerate(self.tiles)
+                    if isinstance(tile[2], QImage)]
+
+        def setCompressed(self, index: int, data: bytes):
+            '''
+                Replace a tile kept as it is with its compressed data
+
+                Args:
+                    index (int):   The index of the tile
+                    data  (bytes): Its compressed pixels
+
+                Returns:
+                    (int): The bytes saved, 0 if the tile is already
+                           compressed
+            '''
+            rect, bytesPerLine, image = self.tiles[index]
+            if not isinstance(image, QImage):
+                return 0
+            self.tiles[index] = (rect, bytesPerLine, data)
+            saved = image.sizeInBytes() - len(data)
+            self.size -= saved
+            return saved
+
+        def decompress(self):
+            '''
+                Yield the rect and the image for each of the tiles, or the
+                colour of tiles that are a single colour
+
+                Yields:
+                    (tuple)
+            '''
+            for rect, bytesPerLine, data in self.tiles:
+                if isinstance(data, (int, QImage)):
+                    yield rect, data
+                    continue
+                image = QImage(zlib.decompress(data), rect.width(),
+                               rect.height(), bytesPerLine, self.format)
+                yield rect, image.copy()
+
+        def getRect(self):
+            '''
+                The bounding rectangle of all the tiles in the delta
+
+                Returns:
+                    (QRect)
+            '''
+            rect = QRect()
+            for tile in self.tiles:
+                rect = rect.united(tile[0])
+            return rect
+
+        def isEmpty(self):
+            '''
+                Check to see if the delta has recorded anything
+
+                Returns:
+                    (bool)
+            '''
+            return not self.tiles and not self.pending
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.current = None
+        self.previous = deque()
+        self.undone = deque()
+
+    def begin(self, image):
+        '''
+            Start recording a new change to the image
+
+            Args:
+                image (TiledImage): The image that will be changed
+        '''
+        self.commit()
+        self.current = History.Delta(image)
+
+    def record(self, image, rect):
+        '''
+            Preserve the tiles of the image under rect before they are drawn
+            on, tiles already preserved by this change are skipped
+
+            Args:
+                image (TiledImage): The image about to be changed
+                rect  (QRect):  The region about to be changed
+        '''
+        if self.current is None:
+            return
+        rect = rect.intersected(image.rect())
+        if not rect.isEmpty():
+            self.current.record(rect)
+
+    def commit(self):
+        '''
+            Finish recording the current change, compressing it into the
+            history and dropping the oldest changes that exceed the budget
+
+            Returns:
+                (bool): Whether there was a change to commit
+        '''
+        delta, self.current = self.current, None
+        if delta is None or delta.isEmpty():
+            return False
+        delta.compress(len(delta.pending) <= self.BACKGROUND_TILES)
+        # A new change starts a new branch, what was undone can't be redone
+        self.drop(self.undone)
+        self.push(self.previous, delta)
+        return True
+
+    def push(self, stack, delta):
+        '''
+            Add a delta to the undo or redo stack, compressing any tiles the
+            delta before it kept as they are in the background, and drop the
+            oldest changes that exceed the budget, undos first
+
+            Args:
+                stack (deque):         The stack to add to
+                delta (History.Delta): The delta
+        '''
+        stack.append(delta)
+        self.resize(delta.size)
+        # The latest change stays as it is, so undoing it straight away
+        # doesn't wait on it being decompressed
+        if len(stack) > 1:
+            self.compressLater(stack[-2])
+        self.budget.reclaim()
+
+    def compressLater(self, delta):
+        '''
+            Compress the tiles a delta kept as they are on the compression
+            thread
+
+            Args:
+                delta (History.Delta): The delta
+        '''
+        if not delta.getUncompressed():
+            return
+        worker = CompressWorker(delta)
+        CompressWorker.running.add(worker)
+        worker.signals.finished.connect(self.compressed)
+        worker.signals.finished.connect(
+            lambda _: CompressWorker.running.discard(worker))
+        worker.signals.failed.connect(
+            lambda _: CompressWorker.running.discard(worker))
+        CompressWorker.pool.start(worker)
+
+    def compressed(self, result):
+        '''
+            Take in the tiles compressed on the compression thread, the
+            history shrinks by what was saved if the delta is still in it
+
+            Args:
+                result (tuple): A weak reference to the delta and the
+                                (index, bytes) of each of its tiles
+        '''
+        delta, tiles = result[0](), result[1]
+        if delta is None:
+            return
+        saved = sum(delta.setCompressed(index, data) for index, data in tiles)
+        if any(delta is kept for kept in self.previous) or any(
+                delta is kept for kept in self.undone):
+            self.resize(-saved)
+
+    def release(self):
+        '''
+            Drop the oldest change when the budget is over, undos first
+
+            Returns:
+                (bool): False if there was nothing to drop
+        '''
+        oldest = self.previous if self.previous else self.undone
+        if not oldest:
+            return False
+        self.resize(-oldest.popleft().size)
+        return True
+
+    def drop(self, stack):
+        '''
+            Empty the undo or redo stack
+
+            Args:
+                stack (deque): The stack to empty
+        '''
+        self.resize(-sum(delta.size for delta in stack))
+        stack.clear()
+
+    def resize(self, amount: int):
+        '''
+            Account for a change in the size of the history
+
+            Args:
+                amount (int): The change in bytes
+        '''
+        self.size += amount
+        self.budget.charge(self, amount)
+
+    def undo(self):
+        '''
+            Revert the last change, in the image it was made to
+
+            Returns:
+                (QRect): The region that was reverted
+        '''
+        self.commit()
+        return self.swap(self.previous, self.undone)
+
+    def redo(self):
+        '''
+            Make the last change that was undone again
+
+            Returns:
+                (QRect): The region that was changed
+        '''
+        self.commit()
+        return self.swap(self.undone, self.previous)
+
+    def swap(self, source, target):
+        '''
+            Pop a delta from one stack and paste it into its image, pushing
+            the tiles it replaces on to the other
+
+            Args:
+                source (deque): The stack to take the delta from
+                target (deque): The stack for the replaced tiles
+
+            Returns:
+                (QRect): The region that was pasted
+        '''
+        if not source:
+            return QRect()
+        delta = source.pop()
+        self.resize(-delta.size)
+        image = delta.image
+        inverse = History.Delta(image)
+        # Each run of tiles along a row is recorded in one go
+        run = QRect()
+        for rect in sorted((tile[0] for tile in delta.tiles),
+                           key=lambda rect: (rect.top(), rect.left())):
+            if rect.top() == run.top() and rect.left() == run.right() + 1:
+                run = run.united(rect)
+                continue
+            if not run.isEmpty():
+                inverse.record(run)
+            run = rect
+        if not run.isEmpty():
+            inverse.record(run)
+        inverse.compress(len(inverse.pending) <= self.BACKGROUND_TILES)
+        self.paste(image, delta.decompress())
+        self.push(target, inverse)
+        return delta.getRect()
+
+    def paste(self, image, tiles):
+        '''
+            Write tiles back into the image, runs of tiles of one colour
+            along a row are filled in one go
+
+            Args:
+                image (TiledImage): The image to write to
+                tiles (iterable):   Pairs of rect and image, or colour, to
+                                    write
+        '''
+        run, colour = QRect(), None
+        for rect, tile in sorted(tiles,
+                                 key=lambda tile: (tile[0].top(),
+                                                   tile[0].left())):
+            if not isinstance(tile, int):
+                image.paste(rect.topLeft(), tile)
+                continue
+            if (tile == colour and rect.top() == run.top()
+                    and rect.height() == run.height()
+                    and rect.left() == run.right() + 1):
+                run = run.united(rect)
+                continue
+            if not run.isEmpty():
+                image.fillRect(run, colour)
+            run, colour = rect, tile
+        if not run.isEmpty():
+            image.fillRect(run, colour)
+
+    def forget(self, image):
+        '''
+            Forget the changes made to an image, e.g. a layer that has been
+            removed. Changes to other images don't depend on them
+
+            Args:
+                image (TiledImage): The image
+        '''
+        if self.current is not None and self.current.image is image:
+            self.current = None
+        for stack in (self.previous, self.undone):
+            kept = [delta for delta in stack if delta.image is not image]
+            self.resize(-sum(delta.size for delta in stack) +
+                        sum(delta.size for delta in kept))
+            stack.clear()
+            stack.extend(kept)
+
+    def clear(self):
+        '''
+            Forget all of the recorded changes
+        '''
+        self.current = None
+        self.previous.clear()
+        self.undone.clear()
+        self.resize(-self.size)
+
+    def close(self):
+        '''
+            Forget all of the recorded changes and leave the budget
+        '''
+        self.clear()
+        self.budget.remove(self)
+
+    def isEmpty(self):
+        '''
+            Check to see if there are any changes to undo
+
+            Returns:
+                (bool)
+        '''
+        return not self.previous and (self.current is None
+                                      or self.current.isEmpty())
+
+    def isRedoEmpty(self):
+        '''
+            Check to see if there are any changes to redo
+
+            Returns:
+                (bool)
+        '''
+        return not self.undone
+
+    def getSize(self):
+        '''
+            The size of the history in bytes, tiles waiting to be compressed
+            count at their full size
+
+            Returns:
+                (int)
+        '''
+        return self.size
@@ -0,0 +1,350 @@
+'''
+    Layer Stack
+    The layers of a canvas and a cached composite of them
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+from app.lib.constants import Constants
+from .tiled_image import TiledImage
+from PyQt5.QtCore import QPoint, QRect, QRectF, Qt
+from PyQt5.QtGui import QImage, QPainter, QRegion
+
+
+class LayerStack:
+    '''
+        The layers of a canvas, bottom first. The bottom layer is the opaque
+        background, layers added over it start transparent. Each layer has
+        its own tiled image, opacity, blend mode and visibility
+
+        The layers are composited in to a cached image for display. Changes
+        to a layer mark the region they cover as dirty, and only the dirty
+        region is composited again when the composite is next asked for.
+        While the background is the only layer showing it is shown as it is,
+        without a composite
+
+        Args:
+            size       (QSize):        The size of the layers
+            budget     (MemoryBudget): The budget for resident tiles
+            background (TiledImage):   The bottom layer's image, a blank one
+                                       if not given
+    '''
+    class Layer:
+        '''
+            A layer of the canvas
+
+            Args:
+                image     (TiledImage):            The pixels of the layer
+                name      (str):                   The name of the layer
+                opacity   (float):                 From 0 to 1
+                blendMode (Constants.BlendModes):  How it blends with the
+                                                   layers below
+                visible   (bool):                  Whether it is shown
+                id        (int):                   Identifies the layer in
+                                                   the stroke log, see
+                                                   StrokeLog
+
+            Its chunks are where its tiles are in the project the canvas was
+            opened from or last saved to, see ProjectFile
+        '''
+        def __init__(self,
+                     image,
+                     name: str,
+                     opacity: float = 1.0,
+                     blendMode=Constants.BlendModes.NORMAL,
+                     visible: bool = True,
+                     id: int = 0):
+            self.image = image
+            self.name = name
+            self.opacity = opacity
+            self.blendMode = blendMode
+            self.visible = visible
+            self.id = id
+            self.chunks = {}
+
+        def isPlain(self):
+            '''
+                Check to see if the layer is shown as it is, at full opacity
+                and drawn over what is below
+
+                Returns:
+                    (bool)
+            '''
+            return (self.visible and self.opacity >= 1
+                    and self.blendMode == Constants.BlendModes.NORMAL)
+
+        def paint(self, painter, rect):
+            '''
+                Blend a region of the layer on to what a painter has drawn
+
+                Args:
+                    painter (QPainter): The painter, in canvas coordinates
+                    rect    (QRect):    The region to blend
+            '''
+            painter.setOpacity(self.opacity)
+            painter.setCompositionMode(self.blendMode.value)
+            self.image.paint(painter, QRectF(rect), QRectF(rect))
+
+        def snapshot(self, deep=False):
+            '''
+                A copy of the layer that is unaffected by later changes
+
+                Args:
+                    deep (bool): Copy the tiles now, see TiledImage.snapshot
+
+                Returns:
+                    (LayerStack.Layer)
+            '''
+            return LayerStack.Layer(self.image.snapshot(deep), self.name,
+                                    self.opacity, self.blendMode,
+                                    self.visible, self.id)
+
+    def __init__(self, size, budget=None, background=None):
+        self.imageSize = size
+        self.budget = budget
+        self.layers = [
+            LayerStack.Layer(background or TiledImage(size, budget=budget),
+                             'Background')
+        ]
+        self.created = 0
+        self.composite = None
+        self.dirty = QRegion()
+
+    def __len__(self):
+        return len(self.layers)
+
+    def __getitem__(self, index: int):
+        return self.layers[index]
+
+    def __iter__(self):
+        return iter(self.layers)
+
+    def createLayer(self, name=None):
+        '''
+            Create a transparent layer the size of the stack, it isn't added
+
+            Args:
+                name (str): The name of the layer, numbered if not given
+
+            Returns:
+                (LayerStack.Layer)
+        '''
+        self.created += 1
+        image = TiledImage(self.imageSize, Qt.transparent,
+                           QImage.Format_ARGB32_Premultiplied, self.budget)
+        return LayerStack.Layer(image,
+                                name or "Layer %d" % (self.created),
+                                id=self.created)
+
+    def getIndex(self, id: int):
+        '''
+            The position of a layer in the stack
+
+            Args:
+                id (int): The id of the layer
+
+            Returns:
+                (int)
+
+            Throws:
+                ValueError : No layer has the id
+        '''
+        for index, layer in enumerate(self.layers):
+            if layer.id == id:
+                return index
+        raise ValueError("There is no layer %d" % (id))
+
+    def insert(self, index: int, layer):
+        '''
+            Add a layer at a position in the stack
+
+            Args:
+                index (int):              The position, 0 is the bottom
+                layer (LayerStack.Layer): The layer
+        '''
+        self.layers.insert(index, layer)
+        self.invalidate(layer.image.getBounds())
+
+    def remove(self, index: int):
+        '''
+            Take a layer out of the stack, it is up to the caller to close
+            its image
+
+            Args:
+                index (int): The position of the layer
+
+            Returns:
+                (LayerStack.Layer)
+        '''
+        layer = self.layers.pop(index)
+        self.invalidate(layer.image.getBounds())
+        return layer
+
+    def invalidate(self, rect):
+        '''
+            Mark a region of the composite as out of date
+
+            Args:
+                rect (QRect): The region in canvas coordinates
+        '''
+        if self.composite is not None:
+            self.dirty += rect
+
+    def getPlainImage(self):
+        '''
+            The background's image, if the composite would be nothing more
+            than that
+
+            Returns:
+                (TiledImage): None if other layers are showing
+        '''
+        visible = [layer for layer in self.layers if layer.visible]
+        if visible == self.layers[:1] and visible[0].isPlain():
+            return visible[0].image
+        return None
+
+    def getComposite(self):
+        '''
+            The image of the layers composited together, the dirty region is
+            composited before it is returned
+
+            Returns:
+                (TiledImage)
+        '''
+        image = self.getPlainImage()
+        if image is not None:
+            self.releaseComposite()
+            return image
+        if self.composite is None:
+            self.composite = TiledImage(self.imageSize, budget=self.budget)
+            self.dirty = QRegion(self.composite.rect())
+        for rect in self.dirty.rects():
+            self.recomposite(rect)
+        self.dirty = QRegion()
+        return self.composite
+
+    def recomposite(self, rect):
+        '''
+            Composite a region of the layers in to the cached composite
+
+            Args:
+                rect (QRect): The region in canvas coordinates
+        '''
+        composite = self.composite
+        for key in composite.getKeys(rect):
+            part = composite.getTileRect(key).intersected(rect)
+            painter = composite.getPainter(key)
+            painter.setClipRect(part)
+            self.paint(painter, part)
+            composite.endPainter(key, painter)
+
+    def paint(self, painter, rect):
+        '''
+            Composite a region of the layers with a painter, over the
+            background colour
+
+            Args:
+                painter (QPainter): The painter, in canvas coordinates
+                rect    (QRect):    The region to composite
+        '''
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        painter.fillRect(rect, self.layers[0].image.fill)
+        for layer in self.layers:
+            if layer.visible and layer.opacity > 0:
+                layer.paint(painter, rect)
+
+    def preview(self, size, index: int, image):
+        '''
+            Composite the layers scaled down to a size, with the image of one
+            layer swapped for another, e.g. an effect applied to it. This
+            doesn't touch the composite
+
+            Args:
+                size  (QSize):  The size to composite at
+                index (int):    The position of the layer to swap
+                image (QImage): What to show for the layer, at the size
+
+            Returns:
+                (QImage)
+        '''
+        preview = QImage(size, QImage.Format_RGB32)
+        target = QRectF(preview.rect())
+        source = QRectF(QRect(QPoint(), self.imageSize))
+        painter = QPainter(preview)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        painter.fillRect(preview.rect(), self.layers[0].image.fill)
+        for position, layer in enumerate(self.layers):
+            if not layer.visible or layer.opacity <= 0:
+                continue
+            painter.setOpacity(layer.opacity)
+            painter.setCompositionMode(layer.blendMode.value)
+            if position == index:
+                painter.drawImage(target, image)
+            else:
+                layer.image.paint(painter, target, source)
+        painter.end()
+        return preview
+
+    def releaseComposite(self):
+        '''
+            Drop the cached composite, it is made again when next asked for
+        '''
+        if self.composite is not None:
+            self.composite.close()
+            self.composite = None
+        self.dirty = QRegion()
+
+    def snapshot(self, deep=False):
+        '''
+            A copy of the stack that is unaffected by later changes, without
+            the composite
+
+            Args:
+                deep (bool): Copy the tiles now, see TiledImage.snapshot
+
+            Returns:
+                (LayerStack)
+        '''
+        layers = [layer.snapshot(deep) for layer in self.layers]
+        snapshot = LayerStack(self.imageSize, background=layers[0].image)
+        snapshot.layers = layers
+        return snapshot
+
+    def toImage(self):
+        '''
+            Flatten the layers in to a single image, this doesn't touch the
+            composite so it can be done in the background on a snapshot
+
+            Returns:
+                (QImage)
+        '''
+        image = self.getPlainImage()
+        if image is not None:
+            return image.toImage()
+        image = QImage(self.imageSize, QImage.Format_RGB32)
+        painter = QPainter(image)
+        self.paint(painter, image.rect())
+        painter.end()
+        return image
+
+    def getAllocatedSize(self):
+        '''
+            The memory used by the tiles of the layers and the composite in
+            bytes
+
+            Returns:
+                (int)
+        '''
+        size = sum(layer.image.getAllocatedSize() for layer in self.layers)
+        if self.composite is not None:
+            size += self.composite.getAllocatedSize()
+        return size
+
+    def close(self):
+        '''
+            Release the tiles of the layers and the composite
+        '''
+        self.releaseComposite()
+        for layer in self.layers:
+            layer.image.close()
@@ -0,0 +1,80 @@
+'''
+    Memory Budget
+    A limit on memory shared between the open documents
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+from collections import OrderedDict
+
+
+class MemoryBudget:
+    '''
+        Tracks the memory taken by a number of users, e.g. the undo
+        histories of every open document, against one limit. When the total
+        goes over, the least recently used users are asked to release memory
+        first, so the document being worked on keeps its memory the longest
+
+        A user charges the budget as it takes and gives back memory, and
+        implements release() to give back some memory when asked, returning
+        False once it has nothing left to give
+
+        Args:
+            limit (int): The most memory the users can take, in bytes
+    '''
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = 0
+        self.users = OrderedDict()
+
+    def charge(self, user, amount: int):
+        '''
+            Account for memory taken by a user, or given back if negative.
+            Taking memory counts as using the budget
+
+            Args:
+                user   (object): The user
+                amount (int):    The change in bytes
+        '''
+        self.size += amount
+        if amount > 0:
+            self.touch(user)
+
+    def touch(self, user):
+        '''
+            Mark a user as the most recently used
+
+            Args:
+                user (object): The user
+        '''
+        self.users[user] = None
+        self.users.move_to_end(user)
+
+    def reclaim(self):
+        '''
+            Ask users to release memory, least recently used first, until
+            the total is within the limit
+        '''
+        for user in list(self.users):
+            while self.size > self.limit and user.release():
+                pass
+            if self.size <= self.limit:
+                return
+
+    def remove(self, user):
+        '''
+            Stop tracking a user, it should have given back its memory
+
+            Args:
+                user (object): The user
+        '''
+        self.users.pop(user, None)
+
+    def getSize(self):
+        '''
+            The memory taken by all of the users in bytes
+
+            Returns:
+                (int)
+        '''
+        return self.size
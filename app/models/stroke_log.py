@@ -0,0 +1,633 @@
+'''
+    Stroke Log
+    A compact record of what was drawn on a canvas, that can be replayed
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import json
+import struct
+import time
+import zlib
+from array import array
+
+from app.lib.constants import Constants
+from app.lib.effects import EFFECTS
+from app.lib.pixels import Pixels
+from PyQt5.QtCore import QPoint, QPointF, QSize, Qt
+from PyQt5.QtGui import QColor, QPen, QPolygon, QPolygonF
+
+
+class StrokeLog:
+    '''
+        Records every change to a canvas as an event rather than as pixels:
+        the points of each stroke in arrays, with the pen that drew them and
+        when each point arrived, fills, effects and changes to the layers.
+        Pixels that came from elsewhere, e.g. an opened image, are kept as
+        keyframes. Replaying the events in order on a blank canvas renders
+        the document again at any scale, see Canvas.fromLog
+
+        The events between a snapshot of the canvas and the next are grouped
+        in to a step, which lines up with a change in the undo history, so a
+        step that is undone is left out of a replay. Changes to the layers
+        themselves aren't undoable and sit between the steps
+
+        Args:
+            size (QSize): The size of the canvas
+    '''
+    # The length of the JSON that precedes the arrays in toBytes
+    HEADER = struct.Struct('<I')
+
+    class Event:
+        '''
+            Something that happened to a layer of the canvas
+
+            Args:
+                layer (int): The id of the layer, see LayerStack.Layer
+        '''
+        def __init__(self, layer: int):
+            self.layer = layer
+
+        def getSize(self):
+            '''
+                The memory used by the event's arrays in bytes
+
+                Returns:
+                    (int)
+            '''
+            return 0
+
+        def replay(self, canvas, scale: float):
+            '''
+                Make the change again on a canvas
+
+                Args:
+                    canvas (Canvas): The canvas, scale times the size of the
+                                     one that was recorded
+                    scale  (float):  The scale to replay at
+            '''
+            raise NotImplementedError
+
+        def toDict(self, store):
+            '''
+                Describe the event for toBytes
+
+                Args:
+                    store (callable): Takes an array and returns where it is
+                                      stored
+
+                Returns:
+                    (dict)
+            '''
+            raise NotImplementedError
+
+    class Stroke(Event):
+        '''
+            A stroke of the brush, as the runs of points that were drawn in
+            one go, see Canvas.drawSegment. The points are held in one array
+            with the index each run ends at, and the time each point arrived
+            in milliseconds from the start of the stroke
+
+            Args:
+                layer (int):   The id of the layer
+                pen   (tuple): The pen, see getPenKey
+                start (float): When the stroke started, in seconds from the
+                               start of the log
+        '''
+        def __init__(self, layer: int, pen, start: float):
+            super().__init__(layer)
+            self.pen = tuple(pen)
+            self.start = start
+            self.points = array('i')
+            self.ends = array('I')
+            self.times = array('f')
+
+        @staticmethod
+        def getPenKey(pen):
+            '''
+                The parameters of a pen, the colour, width, line, cap and
+                join
+
+                Args:
+                    pen (QPen): The pen
+
+                Returns:
+                    (tuple)
+            '''
+            return (pen.color().rgba(), pen.widthF(), int(pen.style()),
+                    int(pen.capStyle()), int(pen.joinStyle()))
+
+        def getPen(self, scale: float = 1.0):
+            '''
+                The pen the stroke was drawn with
+
+                Args:
+                    scale (float): Scales the width of the pen
+
+                Returns:
+                    (QPen)
+            '''
+            colour, width, line, cap, join = self.pen
+            return QPen(QColor.fromRgba(colour), width * scale,
+                        Qt.PenStyle(line), Qt.PenCapStyle(cap),
+                        Qt.PenJoinStyle(join))
+
+        def getLastPoint(self):
+            '''
+                The point the stroke has got to
+
+                Returns:
+                    (QPoint)
+            '''
+            return QPoint(self.points[-2], self.points[-1])
+
+        def addSegment(self, polygon, times):
+            '''
+                Add a run of points that were drawn in one go
+
+                Args:
+                    polygon (QPolygon): The points
+                    times   (list):     When each point arrived, in seconds
+                                        from the start of the log
+            '''
+            for point in polygon:
+                self.points.extend((round(point.x()), round(point.y())))
+            self.times.extend((moment - self.start) * 1000 for moment in times)
+            self.ends.append(len(self.points) // 2)
+
+        def getSegments(self, scale: float = 1.0):
+            '''
+                Yield the runs of points, as they were drawn at a scale of
+                one and in between pixels otherwise
+
+                Args:
+                    scale (float): Scales the points
+
+                Yields:
+                    (QPolygon or QPolygonF)
+            '''
+            start = 0
+            for end in self.ends:
+                values = self.points[start * 2:end * 2]
+                if scale == 1:
+                    yield QPolygon(list(values))
+                else:
+                    yield QPolygonF([
+                        QPointF(values[i] * scale, values[i + 1] * scale)
+                        for i in range(0, len(values), 2)
+                    ])
+                start = end
+
+        def getTimes(self):
+            '''
+                Yield when the last point of each run arrived, to replay the
+                stroke at the pace it was drawn
+
+                Yields:
+                    (float): Seconds from the start of the log
+            '''
+            for end in self.ends:
+                yield self.start + self.times[end - 1] / 1000
+
+        def getSize(self):
+            return sum(values.itemsize * len(values)
+                       for values in (self.points, self.ends, self.times))
+
+        def replay(self, canvas, scale: float):
+            canvas.setActiveLayer(canvas.getLayers().getIndex(self.layer))
+            pen = self.getPen(scale)
+            for polygon in self.getSegments(scale):
+                canvas.drawSegment(polygon, pen)
+
+        def toDict(self, store):
+            return {
+                'type': 'stroke',
+                'layer': self.layer,
+                'pen': list(self.pen),
+                'start': self.start,
+                'points': store(self.points),
+                'ends': store(self.ends),
+                'times': store(self.times)
+            }
+
+    class Fill(Event):
+        '''
+            A flood fill
+
+            Args:
+                layer     (int):    The id of the layer
+                point     (QPoint): The point filled from
+                colour    (int):    The colour as 0xAARRGGBB
+                tolerance (int):    How far each channel could be from the
+                                    point's
+        '''
+        def __init__(self, layer: int, point, colour: int, tolerance: int):
+            super().__init__(layer)
+            self.point = QPoint(point)
+            self.colour = colour
+            self.tolerance = tolerance
+
+        def replay(self, canvas, scale: float):
+            canvas.setActiveLayer(canvas.getLayers().getIndex(self.layer))
+            canvas.floodFill(self.point * scale, QColor.fromRgba(self.colour),
+                             self.tolerance)
+
+        def toDict(self, store):
+            return {
+                'type': 'fill',
+                'layer': self.layer,
+                'point': [self.point.x(), self.point.y()],
+                'colour': self.colour,
+                'tolerance': self.tolerance
+            }
+
+    class Effect(Event):
+        '''
+            An effect applied to the whole layer
+
+            Args:
+                layer  (int):    The id of the layer
+                effect (Effect): The effect
+        '''
+        def __init__(self, layer: int, effect):
+            super().__init__(layer)
+            self.effect = effect
+
+        def replay(self, canvas, scale: float):
+            canvas.setActiveLayer(canvas.getLayers().getIndex(self.layer))
+            # A fresh copy, an effect keeps what it learnt in prepare
+            effect = type(self.effect)(**self.effect.getParameters())
+            effect = effect.scaled(scale)
+            array = canvas.getArray()
+            effect.prepare(array)
+            # The canvas's log gets its own event, logs don't share events
+            canvas.setArray(effect.apply(array), QPoint(),
+                            StrokeLog.Effect(canvas.getLayerId(), effect))
+
+        def toDict(self, store):
+            return {
+                'type': 'effect',
+                'layer': self.layer,
+                'effect': self.effect.name,
+                'parameters': self.effect.getParameters()
+            }
+
+    class Keyframe(Event):
+        '''
+            Pixels written to a layer that can't be made again from events,
+            the image is shared with the layer's tiles until they are drawn
+            on. Its chunks are where its tiles are in the project the canvas
+            was opened from or last saved to, see ProjectFile
+
+            Args:
+                layer (int):        The id of the layer
+                point (QPoint):     Where the image was written
+                image (TiledImage): The pixels
+        '''
+        def __init__(self, layer: int, point, image):
+            super().__init__(layer)
+            self.point = QPoint(point)
+            self.image = image
+            self.chunks = {}
+
+        def replay(self, canvas, scale: float):
+            canvas.setActiveLayer(canvas.getLayers().getIndex(self.layer))
+            if scale == 1:
+                image = self.image.toImage()
+            else:
+                image = self.image.scaled(self.image.size() * scale)
+            # The canvas keyframes its own copy, closing its log releases
+            # only that and never the tiles of this keyframe
+            canvas.setArray(Pixels.view(image), self.point * scale)
+
+        def toDict(self, store):
+            return {
+                'type': 'keyframe',
+                'layer': self.layer,
+                'point': [self.point.x(), self.point.y()]
+            }
+
+    class Arrange(Event):
+        '''
+            A change to a layer itself
+
+            Args:
+                layer  (int):    The id of the layer
+                action (str):    add, remove, visible, opacity or blendMode
+                value  (object): For add the position and name of the
+                                 layer, otherwise the new value of the
+                                 property
+        '''
+        def __init__(self, layer: int, action: str, value=None):
+            super().__init__(layer)
+            self.action = action
+            self.value = value
+
+        def replay(self, canvas, scale: float):
+            if self.action == 'add':
+                index, name = self.value
+                canvas.setActiveLayer(index - 1)
+                canvas.addLayer(name)
+                return
+            index = canvas.getLayers().getIndex(self.layer)
+            if self.action == 'remove':
+                canvas.removeLayer(index)
+            elif self.action == 'visible':
+                canvas.setLayerVisible(index, self.value)
+            elif self.action == 'opacity':
+                canvas.setLayerOpacity(index, self.value)
+            elif self.action == 'blendMode':
+                canvas.setLayerBlendMode(index, self.value)
+
+        def toDict(self, store):
+            value = self.value
+            if self.action == 'blendMode':
+                value = value.name
+            return {
+                'type': 'arrange',
+                'layer': self.layer,
+                'action': self.action,
+                'value': value
+            }
+
+    class Step:
+        '''
+            The events of a single change that can be undone
+
+            Args:
+                layer (int): The id of the layer that was changed
+        '''
+        def __init__(self, layer: int):
+            self.layer = layer
+            self.events = []
+            self.undone = False
+
+    def __init__(self, size):
+        self.size = QSize(size)
+        self.entries = []
+        self.current = None
+        self.undone = []
+        self.origin = time.perf_counter()
+
+    def __iter__(self):
+        '''
+            The events to replay, in order, leaving out undone steps
+        '''
+        for entry in self.entries:
+            if isinstance(entry, StrokeLog.Step):
+                if not entry.undone:
+                    yield from entry.events
+            else:
+                yield entry
+
+    def getTime(self):
+        '''
+            The time since the log started
+
+            Returns:
+                (float): Seconds
+        '''
+        return time.perf_counter() - self.origin
+
+    def begin(self, layer: int):
+        '''
+            Start recording a step, the last should have been committed
+
+            Args:
+                layer (int): The id of the layer that will be changed
+        '''
+        self.current = StrokeLog.Step(layer)
+
+    def add(self, event):
+        '''
+            Add an event to the current step, or on its own if there isn't
+            one, e.g. while replaying
+
+            Args:
+                event (StrokeLog.Event): The event
+        '''
+        if self.current is not None:
+            self.current.events.append(event)
+        else:
+            self.entries.append(event)
+
+    def record(self, event):
+        '''
+            Add an event that can't be undone, outside of any step
+
+            Args:
+                event (StrokeLog.Event): The event
+        '''
+        self.entries.append(event)
+
+    def addSegment(self, layer: int, pen, polygon, times=None):
+        '''
+            Add a run of points drawn in one go, on to the end of the last
+            stroke if it carries on from it, otherwise as a new stroke
+
+            Args:
+                layer   (int):      The id of the layer
+                pen     (QPen):     The pen it was drawn with
+                polygon (QPolygon): The points
+                times   (list):     When each point arrived, in seconds from
+                                    the start of the log, now if not given
+        '''
+        if times is None:
+            times = [self.getTime()] * len(polygon)
+        events = self.current.events if self.current else self.entries
+        key = StrokeLog.Stroke.getPenKey(pen)
+        stroke = events[-1] if events else None
+        if not (isinstance(stroke, StrokeLog.Stroke) and stroke.layer == layer
+                and stroke.pen == key
+                and stroke.getLastPoint() == polygon[0]):
+            stroke = StrokeLog.Stroke(layer, key, times[0])
+            self.add(stroke)
+        stroke.addSegment(polygon, times)
+
+    def commit(self, changed: bool):
+        '''
+            Finish recording the current step
+
+            Args:
+                changed (bool): Whether the history recorded the change, the
+                                step is dropped if it didn't
+        '''
+        step, self.current = self.current, None
+        if step is None or not changed:
+            return
+        # A new change starts a new branch, what was undone can't be redone
+        self.entries = [
+            entry for entry in self.entries
+            if not isinstance(entry, StrokeLog.Step) or not entry.undone
+        ]
+        self.undone = []
+        self.entries.append(step)
+
+    def undo(self):
+        '''
+            Leave the last step out of replays
+        '''
+        for entry in reversed(self.entries):
+            if isinstance(entry, StrokeLog.Step) and not entry.undone:
+                entry.undone = True
+                self.undone.append(entry)
+                return
+
+    def redo(self):
+        '''
+            Put the last step that was undone back in to replays
+        '''
+        if self.undone:
+            self.undone.pop().undone = False
+
+    def forget(self, layer: int):
+        '''
+            Drop the steps that changed a layer, e.g. a layer that has been
+            removed, along with the changes in the history
+
+            Args:
+                layer (int): The id of the layer
+        '''
+        if self.current is not None and self.current.layer == layer:
+            self.current = None
+        self.entries = [
+            entry for entry in self.entries
+            if not isinstance(entry, StrokeLog.Step) or entry.layer != layer
+        ]
+        self.undone = [step for step in self.undone if step.layer != layer]
+
+    def getKeyframes(self):
+        '''
+            The keyframes to replay, in order
+
+            Returns:
+                (list): StrokeLog.Keyframe
+        '''
+        return [
+            event for event in self if isinstance(event, StrokeLog.Keyframe)
+        ]
+
+    def getSize(self):
+        '''
+            The memory used by the arrays of the events in bytes, keyframes
+            are counted with the tiles
+
+            Returns:
+                (int)
+        '''
+        return sum(event.getSize() for event in self)
+
+    def toBytes(self):
+        '''
+            Compress the events to replay, see fromBytes. The arrays are
+            stored after a JSON description of the events. The pixels of the
+            keyframes aren't included, they are saved as tiles
+
+            Returns:
+                (bytes)
+        '''
+        data = bytearray()
+
+        def store(values):
+            offset = len(data)
+            data.extend(values.tobytes())
+            return [values.typecode, offset, len(values)]
+
+        entries = []
+        for entry in self.entries:
+            if not isinstance(entry, StrokeLog.Step):
+                entries.append(entry.toDict(store))
+            elif not entry.undone:
+                entries.append({
+                    'type': 'step',
+                    'layer': entry.layer,
+                    'events': [event.toDict(store) for event in entry.events]
+                })
+        description = json.dumps({
+            'width': self.size.width(),
+            'height': self.size.height(),
+            'entries': entries
+        }).encode()
+        return zlib.compress(
+            self.HEADER.pack(len(description)) + description + data, 1)
+
+    @staticmethod
+    def fromBytes(data: bytes, keyframes):
+        '''
+            Make a log from what toBytes wrote
+
+            Args:
+                data      (bytes): The compressed events
+                keyframes (list):  The image of each keyframe, in order
+
+            Returns:
+                (StrokeLog)
+
+            Throws:
+                ValueError : The data is damaged
+        '''
+        try:
+            data = zlib.decompress(data)
+            length, = StrokeLog.HEADER.unpack_from(data)
+            description = json.loads(
+                data[StrokeLog.HEADER.size:StrokeLog.HEADER.size + length])
+        except (zlib.error, struct.error) as error:
+            raise ValueError(str(error))
+        data = data[StrokeLog.HEADER.size + length:]
+        keyframes = iter(keyframes)
+        effects = {effect.name: effect for effect in EFFECTS}
+
+        def load(stored):
+            typecode, offset, count = stored
+            values = array(typecode)
+            values.frombytes(data[offset:offset + count * values.itemsize])
+            return values
+
+        def toEvent(entry):
+            layer = entry['layer']
+            if entry['type'] == 'stroke':
+                event = StrokeLog.Stroke(layer, entry['pen'], entry['start'])
+                event.points = load(entry['points'])
+                event.ends = load(entry['ends'])
+                event.times = load(entry['times'])
+                return event
+            if entry['type'] == 'fill':
+                return StrokeLog.Fill(layer, QPoint(*entry['point']),
+                                      entry['colour'], entry['tolerance'])
+            if entry['type'] == 'effect':
+                return StrokeLog.Effect(
+                    layer, effects[entry['effect']](**entry['parameters']))
+            if entry['type'] == 'keyframe':
+                return StrokeLog.Keyframe(layer, QPoint(*entry['point']),
+                                          next(keyframes))
+            value = entry['value']
+            if entry['action'] == 'blendMode':
+                value = Constants.BlendModes[value]
+            return StrokeLog.Arrange(layer, entry['action'], value)
+
+        log = StrokeLog(QSize(description['width'], description['height']))
+        try:
+            for entry in description['entries']:
+                if entry['type'] == 'step':
+                    step = StrokeLog.Step(entry['layer'])
+                    step.events = [toEvent(event) for event in entry['events']]
+                    log.entries.append(step)
+                else:
+                    log.entries.append(toEvent(entry))
+        except (KeyError, StopIteration, TypeError) as error:
+            raise ValueError("The stroke log is damaged: %s" % (error))
+        return log
+
+    def close(self):
+        '''
+            Release the tiles of the keyframes
+        '''
+        for entry in self.entries:
+            events = entry.events if isinstance(entry,
+                                                StrokeLog.Step) else [entry]
+            for event in events:
+                if isinstance(event, StrokeLog.Keyframe):
+                    event.image.close()
+        self.entries = []
+        self.undone = []
+        self.current = None
@@ -0,0 +1,361 @@
+'''
+    Tile Store
+    A pixel store for tiles that spills to disk past a resident memory cap
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import ctypes
+import mmap
+import os
+import tempfile
+from collections import OrderedDict
+
+from app.lib.constants import Constants
+from .memory_budget import MemoryBudget
+from PyQt5 import sip
+from PyQt5.QtGui import QImage
+
+
+class TileStore:
+    '''
+        Holds tiles keyed by position. The most recently used tiles are kept
+        in memory, up to a cap, and the least recently used past that are
+        spilled to a memory mapped scratch file. A spilled tile is read back
+        as a QImage that wraps the mapped memory directly, without a copy.
+        The cap can be shared with other stores through a MemoryBudget
+
+        Tiles can also be left to a loader, e.g. those in a project file,
+        and are only loaded the first time they are asked for
+
+        Args:
+            width  (int):           The width of a tile
+            height (int):           The height of a tile
+            format (QImage.Format): The format of the tiles
+            budget (MemoryBudget):  The budget resident tiles count
+                                    against, Constants.TILE_MEMORY_CAP for
+                                    this store alone if not given
+    '''
+    SLOTS_PER_CHUNK = 64
+
+    def __init__(self,
+                 width: int,
+                 height: int,
+                 format,
+                 budget=None):
+        self.width = width
+        self.height = height
+        self.format = format
+        self.bytesPerLine = QImage(width, height, format).bytesPerLine()
+        self.tileBytes = self.bytesPerLine * height
+        self.budget = budget or MemoryBudget(Constants.TILE_MEMORY_CAP)
+        self.resident = OrderedDict()
+        self.anchors = {}
+        self.pinned = {}
+        self.slots = {}
+        self.free = []
+        self.chunks = []
+        self.file = None
+        self.loader = None
+        self.lazy = set()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.resident or key in self.slots or key in self.lazy
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, key):
+        image = self.get(key)
+        if image is None:
+            raise KeyError(key)
+        return image
+
+    def __setitem__(self, key, image):
+        self.set(key, image)
+
+    def keys(self):
+        '''
+            The keys of all the tiles, resident, spilled or yet to be loaded
+
+            Returns:
+                (set)
+        '''
+        return self.resident.keys() | self.slots.keys() | self.lazy
+
+    def setLoader(self, loader, keys):
+        '''
+            Leave tiles to be loaded when they are first asked for
+
+            Args:
+                loader (callable): Takes a key and returns the tile's QImage
+                keys   (iterable): The keys of the tiles it can load
+        '''
+        self.loader = loader
+        self.lazy = set(keys)
+
+    def get(self, key, default=None):
+        '''
+            Get a tile, reading it back from the scratch file if it was
+            spilled
+
+            Args:
+                key     (tuple):  The key of the tile
+                default (QImage): What to return if there is no such tile
+
+            Returns:
+                (QImage)
+        '''
+        if key in self.resident:
+            self.hits += 1
+            self.resident.move_to_end(key)
+            self.budget.touch(self)
+            return self.resident[key]
+        if key in self.lazy:
+            self.loads += 1
+            image = self.loader(key)
+            self.lazy.discard(key)
+        elif key in self.slots:
+            self.misses += 1
+            image = self.map(key)
+        else:
+            return default
+        self.resident[key] = image
+        self.budget.charge(self, self.tileBytes)
+        self.evict()
+        return image
+
+    def set(self, key, image):
+        '''
+            Store a tile, replacing any stored under the key
+
+            Args:
+                key   (tuple):  The key of the tile
+                image (QImage): The tile
+        '''
+        self.discard(key)
+        self.resident[key] = image
+        self.budget.charge(self, self.tileBytes)
+        self.evict()
+
+    def discard(self, key):
+        '''
+            Remove a tile, if there is one
+
+            Args:
+                key (tuple): The key of the tile
+        '''
+        if self.resident.pop(key, None) is not None:
+            self.budget.charge(self, -self.tileBytes)
+        self.anchors.pop(key, None)
+        self.lazy.discard(key)
+        if key in self.slots:
+            self.free.append(self.slots.pop(key))
+
+    def pin(self, key):
+        '''
+            Keep a tile resident, e.g. while a painter is active on it
+
+            Args:
+                key (tuple): The key of the tile
+        '''
+        self.pinned[key] = self.pinned.get(key, 0) + 1
+
+    def unpin(self, key):
+        '''
+            Allow a pinned tile to be spilled again
+
+            Args:
+                key (tuple): The key of the tile
+        '''
+        self.pinned[key] -= 1
+        if not self.pinned[key]:
+            del self.pinned[key]
+            self.evict()
+
+    def evict(self):
+        '''
+            Spill tiles until the budget is within its cap, from this store
+            or others sharing the budget that were used less recently
+        '''
+        self.budget.reclaim()
+
+    def release(self):
+        '''
+            Spill the least recently used tile that isn't pinned
+
+            Returns:
+                (bool): False if there was no tile to spill
+        '''
+        for key in self.resident:
+            if key not in self.pinned:
+                self.spill(key)
+                return True
+        return False
+
+    def spill(self, key):
+        '''
+            Move a tile out of memory, tiles that are already views of the
+            scratch file are just dropped
+
+            Args:
+                key (tuple): The key of the tile
+        '''
+        image = self.resident.pop(key)
+        self.budget.charge(self, -self.tileBytes)
+        self.evictions += 1
+        if key in self.anchors and int(
+                image.constBits()) == self.getAddress(self.slots[key]):
+            del self.anchors[key]
+            return
+        self.anchors.pop(key, None)
+        if key not in self.slots:
+            self.slots[key] = self.allocate()
+        chunk, offset = self.getLocation(self.slots[key])
+        data = image.constBits().asstring(self.tileBytes)
+        self.chunks[chunk][offset:offset + self.tileBytes] = data
+
+    def map(self, key):
+        '''
+            Wrap a spilled tile's memory in a QImage, without copying it
+
+            Args:
+                key (tuple): The key of the tile
+
+            Returns:
+                (QImage)
+        '''
+        chunk, offset = self.getLocation(self.slots[key])
+        # The anchor holds the mapping open for as long as the view exists
+        anchor = ctypes.c_char.from_buffer(self.chunks[chunk], offset)
+        self.anchors[key] = anchor
+        return QImage(sip.voidptr(ctypes.addressof(anchor)), self.width,
+                      self.height, self.bytesPerLine, self.format)
+
+    def allocate(self):
+        '''
+            Find a free slot in the scratch file, growing it if needed
+
+            Returns:
+                (int): The slot
+        '''
+        if not self.free:
+            if self.file is None:
+                self.file = tempfile.TemporaryFile(prefix='painter-tiles-')
+            size = self.SLOTS_PER_CHUNK * self.tileBytes
+            offset = len(self.chunks) * size
+            os.ftruncate(self.file.fileno(), offset + size)
+            self.chunks.append(
+                mmap.mmap(self.file.fileno(), size, offset=offset))
+            start = (len(self.chunks) - 1) * self.SLOTS_PER_CHUNK
+            self.free.extend(
+                reversed(range(start, start + self.SLOTS_PER_CHUNK)))
+        return self.free.pop()
+
+    def getLocation(self, slot: int):
+        '''
+            The chunk and offset in to it of a slot
+
+            Args:
+                slot (int): The slot
+
+            Returns:
+                (tuple)
+        '''
+        return (slot // self.SLOTS_PER_CHUNK,
+                slot % self.SLOTS_PER_CHUNK * self.tileBytes)
+
+    def getAddress(self, slot: int):
+        '''
+            The address in memory of a slot
+
+            Args:
+                slot (int): The slot
+
+            Returns:
+                (int)
+        '''
+        chunk, offset = self.getLocation(slot)
+        return ctypes.addressof(
+            ctypes.c_char.from_buffer(self.chunks[chunk], offset))
+
+    def snapshot(self, deep=False, keys=None):
+        '''
+            Copies of the tiles that are unaffected by later changes,
+            resident tiles share their data until either side is drawn on.
+            Tiles yet to be loaded are loaded
+
+            Args:
+                deep (bool):     Copy the resident tiles now, needed if a
+                                 painter is active on any of them
+                keys (iterable): The keys of the tiles, all of them if None
+
+            Returns:
+                (dict)
+        '''
+        tiles = {}
+        for key in self.keys() if keys is None else keys:
+            if key in self.lazy:
+                self.get(key)
+            if key in self.resident and key not in self.anchors:
+                image = self.resident[key]
+                tiles[key] = image.copy() if deep else QImage(image)
+                continue
+            chunk, offset = self.getLocation(self.slots[key])
+            data = self.chunks[chunk][offset:offset + self.tileBytes]
+            tiles[key] = QImage(data, self.width, self.height,
+                                self.bytesPerLine, self.format).copy()
+        return tiles
+
+    def getResidentSize(self):
+        '''
+            The memory used by resident tiles in bytes
+
+            Returns:
+                (int)
+        '''
+        return len(self.resident) * self.tileBytes
+
+    def getStats(self):
+        '''
+            Counters for how the store is being used
+
+            Returns:
+                (dict)
+        '''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'loads': self.loads,
+            'resident': len(self.resident),
+            'spilled': len(self.slots)
+        }
+
+    def close(self):
+        '''
+            Drop all of the tiles and remove the scratch file
+        '''
+        self.budget.charge(self, -self.getResidentSize())
+        self.budget.remove(self)
+        self.resident.clear()
+        self.anchors.clear()
+        self.pinned.clear()
+        self.slots.clear()
+        self.lazy.clear()
+        self.loader = None
+        self.free = []
+        for chunk in self.chunks:
+            try:
+                chunk.close()
+            except BufferError:
+                # A view is still held elsewhere, leave it to be collected
+                pass
+        self.chunks = []
+        if self.file is not None:
+            self.file.close()
+            self.file = None
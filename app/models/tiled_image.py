@@ -0,0 +1,444 @@
+'''
+    Tiled Image
+    An image stored as fixed size tiles, allocated as they are drawn on
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import numpy
+from app.lib.pixels import Pixels
+from .tile_store import TileStore
+from PyQt5.QtCore import QPoint, QRect, QRectF, QSize, Qt
+from PyQt5.QtGui import QImage, QPainter, QTransform
+
+
+class TiledImage:
+    '''
+        An image split in to square tiles. Tiles that have never been drawn on
+        are not allocated, they all share one tile filled with the background
+        colour, so memory follows the painted area rather than the size.
+        Allocated tiles are held in a TileStore, which spills them to disk
+        past its memory cap. The tiles written to are tracked, so a save can
+        write only what has changed since the last
+
+        Args:
+            size   (QSize):         The size of the image
+            fill   (QColor):        The background colour
+            format (QImage.Format): The format of the tiles
+            budget (MemoryBudget):  The budget for resident tiles, see
+                                    TileStore
+    '''
+    TILE_SIZE = 256
+
+    def __init__(self,
+                 size,
+                 fill=Qt.white,
+                 format=QImage.Format_RGB32,
+                 budget=None):
+        self.imageSize = QSize(size)
+        self.fill = fill
+        self.empty = QImage(self.TILE_SIZE, self.TILE_SIZE, format)
+        self.empty.fill(fill)
+        self.tiles = TileStore(self.TILE_SIZE, self.TILE_SIZE, format,
+                               budget)
+        self.edited = set()
+
+    def size(self):
+        '''
+            The size of the image
+
+            Returns:
+                (QSize)
+        '''
+        return QSize(self.imageSize)
+
+    def width(self):
+        '''
+            The width of the image
+
+            Returns:
+                (int)
+        '''
+        return self.imageSize.width()
+
+    def height(self):
+        '''
+            The height of the image
+
+            Returns:
+                (int)
+        '''
+        return self.imageSize.height()
+
+    def rect(self):
+        '''
+            The rectangle covering the image
+
+            Returns:
+                (QRect)
+        '''
+        return QRect(QPoint(), self.imageSize)
+
+    def format(self):
+        '''
+            The format of the tiles
+
+            Returns:
+                (QImage.Format)
+        '''
+        return self.empty.format()
+
+    def getKeys(self, rect):
+        '''
+            The keys of the tiles that a region intersects
+
+            Args:
+                rect (QRect): The region
+
+            Returns:
+                (list): (column, row) tuples
+        '''
+        rect = rect.intersected(self.rect())
+        if rect.isEmpty():
+            return []
+        size = self.TILE_SIZE
+        return [(x, y)
+                for y in range(rect.top() // size, rect.bottom() // size + 1)
+                for x in range(rect.left() // size, rect.right() // size + 1)]
+
+    def keys(self):
+        '''
+            The keys of the allocated tiles
+
+            Returns:
+                (set)
+        '''
+        return self.tiles.keys()
+
+    def getTileRect(self, key):
+        '''
+            The region of the image a tile covers
+
+            Args:
+                key (tuple): The (column, row) of the tile
+
+            Returns:
+                (QRect)
+        '''
+        return QRect(key[0] * self.TILE_SIZE, key[1] * self.TILE_SIZE,
+                     self.TILE_SIZE, self.TILE_SIZE)
+
+    def getTile(self, key):
+        '''
+            Get a tile to read from, the shared empty tile if it isn't
+            allocated
+
+            Args:
+                key (tuple): The (column, row) of the tile
+
+            Returns:
+                (QImage)
+        '''
+        return self.tiles.get(key, self.empty)
+
+    def getWritableTile(self, key):
+        '''
+            Get a tile to draw on, allocating it if needed
+
+            Args:
+                key (tuple): The (column, row) of the tile
+
+            Returns:
+                (QImage)
+        '''
+        if key not in self.tiles:
+            # Shares the empty tile's data until it is first painted on
+            self.tiles[key] = QImage(self.empty)
+        self.edited.add(key)
+        return self.tiles[key]
+
+    def getPainter(self, key):
+        '''
+            Begin a painter on a tile, translated so that it draws in image
+            coordinates. The tile is kept in memory until endPainter
+
+            Args:
+                key (tuple): The (column, row) of the tile
+
+            Returns:
+                (QPainter)
+        '''
+        self.tiles.pin(key)
+        painter = QPainter(self.getWritableTile(key))
+        painter.translate(-self.getTileRect(key).topLeft())
+        return painter
+
+    def endPainter(self, key, painter):
+        '''
+            End a painter begun with getPainter
+
+            Args:
+                key     (tuple):    The (column, row) of the tile
+                painter (QPainter): The painter
+        '''
+        painter.end()
+        self.tiles.unpin(key)
+
+    def painters(self, rect):
+        '''
+            Yield a painter, in image coordinates, for each of the tiles
+            a region intersects. Each painter is ended once the next is asked
+            for
+
+            Args:
+                rect (QRect): The region that will be drawn on
+
+            Yields:
+                (QPainter)
+        '''
+        for key in self.getKeys(rect):
+            painter = self.getPainter(key)
+            yield painter
+            self.endPainter(key, painter)
+
+    def arrays(self, rect, writable: bool = False):
+        '''
+            Yield a NumPy view, without a copy, of the part of each tile that
+            a region intersects. Each tile is kept in memory until the next
+            view is asked for, so views shouldn't be held on to past that
+
+            Args:
+                rect     (QRect): The region
+                writable (bool):  Whether the views can be written to, the
+                                  tiles are allocated if they aren't
+
+            Yields:
+                (tuple): The (QRect, numpy.ndarray) of each part, the rect
+                         in image coordinates
+        '''
+        for key in self.getKeys(rect):
+            tile = self.getTileRect(key)
+            part = tile.intersected(rect).intersected(self.rect())
+            local = part.translated(-tile.topLeft())
+            self.tiles.pin(key)
+            if writable:
+                array = Pixels.view(self.getWritableTile(key), True)
+            else:
+                array = Pixels.view(self.getTile(key))
+            yield part, array[local.top():local.bottom() + 1,
+                              local.left():local.right() + 1]
+            self.tiles.unpin(key)
+
+    def copy(self, rect):
+        '''
+            Copy a region of the image in to a single image
+
+            Args:
+                rect (QRect): The region to copy
+
+            Returns:
+                (QImage)
+        '''
+        size = self.TILE_SIZE
+        key = (rect.left() // size, rect.top() // size)
+        if (rect.right() // size, rect.bottom() // size) == key and (
+                self.rect().contains(rect)):
+            # Undo history copies many regions that sit within a tile
+            return self.getTile(key).copy(
+                rect.translated(-key[0] * size, -key[1] * size))
+        keys = self.getKeys(rect)
+        image = QImage(rect.size(), self.format())
+        image.fill(self.fill)
+        painter = QPainter(image)
+        painter.translate(-rect.topLeft())
+        for key in keys:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                painter.drawImage(self.getTileRect(key).topLeft(), tile)
+        painter.end()
+        return image
+
+    def paste(self, point, image):
+        '''
+            Write an image in to a region of the image, replacing what is
+            there
+
+            Args:
+                point (QPoint): Where to write the image
+                image (QImage): The image to write
+        '''
+        for painter in self.painters(QRect(point, image.size())):
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.drawImage(point, image)
+
+    def fillRect(self, rect, colour: int):
+        '''
+            Fill a region of the image with a single colour. Tiles the
+            region covers are replaced, rather than copied to be written to
+            when they're shared with a snapshot
+
+            Args:
+                rect   (QRect): The region to fill
+                colour (int):   The pixel value to fill with
+        '''
+        for key in self.getKeys(rect):
+            tile = self.getTileRect(key)
+            if rect.contains(tile.intersected(self.rect())):
+                image = QImage(self.empty.size(), self.format())
+                image.fill(colour)
+                self.tiles[key] = image
+                self.edited.add(key)
+                continue
+            for _, array in self.arrays(tile.intersected(rect), True):
+                array.view(numpy.uint32)[..., 0] = colour
+
+    def paint(self, painter, target, source):
+        '''
+            Draw a region of the image with a painter, only the tiles in the
+            region are drawn
+
+            Args:
+                painter (QPainter): The painter to draw with
+                target  (QRectF):   The region to draw in to
+                source  (QRectF):   The region of the image to draw
+        '''
+        source = source.intersected(QRectF(self.rect()))
+        if source.isEmpty():
+            return
+        painter.save()
+        painter.setClipRect(target, Qt.IntersectClip)
+        transform = QTransform.fromTranslate(-source.x(), -source.y())
+        transform *= QTransform.fromScale(target.width() / source.width(),
+                                          target.height() / source.height())
+        transform *= QTransform.fromTranslate(target.x(), target.y())
+        painter.setTransform(transform, True)
+        for key in self.getKeys(source.toAlignedRect()):
+            rect = self.getTileRect(key).intersected(self.rect())
+            tile = self.tiles.get(key)
+            if tile is not None:
+                painter.drawImage(rect, tile, rect.translated(-rect.topLeft()))
+            else:
+                painter.fillRect(rect, self.fill)
+        painter.restore()
+
+    def scaled(self, size):
+        '''
+            A smooth scaled copy of the whole image
+
+            Args:
+                size (QSize): The size to scale to
+
+            Returns:
+                (QImage)
+        '''
+        image = QImage(size, self.format())
+        image.fill(self.fill)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+        self.paint(painter, QRectF(image.rect()), QRectF(self.rect()))
+        painter.end()
+        return image
+
+    def snapshot(self, deep=False, budget=None):
+        '''
+            A copy of the image that is unaffected by later drawing
+
+            Args:
+                deep   (bool):         Copy the tiles now, needed if a
+                                       painter is active on any of them
+                budget (MemoryBudget): The budget for the copy's resident
+                                       tiles, its own if not given
+
+            Returns:
+                (TiledImage)
+        '''
+        snapshot = TiledImage(self.imageSize, self.fill, self.format(),
+                              budget)
+        snapshot.empty = self.empty
+        for key, tile in self.tiles.snapshot(deep).items():
+            snapshot.tiles[key] = tile
+        return snapshot
+
+    def takeEdited(self):
+        '''
+            The keys of the tiles written to since this was last called.
+            Tiles still being drawn on count as written to again
+
+            Returns:
+                (set)
+        '''
+        edited, self.edited = self.edited, set(self.tiles.pinned)
+        return edited
+
+    def copyTiles(self, keys, deep=False):
+        '''
+            Copies of some of the tiles that are unaffected by later drawing,
+            see TileStore.snapshot
+
+            Args:
+                keys (iterable): The (column, row) of each tile
+                deep (bool):     Copy the tiles now, needed if a painter is
+                                 active on any of them
+
+            Returns:
+                (dict): {key: QImage}
+        '''
+        return self.tiles.snapshot(deep, keys)
+
+    def setLoader(self, loader, keys):
+        '''
+            Leave tiles to be loaded the first time they are read or drawn
+            on, see TileStore.setLoader
+
+            Args:
+                loader (callable): Takes a key and returns the tile's QImage
+                keys   (iterable): The keys of the tiles it can load
+        '''
+        self.tiles.setLoader(loader, keys)
+
+    def getUnloaded(self):
+        '''
+            The keys of the tiles left to a loader that haven't been loaded
+
+            Returns:
+                (set)
+        '''
+        return set(self.tiles.lazy)
+
+    def toImage(self):
+        '''
+            Flatten the tiles in to a single image
+
+            Returns:
+                (QImage)
+        '''
+        return self.copy(self.rect())
+
+    def getBounds(self):
+        '''
+            The bounding rectangle of the allocated tiles, outside of it the
+            image is the background colour
+
+            Returns:
+                (QRect)
+        '''
+        rect = QRect()
+        for key in self.tiles.keys():
+            rect = rect.united(self.getTileRect(key))
+        return rect.intersected(self.rect())
+
+    def getAllocatedSize(self):
+        '''
+            The memory used by the allocated tiles in bytes, whether they
+            are resident or spilled
+
+            Returns:
+                (int)
+        '''
+        return len(self.tiles) * self.empty.sizeInBytes()
+
+    def close(self):
+        '''
+            Release the tiles and any scratch file they spilled to
+        '''
+        self.tiles.close()
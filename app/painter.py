@@ -6,6 +6,8 @@
         Matthew Barber <mfmbarber@gmail.com>
 '''
 from app.controllers.main_controller import MainController
+from app.views.components.instruments_dock import InstrumentsDock
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import (QDesktopWidget, QMainWindow, QMenuBar)
 
@@ -13,9 +15,14 @@ from PyQt5.QtWidgets import (QDesktopWidget, QMainWindow, QMenuBar)
 class Painter(QMainWindow):
     '''
         Main window for the Painter app
+
+        Args:
+            instruments (Instruments): Installed instruments to show in a
+                                       debug dock, if any
     '''
-    def __init__(self):
+    def __init__(self, instruments=None):
         super().__init__()
+        self.instruments = instruments
         self.initUI()
 
     def initUI(self):
@@ -28,6 +35,7 @@ class Painter(QMainWindow):
         self.updateStatusBar("Starting Up...")
         # Now launch main
         self.initMain()
+        self.initInstruments()
         self.initMenu()
         self.show()
 
@@ -40,17 +48,44 @@ class Painter(QMainWindow):
         self.mainController.update.connect(self.stateUpdate)
         self.setCentralWidget(self.mainController)
 
+    def initInstruments(self):
+        '''
+            Attaches the debug dock, when there are instruments
+        '''
+        self.instrumentsDock = None
+        if self.instruments is None:
+            return
+        self.instrumentsDock = InstrumentsDock(self.instruments, self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.instrumentsDock)
+
     def initMenu(self):
         mainMenu = QMenuBar(self)
         mainMenu.setNativeMenuBar(False)    # Use PyQt Menu over system menu
         self.addSubMenu("&File", mainMenu, self.mainController.getClearAction,
+                        self.mainController.getNewTabAction,
                         self.mainController.getOpenAction,
-                        self.mainController.getSaveAction, None,
+                        self.mainController.getSaveAction,
+                        self.mainController.getCloseTabAction, None,
                         self.mainController.getQuitAction)
-        self.addSubMenu("&Edit", mainMenu, self.mainController.getUndoAction)
+        self.addSubMenu("&Edit", mainMenu, self.mainController.getUndoAction,
+                        self.mainController.getRedoAction)
+        self.addSubMenu("&Layers", mainMenu,
+                        *self.mainController.getLayerActions())
+        self.addSubMenu("Effe&cts", mainMenu,
+                        *self.mainController.getEffectActions())
+        self.addSubMenu("&View", mainMenu, self.mainController.getHudAction)
+        if self.instrumentsDock:
+            self.addSubMenu("&Debug", mainMenu, self.getInstrumentsAction)
         self.addSubMenu("&Help", mainMenu, self.mainController.getAboutAction)
         self.setMenuBar(mainMenu)
 
+    def getInstrumentsAction(self, parent):
+        '''
+            Returns:
+                (QAction): Shows and hides the debug dock
+        '''
+        return self.instrumentsDock.toggleViewAction()
+
     def addSubMenu(self, name, parentMenu, *actions):
         subMenu = parentMenu.addMenu(name)
         for action in actions:
@@ -41,6 +41,8 @@ class BrushPreview(QWidget):
             self.drawBrushPreview(brush)
         if brush.getBrushType() == Constants.BrushTypes.LINE:
             self.drawLinePreview(brush)
+        if brush.getBrushType() == Constants.BrushTypes.FILL:
+            self.drawFillPreview(brush)
 
     def drawLinePreview(self, brush):
         '''
@@ -71,6 +73,21 @@ class BrushPreview(QWidget):
         painter.drawPoint(self.rect().center())
         super().update()
 
+    def drawFillPreview(self, brush):
+        '''
+            Draw the preview on the widget, a swatch of the fill colour
+
+            Args:
+                brush (Brush): The brush
+        '''
+        self.brush = brush
+        self.clear()
+        painter = QPainter(self.image)
+        painter.fillRect(self.image.rect().adjusted(10, 10, -10, -10),
+                         self.brush.getColour())
+        painter.end()
+        super().update()
+
     def paintEvent(self, event=None):
         '''
             Paint event handler
@@ -6,7 +6,7 @@
 '''
 from app.lib.constants import Constants
 from PyQt5.QtWidgets import QDialog, QDialogButtonBox, QLabel, QVBoxLayout, QSizePolicy
-from PyQt5.QtCore import QCoreApplication
+from PyQt5.QtCore import QCoreApplication, QThreadPool
 from PyQt5.QtGui import QPixmap
 
 
@@ -41,6 +41,9 @@ class BaseDialog(QDialog):
                 text (str):      The text for the button
                 role (enum):     An option from the wrapper enum Constants.DialogButtonRoles
                 callback (func): An optional callback to tie to the button
+
+            Returns:
+                (QPushButton)
         '''
 
         if role not in Constants.DialogButtonRoles:
@@ -49,6 +52,7 @@ class BaseDialog(QDialog):
         btn = self.buttonBox.addButton(text, role.value)
         if callback:
             btn.clicked.connect(callback)
+        return btn
 
     def setHeading(self, text: str):
         '''
@@ -116,12 +120,87 @@ class AboutDialog(BaseDialog):
         self.onAccept(self.close)
 
 
+class EffectDialog(BaseDialog):
+    '''
+        Dialog for applying an effect, the effect is previewed while the
+        dialog is open and can be cancelled while it is being applied
+
+        Args:
+            name    (str):  The name of the effect
+            preview (func): Callback to preview the effect
+            apply   (func): Callback to apply the effect, returning the job
+            dismiss (func): Callback to remove the preview
+    '''
+    def __init__(self, name: str, preview, apply, dismiss, parent=None):
+        super().__init__(parent)
+        self.setTitle(name)
+        self.setHeading(name)
+        self.setSubHeading('Previewing on the canvas')
+        self.apply = apply
+        self.dismiss = dismiss
+        self.job = None
+        self.applyButton = self.addButton('Apply',
+                                          Constants.DialogButtonRoles.ACCEPT)
+        self.addButton('Cancel', Constants.DialogButtonRoles.REJECT)
+        self.onAccept(self.start)
+        self.onReject(self.reject)
+        preview()
+
+    def start(self):
+        '''
+            Apply the effect, closing once it has landed or failed
+        '''
+        if self.job is not None:
+            return
+        self.job = self.apply()
+        self.setSubHeading('Applying...')
+        self.applyButton.setEnabled(False)
+        self.job.signals.progress.connect(
+            lambda progress: self.setSubHeading('Applying... %d%%' %
+                                                (progress)))
+        self.job.signals.finished.connect(lambda _: self.accept())
+        self.job.signals.failed.connect(lambda _: self.reject())
+
+    def reject(self):
+        '''
+            Cancel the effect if it is being applied, otherwise remove the
+            preview, then close
+        '''
+        if self.job is None:
+            self.dismiss()
+        else:
+            self.job.cancel()
+        super().reject()
+
+
+class CloseDialog(BaseDialog):
+    '''
+        Dialog for closing a document with unsaved changes
+
+        Args:
+            name  (str):  The name of the document
+            save  (func): Callback for saving, then closing, the document
+            close (func): Callback for closing the document without saving
+    '''
+    def __init__(self, name: str, save, close, parent=None):
+        super().__init__(parent)
+        self.setHeading('Close %s?' % (name))
+        self.setSubHeading('Unsaved changes, do you want to save first')
+        self.addButton('Save', Constants.DialogButtonRoles.YES)
+        self.addButton('Cancel', Constants.DialogButtonRoles.NO)
+        self.addButton('Don\'t Save', Constants.DialogButtonRoles.DESTRUCTIVE,
+                       lambda: (close(), self.close()))
+        self.onAccept(lambda: (save(), self.close()))
+        self.onReject(self.close)
+
+
 class QuitDialog(BaseDialog):
     '''
         Dialog for handling quit
 
         Args:
-            save (func): Callback for handling saving
+            save (func): Callback for saving the unsaved documents, it takes
+                         a callback to quit with once they're saved
     '''
     def __init__(self, save=None, parent=None):
         super().__init__(parent)
@@ -138,7 +217,7 @@ class QuitDialog(BaseDialog):
         self.addButton('Cancel', Constants.DialogButtonRoles.NO)
         self.addButton('Don\'t Save', Constants.DialogButtonRoles.DESTRUCTIVE,
                        self.quit)
-        self.onAccept(lambda: (self.save(), self.quit()))
+        self.onAccept(lambda: (self.save(self.quit), self.close()))
         self.onReject(self.close)
 
     def initQuit(self):
@@ -153,6 +232,8 @@ class QuitDialog(BaseDialog):
 
     def quit(self):
         '''
-            A helper method to wrap the instance quitting
+            A helper method to wrap the instance quitting, waiting for any
+            background work such as saves to finish
         '''
+        QThreadPool.globalInstance().waitForDone()
         QCoreApplication.instance().quit()
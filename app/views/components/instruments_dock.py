@@ -0,0 +1,87 @@
+'''
+    Instruments Dock
+    A debug dock showing the calls timed by the instruments
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import (QDockWidget, QLabel, QTableWidget,
+                             QTableWidgetItem, QVBoxLayout, QWidget)
+
+
+class InstrumentsDock(QDockWidget):
+    '''
+        Lists each method timed with its calls, mean, p50, p99 and slowest in
+        ms, and the spread of its calls as a bar for each histogram bucket.
+        It refreshes once a second while it's visible
+
+        Args:
+            instruments (Instruments): The instruments
+    '''
+    COLUMNS = ("Method", "Calls", "Mean", "p50", "p99", "Max", "Histogram")
+    BARS = " ▁▂▃▄▅▆▇█"
+    REFRESH_MS = 1000
+
+    def __init__(self, instruments, parent=None):
+        super().__init__("Instruments", parent)
+        self.setObjectName("instruments")
+        self.instruments = instruments
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.memory = QLabel()
+        self.memory.setVisible(instruments.mode == 'memory')
+        layout = QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addWidget(self.memory)
+        widget = QWidget()
+        widget.setLayout(layout)
+        self.setWidget(widget)
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+
+    def getBars(self, histogram):
+        '''
+            A bar for each bucket of a histogram, as high as its share of the
+            busiest bucket
+
+            Args:
+                histogram (Instruments.Histogram): The histogram
+
+            Returns:
+                (str)
+        '''
+        busiest = max(histogram.buckets) or 1
+        top = len(self.BARS) - 1
+        return ''.join(self.BARS[-(-count * top // busiest)]
+                       for count in histogram.buckets)
+
+    def refresh(self):
+        '''
+            Show the latest numbers
+        '''
+        if not self.isVisible():
+            return
+        histograms = sorted(self.instruments.getHistograms().items())
+        self.table.setRowCount(len(histograms))
+        for row, (name, histogram) in enumerate(histograms):
+            values = (name, str(histogram.count),
+                      f"{histogram.getMean():.3f}",
+                      f"{histogram.getPercentile(50):.3f}",
+                      f"{histogram.getPercentile(99):.3f}",
+                      f"{histogram.max:.3f}", self.getBars(histogram))
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+        self.table.resizeColumnsToContents()
+        memory = self.instruments.getMemory()
+        if memory:
+            self.memory.setText(
+                f"Traced {memory[0] / 1024 / 1024:.1f} MiB, "
+                f"peak {memory[1] / 1024 / 1024:.1f} MiB")
@@ -171,10 +171,10 @@ class MainLayout(QVBoxLayout):
         Args:
             components (QWidget): Widgets
     '''
-    def __init__(self, canvas, brushSettings):
+    def __init__(self, documents, brushSettings):
         super().__init__()
-        canvas.setSizePolicy(*Constants.AUTO_WIDTH_AUTO_HEIGHT)
-        self.addWidget(canvas)
+        documents.setSizePolicy(*Constants.AUTO_WIDTH_AUTO_HEIGHT)
+        self.addWidget(documents)
         brushSettings.setSizePolicy(*Constants.AUTO_WIDTH_FIXED_HEIGHT)
         self.addWidget(brushSettings)
         self.setContentsMargins(0, 0, 0, 0)
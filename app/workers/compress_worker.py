@@ -0,0 +1,78 @@
+'''
+    Compress Worker
+    Compresses the tiles of an undo history change away from the GUI thread
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import atexit
+import weakref
+import zlib
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class CompressWorker(QRunnable):
+    '''
+        Compresses the tiles of a change that were kept as they are. The
+        tiles are private copies no one draws on, so they can be read here
+        while the GUI thread carries on. The change is only weakly held, a
+        change dropped from its history before the worker runs isn't
+        compressed, or kept, for nothing
+
+        Args:
+            delta (History.Delta): The change to compress
+    '''
+    LEVEL = 1
+    # Compression has a thread of its own, saves and effects on the global
+    # pool never queue behind it
+    pool = QThreadPool()
+    pool.setMaxThreadCount(1)
+    # Workers are held until they have returned, nothing else keeps one
+    # alive while it's queued or running
+    running = set()
+
+    class Signals(QObject):
+        '''
+            Signals for the worker, a QRunnable can't emit signals itself
+        '''
+        finished = pyqtSignal(object)
+        failed = pyqtSignal(str)
+
+    def __init__(self, delta):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.delta = weakref.ref(delta)
+        self.signals = CompressWorker.Signals()
+
+    def run(self):
+        '''
+            Compress each tile, zlib releases the GIL while it works. Emits
+            the weak reference to the change and the (index, bytes) of each
+            tile
+        '''
+        delta = self.delta()
+        tiles = [] if delta is None else delta.getUncompressed()
+        del delta
+        try:
+            compressed = [
+                (index,
+                 zlib.compress(image.constBits().asstring(image.sizeInBytes()),
+                               self.LEVEL)) for index, image in tiles
+            ]
+        except (MemoryError, zlib.error) as error:
+            self.signals.failed.emit(str(error))
+            return
+        self.signals.finished.emit((self.delta, compressed))
+
+    @staticmethod
+    def stop():
+        '''
+            Drop the changes waiting to be compressed and wait for the one
+            being compressed, so no worker outlives its signals at exit
+        '''
+        CompressWorker.pool.clear()
+        CompressWorker.pool.waitForDone()
+
+
+atexit.register(CompressWorker.stop)
@@ -0,0 +1,175 @@
+'''
+    Effect Worker
+    Applies an effect to an image in strips, in parallel, away from the GUI
+    thread
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+import numpy
+
+
+class EffectWorker(QRunnable):
+    '''
+        Applies an effect to one strip of rows of an image, writing in to the
+        same rows of a result. The strip is read with the rows around it that
+        the effect needs, so strips can be done in any order
+
+        Args:
+            effect (Effect):        The effect
+            source (numpy.ndarray): The whole image
+            result (numpy.ndarray): Where to write the strip
+            top    (int):           The first row of the strip
+            bottom (int):           The row after the last of the strip
+    '''
+    class Signals(QObject):
+        '''
+            Signals for the worker, a QRunnable can't emit signals itself
+        '''
+        finished = pyqtSignal(int)
+        failed = pyqtSignal(str)
+
+    def __init__(self, effect, source, result, top: int, bottom: int):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.effect = effect
+        self.source = source
+        self.result = result
+        self.top = top
+        self.bottom = bottom
+        self.signals = EffectWorker.Signals()
+
+    def run(self):
+        '''
+            Apply the effect to the strip
+        '''
+        halo = self.effect.getHalo()
+        start = max(self.top - halo, 0)
+        end = min(self.bottom + halo, len(self.source))
+        try:
+            strip = self.effect.apply(self.source[start:end])
+        except (MemoryError, ValueError) as error:
+            self.signals.failed.emit(str(error))
+            return
+        # Only the rows of the strip itself are kept, not the halo
+        rows = slice(self.top - start, self.bottom - start)
+        self.result[self.top:self.bottom] = strip[rows]
+        self.signals.finished.emit(self.bottom - self.top)
+
+
+class EffectJob:
+    '''
+        Splits an image in to strips and applies an effect to them on the
+        thread pool, reporting progress as the strips finish. A job can be
+        cancelled, strips that haven't started are dropped
+
+        Args:
+            effect (Effect):        The effect
+            source (numpy.ndarray): The image, it shouldn't change until the
+                                    job is done
+    '''
+    STRIP_HEIGHT = 128
+    # Jobs are held until their last strip has returned, even if they were
+    # cancelled, so no strip outlives the objects it reports to
+    running = set()
+
+    class Signals(QObject):
+        '''
+            Signals for the job
+        '''
+        progress = pyqtSignal(int)
+        finished = pyqtSignal(object)
+        failed = pyqtSignal(str)
+
+    def __init__(self, effect, source):
+        self.effect = effect
+        self.source = source
+        self.result = numpy.empty_like(source)
+        self.workers = []
+        self.done = 0
+        self.isCancelled = False
+        self.isFinished = False
+        self.signals = EffectJob.Signals()
+
+    def start(self):
+        '''
+            Start a worker for each strip
+        '''
+        self.effect.prepare(self.source)
+        height = len(self.source)
+        for top in range(0, height, self.STRIP_HEIGHT):
+            worker = EffectWorker(self.effect, self.source, self.result, top,
+                                  min(top + self.STRIP_HEIGHT, height))
+            worker.signals.finished.connect(
+                lambda rows, worker=worker: self.stripFinished(worker, rows))
+            worker.signals.failed.connect(
+                lambda error, worker=worker: self.stripFailed(worker, error))
+            self.workers.append(worker)
+        EffectJob.running.add(self)
+        for worker in self.workers:
+            QThreadPool.globalInstance().start(worker)
+
+    def stripFinished(self, worker, rows: int):
+        '''
+            Count a finished strip, finishing the job after the last
+
+            Args:
+                worker (EffectWorker): The worker for the strip
+                rows   (int):          The rows in the strip
+        '''
+        self.release(worker)
+        if self.isCancelled:
+            return
+        self.done += rows
+        self.signals.progress.emit(100 * self.done // len(self.source))
+        if self.done == len(self.source):
+            self.isFinished = True
+            self.signals.finished.emit(self.result)
+
+    def stripFailed(self, worker, error: str):
+        '''
+            Fail the job if a strip fails
+
+            Args:
+                worker (EffectWorker): The worker for the strip
+                error  (str):          Why the strip failed
+        '''
+        self.release(worker)
+        if not (self.isCancelled or self.isFinished):
+            self.stop()
+            self.signals.failed.emit(error)
+
+    def release(self, worker):
+        '''
+            Let go of a worker that has returned, and of the job after the
+            last
+
+            Args:
+                worker (EffectWorker): The worker
+        '''
+        self.workers.remove(worker)
+        if not self.workers:
+            EffectJob.running.discard(self)
+
+    def cancel(self, reason: str = "Cancelled"):
+        '''
+            Cancel the job, if it hasn't finished
+
+            Args:
+                reason (str): Why the job was cancelled, passed to failed
+        '''
+        if not (self.isCancelled or self.isFinished):
+            self.stop()
+            self.signals.failed.emit(reason)
+
+    def stop(self):
+        '''
+            Drop the strips that haven't started, strips already running
+            finish but are ignored
+        '''
+        self.isCancelled = True
+        pool = QThreadPool.globalInstance()
+        for worker in list(self.workers):
+            if pool.tryTake(worker):
+                self.release(worker)
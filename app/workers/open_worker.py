@@ -0,0 +1,94 @@
+'''
+    Open Worker
+    Decodes an image from disk away from the GUI thread
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+from PyQt5.QtCore import QObject, QRunnable, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader
+
+
+class OpenWorker(QRunnable):
+    '''
+        Reads an image, decoding it straight to the size it will be shown at
+        rather than at full resolution. A low resolution preview is decoded
+        first so there is something to show while the full image is read
+
+        Args:
+            path (str):   The path of the image
+            size (QSize): The size the image has to fit in
+    '''
+    PREVIEW_SCALE = 8
+
+    class Signals(QObject):
+        '''
+            Signals for the worker, a QRunnable can't emit signals itself
+        '''
+        preview = pyqtSignal(QImage)
+        finished = pyqtSignal(QImage)
+        failed = pyqtSignal(str)
+
+    def __init__(self, path: str, size):
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.signals = OpenWorker.Signals()
+
+    def run(self):
+        '''
+            Read the preview, then the full image
+        '''
+        size = self.getSize()
+        if size.isValid() and size.width() >= self.PREVIEW_SCALE:
+            preview = self.read(size / self.PREVIEW_SCALE)
+            if not preview.isNull():
+                self.signals.preview.emit(preview)
+        image = self.read(size)
+        if image.isNull():
+            self.signals.failed.emit(self.error)
+            return
+        self.signals.finished.emit(image)
+
+    def getSize(self):
+        '''
+            The size to decode the image at, the image is only ever scaled
+            down to fit
+
+            Returns:
+                (QSize): Invalid if the size can't be read up front
+        '''
+        reader = self.getReader()
+        size = reader.size()
+        if (size.isValid() and (size.width() > self.size.width()
+                                or size.height() > self.size.height())):
+            size = size.scaled(self.size, Qt.KeepAspectRatio)
+        return size
+
+    def getReader(self):
+        '''
+            Create a reader for the path
+
+            Returns:
+                (QImageReader)
+        '''
+        reader = QImageReader(self.path)
+        reader.setAutoTransform(True)
+        return reader
+
+    def read(self, size):
+        '''
+            Decode the image at a size
+
+            Args:
+                size (QSize): The size to decode at, if valid
+
+            Returns:
+                (QImage): A null image if the image couldn't be read
+        '''
+        reader = self.getReader()
+        if size.isValid():
+            reader.setScaledSize(size)
+        image = reader.read()
+        self.error = reader.errorString()
+        return image
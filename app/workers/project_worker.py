@@ -0,0 +1,267 @@
+'''
+    Project Worker
+    Writes a project to disk away from the GUI thread
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import json
+import os
+import shutil
+import zlib
+
+from app.lib.project_file import ProjectFile
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class ProjectWorker(QRunnable):
+    '''
+        Saves a project, see ProjectFile for the layout. When appending, only
+        the tiles given are written, after the end of the project, followed
+        by a new index. The chunks of the other tiles stay where they are.
+        Once a project is mostly chunks that have been replaced it is
+        written again from scratch instead, to a temporary file that is
+        renamed over the path
+
+        The document is given with setDocument before the worker starts, so
+        a save can be queued before what it will save is known
+
+        Args:
+            path (str): The path to save to
+    '''
+    # A project is written again once it is over twice the size of its live
+    # chunks, and over this many bytes of them
+    COMPACT_SLACK = 4 * 1024 * 1024
+
+    class Signals(QObject):
+        '''
+            Signals for the worker, a QRunnable can't emit signals itself
+        '''
+        progress = pyqtSignal(int)
+        finished = pyqtSignal(str)
+        failed = pyqtSignal(str)
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.document = None
+        self.source = None
+        self.append = False
+        self.locations = None
+        self.signals = ProjectWorker.Signals()
+
+    def setDocument(self, document, source=None, append=False):
+        '''
+            Set what is to be saved
+
+            Args:
+                document (dict):        The width, height and active layer
+                                        of the document, and its layers,
+                                        each an id, name, opacity,
+                                        blendMode, visible, format, fill,
+                                        the tiles to write as {key: QImage}
+                                        and the chunks of the other tiles
+                                        as {key: (offset, length)}. The
+                                        keyframes of its stroke log are
+                                        described in the same way, with a
+                                        width and height in place of the
+                                        layer's properties, and the log
+                                        itself is bytes, see StrokeLog
+                source   (ProjectFile): The project the chunks are read from
+                append   (bool):        Whether the source is the project at
+                                        path, so the chunks can be left in
+                                        place
+        '''
+        self.document = document
+        self.source = source
+        self.append = append
+
+    def run(self):
+        '''
+            Save the project, reporting progress as a percentage. The
+            location of every chunk in the saved project is left in
+            locations, a dict for each layer then each keyframe
+        '''
+        try:
+            encoded = self.encode()
+            if self.append and not self.isWasteful(encoded):
+                self.locations = self.appendTo(encoded)
+            else:
+                self.locations = self.rewrite(encoded)
+        except (OSError, ValueError) as error:
+            self.signals.failed.emit(str(error))
+            return
+        self.signals.progress.emit(100)
+        self.signals.finished.emit(self.path)
+
+    def getImages(self):
+        '''
+            The images whose tiles are saved, the layers then the keyframes
+
+            Returns:
+                (list)
+        '''
+        return self.document['layers'] + self.document['keyframes']
+
+    def encode(self):
+        '''
+            Compress the tiles that are to be written
+
+            Returns:
+                (list): {key: bytes} for each image, see getImages
+        '''
+        layers = self.getImages()
+        total = sum(len(layer['tiles']) for layer in layers) or 1
+        done = 0
+        encoded = []
+        for layer in layers:
+            chunks = {}
+            for key, image in layer['tiles'].items():
+                chunks[key] = ProjectFile.encodeTile(image)
+                done += 1
+                self.signals.progress.emit(50 * done // total)
+            encoded.append(chunks)
+        return encoded
+
+    def isWasteful(self, encoded):
+        '''
+            Check to see if appending would leave the project over twice the
+            size of its live chunks
+
+            Args:
+                encoded (list): The compressed tiles of each image
+
+            Returns:
+                (bool)
+        '''
+        live = added = 0
+        for layer, chunks in zip(self.getImages(), encoded):
+            added += sum(len(data) for data in chunks.values())
+            live += sum(length
+                        for key, (_, length) in layer['chunks'].items()
+                        if key not in chunks)
+        live += added
+        return os.path.getsize(self.path) + added > max(
+            2 * live, self.COMPACT_SLACK)
+
+    def appendTo(self, encoded):
+        '''
+            Append the tiles, the stroke log and an index to the project,
+            the project is cut back to where it was if the append fails
+
+            Args:
+                encoded (list): The compressed tiles of each image
+
+            Returns:
+                (list): The chunks of each image
+        '''
+        with open(self.path, 'r+b') as file:
+            end = file.seek(0, os.SEEK_END)
+            try:
+                locations = []
+                offset = end
+                for layer, chunks in zip(self.getImages(), encoded):
+                    placed = dict(layer['chunks'])
+                    for key, data in chunks.items():
+                        file.write(data)
+                        placed[key] = (offset, len(data))
+                        offset += len(data)
+                    locations.append(placed)
+                self.writeIndex(file, offset, locations)
+                file.flush()
+                os.fsync(file.fileno())
+            except OSError:
+                file.truncate(end)
+                raise
+        return locations
+
+    def rewrite(self, encoded):
+        '''
+            Write the whole project to a temporary file and rename it over
+            the path, chunks that aren't in encoded are copied from the
+            source without decoding them
+
+            Args:
+                encoded (list): The compressed tiles of each image
+
+            Returns:
+                (list): The chunks of each image
+        '''
+        directory, name = os.path.split(os.path.abspath(self.path))
+        temporary = os.path.join(directory, '.%s.saving' % (name))
+        layers = self.getImages()
+        total = sum(len(layer['chunks']) for layer in layers) or 1
+        done = 0
+        try:
+            with open(temporary, 'wb') as file:
+                offset = file.write(
+                    ProjectFile.HEADER.pack(ProjectFile.MAGIC,
+                                            ProjectFile.VERSION))
+                locations = []
+                for layer, chunks in zip(layers, encoded):
+                    placed = {}
+                    for key in layer['chunks'].keys() | chunks.keys():
+                        data = chunks.get(key)
+                        if data is None:
+                            data = self.source.read(*layer['chunks'][key])
+                            done += 1
+                            self.signals.progress.emit(50 +
+                                                       50 * done // total)
+                        file.write(data)
+                        placed[key] = (offset, len(data))
+                        offset += len(data)
+                    locations.append(placed)
+                self.writeIndex(file, offset, locations)
+                file.flush()
+                os.fsync(file.fileno())
+            if os.path.exists(self.path):
+                shutil.copymode(self.path, temporary)
+            os.replace(temporary, self.path)
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return locations
+
+    def writeIndex(self, file, offset: int, locations):
+        '''
+            Write the stroke log, then the index of the document and the
+            footer that points at it
+
+            Args:
+                file      (file): The project, at the end of the chunks
+                offset    (int):  Where the stroke log starts
+                locations (list): The chunks of each image
+        '''
+        log = self.document['log']
+        file.write(log)
+        logLocation = [offset, len(log)]
+        offset += len(log)
+        entries = []
+        for layer, placed in zip(self.getImages(), locations):
+            entry = {
+                name: value
+                for name, value in layer.items()
+                if name not in ('tiles', 'chunks')
+            }
+            entry['tiles'] = {
+                ProjectFile.getName(key): list(location)
+                for key, location in placed.items()
+            }
+            entries.append(entry)
+        count = len(self.document['layers'])
+        index = {
+            'version': ProjectFile.VERSION,
+            'width': self.document['width'],
+            'height': self.document['height'],
+            'active': self.document['active'],
+            'layers': entries[:count],
+            'keyframes': entries[count:],
+            'log': logLocation
+        }
+        data = zlib.compress(json.dumps(index).encode(),
+                             ProjectFile.COMPRESSION)
+        file.write(data)
+        file.write(
+            ProjectFile.FOOTER.pack(offset, len(data),
+                                    ProjectFile.FOOTER_MAGIC))
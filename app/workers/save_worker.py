@@ -0,0 +1,98 @@
+'''
+    Save Worker
+    Encodes and writes an image to disk away from the GUI thread
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import os
+import shutil
+
+from PyQt5.QtCore import (QBuffer, QByteArray, QIODevice, QObject, QRunnable,
+                          pyqtSignal)
+
+
+class SaveWorker(QRunnable):
+    '''
+        Saves an image to a path, the image is written to a temporary file
+        next to the path and renamed over it so a failed save never leaves a
+        partial file behind
+
+        Args:
+            image (LayerStack): A snapshot of the layers to save, so drawing
+                                can carry on, they are flattened here
+            path  (str):        The path to save to
+    '''
+    CHUNK_SIZE = 1024 * 1024
+
+    class Signals(QObject):
+        '''
+            Signals for the worker, a QRunnable can't emit signals itself
+        '''
+        progress = pyqtSignal(int)
+        finished = pyqtSignal(str)
+        failed = pyqtSignal(str)
+
+    def __init__(self, image, path: str):
+        super().__init__()
+        self.image = image
+        self.path = path
+        self.signals = SaveWorker.Signals()
+
+    def run(self):
+        '''
+            Save the image, reporting progress as a percentage
+        '''
+        try:
+            self.write(self.encode())
+        except (OSError, RuntimeError) as error:
+            self.signals.failed.emit(str(error))
+            return
+        self.signals.finished.emit(self.path)
+
+    def encode(self):
+        '''
+            Flatten and encode the image in memory, in the format given by
+            the extension
+
+            Returns:
+                (bytes)
+
+            Throws:
+                RuntimeError : The image couldn't be encoded
+        '''
+        format = os.path.splitext(self.path)[1][1:].upper() or 'PNG'
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        if not self.image.toImage().save(buffer, format):
+            raise RuntimeError("Could not encode %s as %s" %
+                               (self.path, format))
+        buffer.close()
+        self.signals.progress.emit(50)
+        return data.data()
+
+    def write(self, data: bytes):
+        '''
+            Write the data to a temporary file and rename it over the path
+
+            Args:
+                data (bytes): The encoded image
+        '''
+        directory, name = os.path.split(os.path.abspath(self.path))
+        temporary = os.path.join(directory, '.%s.saving' % (name))
+        try:
+            with open(temporary, 'wb') as file:
+                for offset in range(0, len(data), self.CHUNK_SIZE):
+                    file.write(data[offset:offset + self.CHUNK_SIZE])
+                    self.signals.progress.emit(50 + 50 * offset // len(data))
+                file.flush()
+                os.fsync(file.fileno())
+            if os.path.exists(self.path):
+                shutil.copymode(self.path, temporary)
+            os.replace(temporary, self.path)
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        self.signals.progress.emit(100)
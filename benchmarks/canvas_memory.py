@@ -0,0 +1,58 @@
+'''
+    Canvas Memory
+    Opens, draws on and closes canvases one after another, and reports how
+    much the resident memory grew. That it stays flat, i.e. closed canvases
+    are released, is checked by tests/test_canvas.py
+
+    Usage:
+        python3 -m benchmarks.canvas_memory
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import gc
+import sys
+
+from benchmarks.harness import getApplication, getResidentMemory
+from PyQt5.QtCore import QPoint, QSize
+
+CANVASES = 100
+WARM_UP = 10
+SIZE = (1920, 1080)
+
+
+def useCanvas():
+    '''
+        Open a canvas, make some undoable changes to it and close it
+    '''
+    from app.models.brush import Brush
+    from app.models.canvas import Canvas
+    canvas = Canvas(QSize(*SIZE))
+    brush = Brush()
+    brush.setSize(40)
+    for stroke in range(10):
+        canvas.snapshotImage()
+        canvas.beginStroke(QPoint(0, stroke * 100), brush)
+        for step in range(1, 20):
+            canvas.extendStroke(QPoint(step * 100, stroke * 100 + step * 5))
+        canvas.brushAwayFromCanvas()
+    canvas.undo()
+    canvas.close()
+
+
+def main():
+    getApplication()
+    for _ in range(WARM_UP):
+        useCanvas()
+    gc.collect()
+    before = getResidentMemory()
+    for _ in range(CANVASES):
+        useCanvas()
+    gc.collect()
+    growth = getResidentMemory() - before
+    print(f"{CANVASES} canvases: {growth / 1024 / 1024:+.1f} MiB resident")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+'''
+    Effect Preview
+    Previews every effect over the canvas, as the effect dialog does when it
+    opens, timing each and failing if one doesn't leave a preview. Then
+    applies each to an empty layer, failing if the layer doesn't stay
+    transparent
+
+    Usage:
+        python3 -m benchmarks.effect_preview
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import sys
+import time
+
+from benchmarks.harness import getApplication
+from PyQt5.QtCore import QPoint, QSize, QThreadPool
+from PyQt5.QtGui import QColor
+
+SIZE = (1920, 1080)
+REPEATS = 5
+
+
+def isTransparentAfter(effect):
+    '''
+        Apply an effect to an empty layer over a drawn background
+
+        Args:
+            effect (Effect): The effect
+
+        Returns:
+            (bool): Whether the layer is still transparent
+    '''
+    from app.models.brush import Brush
+    from app.models.canvas import Canvas
+    application = getApplication()
+    canvas = Canvas(QSize(*SIZE))
+    brush = Brush()
+    brush.setColour(QColor('#ff0000'))
+    canvas.snapshotImage()
+    canvas.beginStroke(QPoint(0, SIZE[1] // 2), brush)
+    canvas.extendStroke(QPoint(SIZE[0] - 1, SIZE[1] // 2))
+    canvas.brushAwayFromCanvas()
+    before = canvas.getImage()
+    canvas.addLayer()
+    canvas.applyEffect(effect)
+    while canvas.effect is not None:
+        QThreadPool.globalInstance().waitForDone()
+        application.processEvents()
+    transparent = canvas.getImage() == before
+    canvas.close()
+    return transparent
+
+
+def main():
+    from app.lib.effects import EFFECTS
+    from app.models.canvas import Canvas
+    getApplication()
+    canvas = Canvas(QSize(*SIZE))
+    failed = False
+    for effect in EFFECTS:
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            canvas.previewEffect(effect())
+        elapsed = (time.perf_counter() - start) * 1000 / REPEATS
+        print(f"preview {effect.name}: {elapsed:.1f} ms")
+        if canvas.getOverlay() is None:
+            print(f"Previewing {effect.name} didn't show a preview")
+            failed = True
+        canvas.clearOverlay()
+        if not isTransparentAfter(effect()):
+            print(f"{effect.name} made an empty layer opaque")
+            failed = True
+    canvas.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
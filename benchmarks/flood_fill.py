@@ -0,0 +1,123 @@
+'''
+    Flood Fill
+    Times filling a region that covers most of the canvas, on a plain
+    canvas and on one covered in noise, and undoing the fill. Fails if the
+    slowest fill or undo takes longer than the budget at any of the sizes.
+    A textured fill labels every pixel it reaches, so its budget grows with
+    the size of the canvas
+
+    Usage:
+        python3 -m benchmarks.flood_fill
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import sys
+import time
+
+import numpy
+
+from benchmarks.harness import getApplication
+from PyQt5.QtCore import QPoint, QSize
+from PyQt5.QtGui import QColor
+
+MAX_FILL_MS = 100
+MAX_TEXTURED_MS_PER_MEGAPIXEL = 100
+REPEATS = 5
+SIZES = ((1920, 1080), (3840, 2160))
+COLOURS = ('#2060c0', '#ffffff')
+# The range of each channel of the textured canvas, the default tolerance
+# reaches across most of it so the fill covers most of the canvas
+TEXTURE = (180, 220)
+
+
+def getCanvas(size, textured: bool):
+    '''
+        A canvas with a border stroke so a fill has an edge to find, and
+        noise all over it if textured
+
+        Args:
+            size     (tuple): The (width, height) of the canvas
+            textured (bool):  Whether to cover it in noise
+
+        Returns:
+            (Canvas)
+    '''
+    from app.models.brush import Brush
+    from app.models.canvas import Canvas
+    canvas = Canvas(QSize(*size))
+    if textured:
+        noise = numpy.random.default_rng(0).integers(
+            TEXTURE[0], TEXTURE[1] + 1, (size[1], size[0], 4), numpy.uint8)
+        noise[..., 3] = 255
+        canvas.setArray(noise)
+    canvas.snapshotImage()
+    canvas.brushOnCanvas(QPoint(0, 0))
+    canvas.draw(QPoint(size[0] - 1, 0), Brush())
+    canvas.brushAwayFromCanvas()
+    return canvas
+
+
+def settle():
+    '''
+        Wait for the undo history to finish compressing in the background,
+        as it would between a user's fills, so it isn't timed
+    '''
+    from app.workers.compress_worker import CompressWorker
+    CompressWorker.pool.waitForDone()
+    getApplication().processEvents()
+
+
+def measure(size, textured: bool = False):
+    '''
+        Time the slowest of a few fills from the middle of the canvas, and
+        of undoing each, so every fill starts from the same pixels
+
+        Args:
+            size     (tuple): The (width, height) of the canvas
+            textured (bool):  Whether the canvas is covered in noise
+
+        Returns:
+            (tuple): The slowest fill and undo in milliseconds
+    '''
+    from app.models.brush import Brush
+    canvas = getCanvas(size, textured)
+    brush = Brush()
+    brush.setBrushType('FILL')
+    fills = []
+    undos = []
+    for repeat in range(REPEATS):
+        brush.setColour(QColor(COLOURS[repeat % 2]))
+        settle()
+        start = time.perf_counter()
+        canvas.fill(QPoint(size[0] // 2, size[1] // 2), brush)
+        fills.append((time.perf_counter() - start) * 1000)
+        settle()
+        start = time.perf_counter()
+        canvas.undo()
+        undos.append((time.perf_counter() - start) * 1000)
+    canvas.close()
+    return max(fills), max(undos)
+
+
+def main():
+    getApplication()
+    failed = False
+    for size in SIZES:
+        for textured in (False, True):
+            fill, undo = measure(size, textured)
+            print(f"{'textured' if textured else 'plain':<9}"
+                  f"{size[0]}x{size[1]}: fill {fill:.1f} ms, "
+                  f"undo {undo:.1f} ms")
+            budget = MAX_FILL_MS
+            if textured:
+                budget = (MAX_TEXTURED_MS_PER_MEGAPIXEL * size[0] * size[1] /
+                          1000000)
+            if max(fill, undo) > budget:
+                print(f"Filling or undoing took over {budget:.0f} ms")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
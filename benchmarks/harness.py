@@ -0,0 +1,168 @@
+'''
+    Harness
+    Helpers for driving the painter headless, run from the project root
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import math
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QEvent, QObject, QPoint, QPointF, Qt    # noqa: E402
+from PyQt5.QtGui import QMouseEvent    # noqa: E402
+from PyQt5.QtWidgets import QApplication    # noqa: E402
+
+application = None
+
+
+def getApplication():
+    '''
+        Fetch the running QApplication, creating (and holding on to) it if
+        needed
+
+        Returns:
+            (QApplication)
+    '''
+    global application
+    if QApplication.instance() is None:
+        application = QApplication(sys.argv)
+    return QApplication.instance()
+
+
+def wait(seconds: float):
+    '''
+        Run the event loop for a number of seconds
+
+        Args:
+            seconds (float): How long to process events for
+    '''
+    app = getApplication()
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def getResidentMemory():
+    '''
+        The resident memory of the process, from /proc where there is one and
+        otherwise the peak resident memory
+
+        Returns:
+            (int): Bytes
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def getTrace(width: int, height: int, count: int, seed: int = 0):
+    '''
+        A repeatable stroke across a canvas, a wandering curve with steps of
+        a few pixels like a hand held mouse
+
+        Args:
+            width  (int): The width of the canvas
+            height (int): The height of the canvas
+            count  (int): The number of points
+            seed   (int): Picks a different curve
+
+        Returns:
+            (list): QPoint
+    '''
+    points = []
+    # A fixed number of pixels a step, whatever the size of the canvas
+    pace = 8 / max(width, height)
+    for step in range(count):
+        angle = seed + step * pace
+        points.append(
+            QPoint(
+                int((0.5 + 0.45 * math.sin(angle * 1.7 + seed)) * (width - 1)),
+                int((0.5 + 0.45 * math.cos(angle * 2.3)) * (height - 1))))
+    return points
+
+
+def getPercentile(values, percent: float):
+    '''
+        The value a percentage of the values are at or below, the nearest
+        rank
+
+        Args:
+            values  (list):  The values
+            percent (float): From 0 to 100
+
+        Returns:
+            (float)
+    '''
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def sendMouse(widget, kind, point, button=Qt.LeftButton):
+    '''
+        Deliver a synthetic mouse event straight to a widget
+
+        Args:
+            widget (QWidget):       The widget to receive the event
+            kind   (QEvent.Type):   Press, move or release
+            point  (QPoint):        The position in widget coordinates
+            button (Qt.MouseButton): The button being used
+    '''
+    buttons = Qt.NoButton if kind == QEvent.MouseButtonRelease else button
+    if kind == QEvent.MouseMove:
+        button = Qt.NoButton
+    getApplication().sendEvent(
+        widget,
+        QMouseEvent(kind, QPointF(point), button, buttons, Qt.NoModifier))
+
+
+class PaintCounter(QObject):
+    '''
+        Event filter that counts the paint events a widget receives
+
+        Args:
+            widget (QWidget): The widget to watch
+    '''
+    def __init__(self, widget):
+        super().__init__()
+        self.count = 0
+        widget.installEventFilter(self)
+
+    def eventFilter(self, _, event):
+        '''
+            Count paint events, letting every event through
+        '''
+        if event.type() == QEvent.Paint:
+            self.count += 1
+        return False
+
+    def measure(self, seconds: float, action=None):
+        '''
+            Count the paint events per second over a period
+
+            Args:
+                seconds (float):   How long to measure for
+                action  (func):    Called on every loop, e.g. to send input
+
+            Returns:
+                (float)
+        '''
+        app = getApplication()
+        self.count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            if action:
+                action()
+            app.processEvents()
+            time.sleep(0.001)
+        return self.count / (time.perf_counter() - start)
@@ -0,0 +1,369 @@
+'''
+    Input Latency
+    Feeds streams of mouse events to the canvas controller at fixed rates, up
+    to 1000 Hz, and follows each event end to end: until the canvas draws
+    it, until a paint of the widget shows it, and until the state reaches
+    Painter.stateUpdate through the MainController. Reports the latencies,
+    the frames painted and dropped, and fails if any event never reached
+    the screen
+
+    Streams are generated strokes, or the strokes of a project's stroke log
+    replayed with the timing they were drawn with or spaced out at the rates
+
+    Usage:
+        python3 -m benchmarks.input_latency [--rates 125,1000] [--seconds 2]
+                                            [--project path.painter]
+                                            [--output results.json]
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import argparse
+import itertools
+import json
+import math
+import sys
+import time
+
+from benchmarks.harness import (getApplication, getPercentile, getTrace,
+                                sendMouse, wait)
+from PyQt5.QtCore import QEvent, QObject, QPoint
+
+RATES = (125, 250, 500, 1000)
+SECONDS = 2.0
+STROKE_SECONDS = 0.5
+SETTLE_SECONDS = 0.3
+# The display the frames are counted against
+FRAME_MS = 1000 / 60
+
+
+class Probe(QObject):
+    '''
+        Sends mouse events to the canvas controller and times each one to
+        the canvas drawing it, a paint showing it and the status bar
+
+        Args:
+            painter (Painter): The app
+    '''
+    def __init__(self, painter):
+        super().__init__()
+        self.controller = painter.mainController.getCanvasController()
+        self.canvas = self.controller.canvas
+        self.controller.installEventFilter(self)
+        self.canvas.changed.connect(self.drawn)
+        painter.mainController.update.connect(self.stateUpdated)
+        self.reset()
+
+    def reset(self):
+        '''
+            Forget everything measured so far
+        '''
+        self.waiting = []
+        self.showing = []
+        self.unreported = []
+        self.handlers = []
+        self.drawLatencies = []
+        self.pixelLatencies = []
+        self.statusLatencies = []
+        self.paints = []
+        self.late = 0
+        self.sent = 0
+
+    def send(self, kind, point, late: bool = False):
+        '''
+            Deliver a mouse event to the controller, timing its handler
+
+            Args:
+                kind  (QEvent.Type): Press, move or release
+                point (QPoint):      The position in widget coordinates
+                late  (bool):        Whether it is being sent later than
+                                     scheduled
+        '''
+        start = time.perf_counter()
+        if kind != QEvent.MouseButtonRelease:
+            self.waiting.append((start, self.controller.mapToCanvas(point),
+                                 point))
+            self.unreported.append(start)
+        sendMouse(self.controller, kind, point)
+        self.handlers.append((time.perf_counter() - start) * 1000)
+        self.sent += 1
+        self.late += late
+
+    def drawn(self, rect):
+        '''
+            The canvas changed, the events whose points are in the region
+            have been drawn and are waiting for a paint
+
+            Args:
+                rect (QRect): The region of the canvas
+        '''
+        now = time.perf_counter()
+        waiting = []
+        for sent, point, widgetPoint in self.waiting:
+            if rect.contains(point):
+                self.drawLatencies.append((now - sent) * 1000)
+                self.showing.append((sent, widgetPoint))
+            else:
+                waiting.append((sent, point, widgetPoint))
+        self.waiting = waiting
+
+    def eventFilter(self, watched, event):
+        '''
+            Paint the controller here rather than letting the event through,
+            so the time the paint finishes is known
+        '''
+        if event.type() != QEvent.Paint:
+            return False
+        watched.event(event)
+        now = time.perf_counter()
+        self.paints.append(now)
+        region = event.region()
+        showing = []
+        for sent, point in self.showing:
+            if region.contains(point):
+                self.pixelLatencies.append((now - sent) * 1000)
+            else:
+                showing.append((sent, point))
+        self.showing = showing
+        return True
+
+    def stateUpdated(self, state):
+        '''
+            The MainController published a state to the Painter, it reports
+            every event sent since the last
+        '''
+        now = time.perf_counter()
+        self.statusLatencies.extend(
+            (now - sent) * 1000 for sent in self.unreported)
+        self.unreported = []
+
+    def getDroppedFrames(self, start: float, end: float):
+        '''
+            The frames missed between paints while events were streaming,
+            each gap between paints longer than a frame drops the frames it
+            spans
+
+            Args:
+                start (float): When the stream started
+                end   (float): When the last event was sent
+
+            Returns:
+                (int)
+        '''
+        paints = [start] + [paint for paint in self.paints
+                            if start < paint <= end] + [end]
+        return sum(
+            max(math.floor((later - earlier) * 1000 / FRAME_MS) - 1, 0)
+            for earlier, later in zip(paints, paints[1:]))
+
+    def getResult(self, start: float, end: float):
+        '''
+            Summarise a stream
+
+            Args:
+                start (float): When the stream started
+                end   (float): When the last event was sent
+
+            Returns:
+                (dict)
+        '''
+        def percentiles(values):
+            if not values:
+                return {'p50': None, 'p99': None}
+            return {
+                'p50': round(getPercentile(values, 50), 3),
+                'p99': round(getPercentile(values, 99), 3)
+            }
+
+        seconds = end - start
+        return {
+            'events': self.sent,
+            'rate': round(self.sent / seconds, 1) if seconds else 0.0,
+            'late': self.late,
+            'handler': percentiles(self.handlers),
+            'draw': percentiles(self.drawLatencies),
+            'pixel': percentiles(self.pixelLatencies),
+            'status': percentiles(self.statusLatencies),
+            'fps': round(
+                len([paint for paint in self.paints if start < paint <= end])
+                / seconds, 1) if seconds else 0.0,
+            'droppedFrames': self.getDroppedFrames(start, end),
+            'lost': len(self.waiting) + len(self.showing)
+        }
+
+
+def generateStream(rect, rate: int, seconds: float):
+    '''
+        Strokes across a region of the widget, a press, moves at a rate and
+        a release for each
+
+        Args:
+            rect    (QRect): The region, in widget coordinates
+            rate    (int):   Events a second
+            seconds (float): How long the stream lasts
+
+        Returns:
+            (list): (seconds, QEvent.Type, QPoint) of each event
+    '''
+    stream = []
+    perStroke = max(int(rate * STROKE_SECONDS), 2)
+    count = int(rate * seconds)
+    for stroke, first in enumerate(range(0, count, perStroke)):
+        points = getTrace(rect.width(), rect.height(),
+                          min(perStroke, count - first), stroke)
+        for index, point in enumerate(points):
+            if index == 0:
+                kind = QEvent.MouseButtonPress
+            elif index == len(points) - 1:
+                kind = QEvent.MouseButtonRelease
+            else:
+                kind = QEvent.MouseMove
+            stream.append(
+                ((first + index) / rate, kind, point + rect.topLeft()))
+    return stream
+
+
+def loadStream(path: str, rect):
+    '''
+        The strokes of a project's stroke log, with the timing they were
+        drawn with, scaled in to a region of the widget
+
+        Args:
+            path (str):   The project
+            rect (QRect): The region, in widget coordinates
+
+        Returns:
+            (list): (seconds, QEvent.Type, QPoint) of each event
+    '''
+    from app.lib.project_file import ProjectFile
+    from app.models.stroke_log import StrokeLog
+    project = ProjectFile(path)
+    index = project.readIndex()
+    # Keyframes aren't needed, only the strokes
+    log = StrokeLog.fromBytes(project.read(*index['log']),
+                              itertools.repeat(None))
+    project.close()
+    scaleX = (rect.width() - 1) / max(log.size.width() - 1, 1)
+    scaleY = (rect.height() - 1) / max(log.size.height() - 1, 1)
+    stream = []
+    origin = None
+    for event in log:
+        if not isinstance(event, StrokeLog.Stroke):
+            continue
+        points = event.points
+        count = len(points) // 2
+        for index in range(count):
+            moment = event.start + event.times[index] / 1000
+            origin = moment if origin is None else origin
+            if index == 0:
+                kind = QEvent.MouseButtonPress
+            elif index == count - 1:
+                kind = QEvent.MouseButtonRelease
+            else:
+                kind = QEvent.MouseMove
+            point = QPoint(rect.left() + round(points[index * 2] * scaleX),
+                           rect.top() + round(points[index * 2 + 1] * scaleY))
+            stream.append((moment - origin, kind, point))
+    # Runs overlap by their joining point, which arrived at the same time
+    return sorted(stream, key=lambda event: event[0])
+
+
+def retime(stream, rate: int):
+    '''
+        Space the events of a stream evenly at a rate
+
+        Args:
+            stream (list): (seconds, QEvent.Type, QPoint) of each event
+            rate   (int):  Events a second
+
+        Returns:
+            (list)
+    '''
+    return [(index / rate, kind, point)
+            for index, (_, kind, point) in enumerate(stream)]
+
+
+def replay(probe, stream):
+    '''
+        Send a stream of events on schedule, running the event loop in
+        between so frames are drawn and painted as they would be
+
+        Args:
+            probe  (Probe): The probe
+            stream (list):  (seconds, QEvent.Type, QPoint) of each event
+
+        Returns:
+            (dict): See Probe.getResult
+    '''
+    application = getApplication()
+    probe.reset()
+    start = time.perf_counter()
+    for moment, kind, point in stream:
+        due = start + moment
+        while time.perf_counter() < due:
+            application.processEvents()
+        probe.send(kind, point, time.perf_counter() - due > 0.001)
+    end = time.perf_counter()
+    wait(SETTLE_SECONDS)
+    return probe.getResult(start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure input to pixel latency")
+    parser.add_argument('--rates',
+                        help="Comma separated events a second, the default "
+                        "for generated streams is "
+                        f"{','.join(str(rate) for rate in RATES)} and "
+                        "projects keep their recorded timing")
+    parser.add_argument('--seconds', type=float, default=SECONDS)
+    parser.add_argument('--project',
+                        help="Replay the strokes of a project instead")
+    parser.add_argument('--output', help="Write the results to a JSON file")
+    arguments = parser.parse_args()
+    getApplication()
+    from app.painter import Painter
+    painter = Painter()
+    wait(0.5)
+    probe = Probe(painter)
+    controller = probe.controller
+    # Only the part of the document on screen is ever painted
+    document = controller.getTransform().mapRect(
+        controller.canvas.image.rect()).intersected(
+            controller.visibleRegion().boundingRect())
+    rates = (list(map(int, arguments.rates.split(',')))
+             if arguments.rates else None)
+    if arguments.project:
+        recorded = loadStream(arguments.project, document)
+        streams = ({f"{rate} Hz": retime(recorded, rate) for rate in rates}
+                   if rates else {'recorded': recorded})
+    else:
+        streams = {
+            f"{rate} Hz": generateStream(document, rate, arguments.seconds)
+            for rate in rates or RATES
+        }
+    results = {}
+    print(f"{'stream':<10}{'events':>8}{'late':>6}{'pixel p50/p99 ms':>20}"
+          f"{'status p50/p99 ms':>20}{'fps':>7}{'dropped':>9}{'lost':>6}")
+    for name, stream in streams.items():
+        controller.canvas.clear()
+        wait(0.1)
+        result = replay(probe, stream)
+        results[name] = result
+        pixel, status = result['pixel'], result['status']
+        print(f"{name:<10}{result['events']:>8}{result['late']:>6}"
+              f"{pixel['p50']:>10}{pixel['p99']:>10}"
+              f"{status['p50']:>10}{status['p99']:>10}"
+              f"{result['fps']:>7}{result['droppedFrames']:>9}"
+              f"{result['lost']:>6}")
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if any(result['lost'] for result in results.values()):
+        print("Some input events never reached the screen")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+'''
+    Paint Rate
+    Counts canvas paint events per second while idle and while drawing. The
+    canvas not repainting when nothing has changed is checked by
+    tests/test_canvas_controller.py
+
+    Usage:
+        python3 -m benchmarks.paint_rate
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import sys
+
+from benchmarks.harness import (PaintCounter, getApplication, sendMouse,
+                                wait)
+from PyQt5.QtCore import QEvent, QPoint
+
+SECONDS = 1.0
+
+
+def main():
+    getApplication()
+    from app.painter import Painter
+    painter = Painter()
+    wait(0.5)
+    controller = painter.mainController.getCanvasController()
+    counter = PaintCounter(controller)
+
+    idle = counter.measure(SECONDS)
+
+    points = iter(QPoint(20 + i % 300, 20 + (i // 300) % 300)
+                  for i in range(1000000))
+    sendMouse(controller, QEvent.MouseButtonPress, next(points))
+    drawing = counter.measure(
+        SECONDS,
+        lambda: sendMouse(controller, QEvent.MouseMove, next(points)))
+    sendMouse(controller, QEvent.MouseButtonRelease, next(points))
+
+    print(f"idle:    {idle:.1f} paints/s")
+    print(f"drawing: {drawing:.1f} paints/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+'''
+    Project Save
+    Times saving an 8K project, saving it again after a one pixel edit and
+    opening it, and fails if the save after the edit isn't quick, i.e. it
+    rewrote more than the tile that changed
+
+    Usage:
+        python3 -m benchmarks.project_save
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import getApplication
+from PyQt5.QtCore import QPoint, QSize, QThreadPool
+from PyQt5.QtGui import QColor
+
+MAX_EDIT_SAVE_MS = 50
+SIZE = (7680, 4320)
+
+
+def save(canvas, path):
+    '''
+        Save a canvas as a project and wait for it to be written
+
+        Args:
+            canvas (Canvas): The canvas
+            path   (str):    The path of the project
+
+        Returns:
+            (float): Milliseconds
+    '''
+    application = getApplication()
+    start = time.perf_counter()
+    worker = canvas.saveProject(path)
+    worker.signals.failed.connect(lambda error: print(error))
+    while canvas.projectSaves:
+        QThreadPool.globalInstance().waitForDone()
+        application.processEvents()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    from app.models.brush import Brush
+    from app.models.canvas import Canvas
+    getApplication()
+    canvas = Canvas(QSize(*SIZE))
+    brush = Brush()
+    brush.setSize(40)
+    # Every tile is allocated, with strokes across them
+    brush.setBrushType('FILL')
+    brush.setColour(QColor('#c0d0e0'))
+    canvas.fill(QPoint(0, 0), brush)
+    brush.setColour(QColor('#203040'))
+    for stroke in range(20):
+        canvas.snapshotImage()
+        canvas.beginStroke(QPoint(0, stroke * 200), brush)
+        canvas.extendStroke(QPoint(SIZE[0] - 1, SIZE[1] - 1 - stroke * 200))
+        canvas.brushAwayFromCanvas()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.painter')
+        elapsed = save(canvas, path)
+        print(f"save {SIZE[0]}x{SIZE[1]}: {elapsed:.1f} ms, "
+              f"{os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+        canvas.snapshotImage()
+        canvas.brushOnCanvas(QPoint(SIZE[0] // 2, SIZE[1] // 2))
+        canvas.draw(QPoint(SIZE[0] // 2, SIZE[1] // 2), brush)
+        canvas.brushAwayFromCanvas()
+        size = os.path.getsize(path)
+        edit = save(canvas, path)
+        print(f"save after a one pixel edit: {edit:.1f} ms, "
+              f"{(os.path.getsize(path) - size) / 1024:.1f} KiB appended")
+        opened = Canvas(QSize(1, 1))
+        start = time.perf_counter()
+        opened.openProject(path)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"open: {elapsed:.1f} ms")
+        opened.close()
+    canvas.close()
+    if edit > MAX_EDIT_SAVE_MS:
+        print(f"Saving a one pixel edit took over {MAX_EDIT_SAVE_MS} ms")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+'''
+    Stroke Replay
+    Records a session of strokes, fills and layers, replays its stroke log
+    at the size it was drawn and at twice the size, and fails if the replay
+    at the same size doesn't match the canvas pixel for pixel
+
+    Usage:
+        python3 -m benchmarks.stroke_replay
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import math
+import sys
+import time
+
+from benchmarks.harness import getApplication
+from PyQt5.QtCore import QPoint, QSize
+from PyQt5.QtGui import QColor
+
+SIZE = (1920, 1080)
+STROKES = 200
+POINTS = 60
+FLUSH_EVERY = 4
+
+
+def record(canvas, brush):
+    '''
+        Draw a repeatable session on a canvas, the strokes are flushed in
+        batches as the canvas controller does
+
+        Args:
+            canvas (Canvas): The canvas
+            brush  (Brush):  The brush
+    '''
+    width, height = SIZE
+    brush.setBrushType('FILL')
+    brush.setColour(QColor('#e0e8f0'))
+    canvas.fill(QPoint(0, 0), brush)
+    brush.setBrushType('BRUSH')
+    for stroke in range(STROKES):
+        if stroke == STROKES // 2:
+            canvas.addLayer()
+            canvas.setLayerOpacity(1, 0.6)
+        brush.setColour(QColor.fromHsv(stroke * 37 % 360, 200, 200))
+        brush.setSize(2 + stroke % 30)
+        canvas.snapshotImage()
+        for step in range(POINTS):
+            angle = stroke + step / 10
+            point = QPoint(
+                int(width / 2 + math.cos(angle) * (step * 7 + stroke) %
+                    (width / 2)),
+                int(height / 2 + math.sin(angle * 1.3) * (step * 5) %
+                    (height / 2)))
+            if step == 0:
+                canvas.beginStroke(point, brush)
+            else:
+                canvas.extendStroke(point)
+                if step % FLUSH_EVERY == 0:
+                    canvas.flushStroke()
+        canvas.brushAwayFromCanvas()
+        if stroke % 50 == 49:
+            canvas.undo()
+
+
+def main():
+    from app.models.brush import Brush
+    from app.models.canvas import Canvas
+    getApplication()
+    canvas = Canvas(QSize(*SIZE))
+    record(canvas, Brush())
+    log = canvas.getLog()
+    print(f"log: {log.getSize() / 1024:.1f} KiB in memory, "
+          f"{len(log.toBytes()) / 1024:.1f} KiB saved, undo history "
+          f"{canvas.history.getSize() / 1024:.1f} KiB")
+    failed = False
+    for scale in (1, 2):
+        start = time.perf_counter()
+        replay = Canvas.fromLog(log, scale)
+        elapsed = (time.perf_counter() - start) * 1000
+        size = replay.size
+        print(f"replay {size.width()}x{size.height()}: {elapsed:.1f} ms")
+        if scale == 1 and replay.getImage() != canvas.getImage():
+            print("The replay doesn't match the canvas it was recorded from")
+            failed = True
+        replay.close()
+    canvas.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
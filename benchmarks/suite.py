@@ -0,0 +1,399 @@
+'''
+    Suite
+    Times the drawing hot path headless, at canvas sizes from 600x400 to 8K,
+    and compares the results with stored baselines to catch regressions.
+    For each case and size it reports the operations a second, the median
+    and 99th percentile latency and the peak growth in resident memory
+
+    Usage:
+        python3 -m benchmarks.suite [--quick] [--cases draw,undo]
+                                    [--update] [--output results.json]
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.harness import (getApplication, getPercentile,
+                                getResidentMemory, getTrace)
+from PyQt5.QtCore import QPoint, QSize, QThreadPool
+from PyQt5.QtGui import QColor, QImage, QLinearGradient, QPainter
+
+SIZES = ((600, 400), (1920, 1080), (3840, 2160), (7680, 4320))
+QUICK_SIZES = SIZES[:2]
+BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'suite.json')
+# A case regresses once its median is this much slower than the baseline,
+# and slower by more than the noise of a run, sub-millisecond cases often
+# double from one run to the next
+TOLERANCE = 1.0
+MIN_REGRESSION_MS = 0.5
+# Cases that work on the whole canvas run fewer times as it grows
+WHOLE_CANVAS_REPEATS = 20
+MIN_REPEATS = 3
+SAMPLE_INTERVAL = 0.002
+
+
+class Recorder:
+    '''
+        Times operations one at a time, and samples the resident memory from
+        a thread between begin and end to find its peak, which is often
+        reached in the middle of an operation or in a worker
+    '''
+    def __init__(self):
+        self.latencies = []
+        self.start = getResidentMemory()
+        self.peak = self.start
+        self.running = threading.Event()
+        self.sampler = None
+
+    def begin(self):
+        '''
+            Start sampling the resident memory
+        '''
+        self.running.set()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+
+    def sample(self):
+        '''
+            Sample the resident memory until stopped
+        '''
+        while self.running.is_set():
+            self.peak = max(self.peak, getResidentMemory())
+            time.sleep(SAMPLE_INTERVAL)
+
+    def end(self):
+        '''
+            Stop sampling the resident memory
+        '''
+        self.running.clear()
+        self.sampler.join()
+
+    def time(self, action):
+        '''
+            Time an operation
+
+            Args:
+                action (func): The operation
+
+            Returns:
+                (object): What the operation returned
+        '''
+        start = time.perf_counter()
+        result = action()
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        return result
+
+    def getResult(self):
+        '''
+            Summarise the operations timed
+
+            Returns:
+                (dict): ops a second, p50 and p99 in milliseconds and the
+                        peak growth in resident memory in MiB
+        '''
+        total = sum(self.latencies) / 1000
+        return {
+            'ops': round(len(self.latencies) / total if total else 0.0, 1),
+            'p50': round(getPercentile(self.latencies, 50), 4),
+            'p99': round(getPercentile(self.latencies, 99), 4),
+            'peakMiB': round((self.peak - self.start) / 1024 / 1024, 1)
+        }
+
+
+def getRepeats(size):
+    '''
+        How many times to run a case that works on the whole canvas
+
+        Args:
+            size (tuple): The (width, height) of the canvas
+
+        Returns:
+            (int)
+    '''
+    scale = SIZES[0][0] * SIZES[0][1] / (size[0] * size[1])
+    return max(int(WHOLE_CANVAS_REPEATS * scale), MIN_REPEATS)
+
+
+def getImage(size):
+    '''
+        A gradient the size of the canvas, to open
+
+        Args:
+            size (tuple): The (width, height) of the image
+
+        Returns:
+            (QImage)
+    '''
+    image = QImage(QSize(*size), QImage.Format_RGB32)
+    gradient = QLinearGradient(0, 0, size[0], size[1])
+    gradient.setColorAt(0, QColor('#203040'))
+    gradient.setColorAt(1, QColor('#f0c080'))
+    painter = QPainter(image)
+    painter.fillRect(image.rect(), gradient)
+    painter.end()
+    return image
+
+
+def benchmarkDraw(canvas, brush, size, recorder):
+    '''
+        Canvas.draw, a segment from the last point each mouse move
+    '''
+    points = getTrace(*size, 2000)
+    canvas.snapshotImage()
+    canvas.brushOnCanvas(points[0])
+    for point in points[1:]:
+        recorder.time(lambda: canvas.draw(point, brush))
+    canvas.brushAwayFromCanvas()
+
+
+def benchmarkStroke(canvas, brush, size, recorder):
+    '''
+        Canvas.extendStroke with flushStroke every few points, as the canvas
+        controller batches moves between frames
+    '''
+    points = getTrace(*size, 2001)
+    canvas.snapshotImage()
+    canvas.beginStroke(points[0], brush)
+    for start in range(1, len(points), 4):
+
+        def flush():
+            for point in points[start:start + 4]:
+                canvas.extendStroke(point)
+            return canvas.flushStroke()
+
+        recorder.time(flush)
+    canvas.brushAwayFromCanvas()
+
+
+def benchmarkDrawPreview(canvas, brush, size, recorder):
+    '''
+        Canvas.drawPreview, a line from where the brush went down
+    '''
+    points = getTrace(*size, 1000)
+    canvas.brushOnCanvas(QPoint(size[0] // 2, size[1] // 2))
+    for point in points:
+        recorder.time(lambda: canvas.drawPreview(point, brush))
+    canvas.brushAwayFromCanvas()
+
+
+def benchmarkDrawActual(canvas, brush, size, recorder):
+    '''
+        Canvas.drawActual, the line drawn in to the image once the preview
+        is done
+    '''
+    points = getTrace(*size, 400)
+    for start, end in zip(points[::2], points[1::2]):
+        canvas.snapshotImage()
+        canvas.brushOnCanvas(start)
+        canvas.drawPreview(end, brush)
+        recorder.time(lambda: canvas.drawActual(end, brush))
+        canvas.brushAwayFromCanvas()
+
+
+def benchmarkSnapshotImage(canvas, brush, size, recorder):
+    '''
+        Canvas.snapshotImage, which commits the stroke before it in to the
+        undo history
+    '''
+    points = getTrace(*size, 4000)
+    for start in range(0, len(points), 20):
+        recorder.time(canvas.snapshotImage)
+        canvas.beginStroke(points[start], brush)
+        for point in points[start + 1:start + 20]:
+            canvas.extendStroke(point)
+        canvas.endStroke()
+    canvas.brushAwayFromCanvas()
+
+
+def benchmarkUndo(canvas, brush, size, recorder):
+    '''
+        Canvas.undo of strokes, then Canvas.redo of them
+    '''
+    points = getTrace(*size, 4000)
+    for start in range(0, len(points), 20):
+        canvas.snapshotImage()
+        canvas.beginStroke(points[start], brush)
+        for point in points[start + 1:start + 20]:
+            canvas.extendStroke(point)
+        canvas.brushAwayFromCanvas()
+    while not canvas.history.isEmpty():
+        recorder.time(canvas.undo)
+    while not canvas.history.isRedoEmpty():
+        recorder.time(canvas.redo)
+
+
+def benchmarkSetImage(canvas, brush, size, recorder):
+    '''
+        Canvas.setImage with an image the size of the canvas
+    '''
+    image = getImage(size)
+    for _ in range(getRepeats(size)):
+        recorder.time(lambda: canvas.setImage(image))
+
+
+def benchmarkSave(canvas, brush, size, recorder):
+    '''
+        Canvas.save to a PNG, until the worker has written it
+    '''
+    canvas.setImage(getImage(size))
+    application = getApplication()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.png')
+
+        def save():
+            canvas.save(path)
+            QThreadPool.globalInstance().waitForDone()
+            application.processEvents()
+
+        for _ in range(getRepeats(size)):
+            recorder.time(save)
+
+
+CASES = {
+    'draw': benchmarkDraw,
+    'stroke': benchmarkStroke,
+    'drawPreview': benchmarkDrawPreview,
+    'drawActual': benchmarkDrawActual,
+    'snapshotImage': benchmarkSnapshotImage,
+    'undo': benchmarkUndo,
+    'setImage': benchmarkSetImage,
+    'save': benchmarkSave
+}
+
+
+def run(case: str, size):
+    '''
+        Run a case on a new canvas
+
+        Args:
+            case (str):   The name of the case, see CASES
+            size (tuple): The (width, height) of the canvas
+
+        Returns:
+            (dict): See Recorder.getResult
+    '''
+    from app.models.brush import Brush
+    from app.models.canvas import Canvas
+    canvas = Canvas(QSize(*size))
+    brush = Brush()
+    brush.setSize(12)
+    recorder = Recorder()
+    recorder.begin()
+    CASES[case](canvas, brush, size, recorder)
+    recorder.end()
+    canvas.close()
+    return recorder.getResult()
+
+
+def getMachine():
+    '''
+        Describe the machine, baselines only compare well on the machine
+        they were taken on
+
+        Returns:
+            (dict)
+    '''
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'processor': platform.machine(),
+        'cpus': os.cpu_count()
+    }
+
+
+def compare(results, baseline, tolerance: float):
+    '''
+        Find the cases whose median latency has regressed past the baseline
+
+        Args:
+            results   (dict):  The results, see run, by case and size
+            baseline  (dict):  The baseline results in the same form
+            tolerance (float): How much slower a case can be, 1 is twice as
+                               slow
+
+        Returns:
+            (list): A line describing each regression
+    '''
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if (result['p50'] > expected['p50'] * (1 + tolerance)
+                and result['p50'] - expected['p50'] > MIN_REGRESSION_MS):
+            regressions.append(f"{name}: p50 {result['p50']:.3f} ms, "
+                               f"baseline {expected['p50']:.3f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the drawing hot path")
+    parser.add_argument('--quick',
+                        action='store_true',
+                        help="Only the sizes up to 1920x1080")
+    parser.add_argument('--cases',
+                        default=','.join(CASES),
+                        help="Comma separated cases to run")
+    parser.add_argument('--update',
+                        action='store_true',
+                        help="Store the results as the baseline")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--output', help="Write the results to a JSON file")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    arguments = parser.parse_args()
+    cases = arguments.cases.split(',')
+    unknown = set(cases) - CASES.keys()
+    if unknown:
+        parser.error("Unknown cases: %s" % (', '.join(sorted(unknown))))
+    getApplication()
+    results = {}
+    print(f"{'case':<24}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'peak MiB':>10}")
+    for size in QUICK_SIZES if arguments.quick else SIZES:
+        for case in cases:
+            name = f"{case}@{size[0]}x{size[1]}"
+            result = run(case, size)
+            results[name] = result
+            print(f"{name:<24}{result['ops']:>10.1f}{result['p50']:>10.3f}"
+                  f"{result['p99']:>10.3f}{result['peakMiB']:>10.1f}")
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump({'machine': getMachine(), 'results': results}, output,
+                      indent=2)
+    if arguments.update:
+        stored = {'machine': getMachine(), 'results': {}}
+        if os.path.exists(arguments.baseline):
+            with open(arguments.baseline) as baseline:
+                stored['results'] = json.load(baseline)['results']
+        stored['results'].update(results)
+        os.makedirs(os.path.dirname(arguments.baseline), exist_ok=True)
+        with open(arguments.baseline, 'w') as baseline:
+            json.dump(stored, baseline, indent=2, sort_keys=True)
+            baseline.write('\n')
+        print(f"Baseline updated: {arguments.baseline}")
+        return 0
+    if not os.path.exists(arguments.baseline):
+        print("No baseline to compare with, run with --update to store one")
+        return 0
+    with open(arguments.baseline) as baseline:
+        stored = json.load(baseline)
+    if stored['machine'] != getMachine():
+        print("The baseline was taken on a different machine: "
+              f"{stored['machine']['platform']}")
+    regressions = compare(results, stored['results'], arguments.tolerance)
+    for regression in regressions:
+        print(f"Regressed {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
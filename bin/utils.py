@@ -63,13 +63,15 @@ class Loader:
         if exception is not None:
             return False
 
-def execute_step(processList, errorMessage: str):
+def execute_step(processList, errorMessage: str, warnOnly: bool = False):
     '''
         Check process evaluates the CompletedProcess object from subprocess.run
 
         Args:
             completedProcess (CompletedProcess): The completed output from subprocess.run
             errorMessage (str): The error string to return
+            warnOnly (bool): Print the output of a failure and carry on, for
+                             checks too noisy to stop the build
     '''
     with Loader(delay=0.2):
         completedProcess = subprocess.run(processList, capture_output=True)
@@ -78,7 +80,7 @@ def execute_step(processList, errorMessage: str):
         print("--\t[OK]")
         return
     # If not we have a failure so pass the stderr data
-    print("--\t[Failed]")
+    print("--\t[Warning] " + errorMessage if warnOnly else "--\t[Failed]")
     stdout = b'' if completedProcess.stdout is None else completedProcess.stdout
     stderr = b'' if completedProcess.stderr is None else completedProcess.stderr
     print("--\t[Debug]")
@@ -91,6 +93,8 @@ def execute_step(processList, errorMessage: str):
         if not line:
             continue
         print("--\t[Error] " + line)
+    if warnOnly:
+        return
     print("--\t[Ensure you are in the right directory]")
     exit()
 
@@ -1,14 +1,38 @@
 '''
     Painter Entry Point
     Author: Matthew Barber<mfmbarber@gmail.com>
+
+    Usage:
+        python3 painter.py [--instruments [timing|profile|memory]]
+                           [--instruments-output path.json]
+
+    The instruments can also be turned on with PAINTER_INSTRUMENTS=1 (or a
+    mode) and PAINTER_INSTRUMENTS_OUTPUT
 '''
 
+import argparse
 import sys
 
+from app.lib.instruments import MODES, Instruments
 from app.painter import Painter
 from PyQt5.QtWidgets import QApplication
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    ex = Painter()
+    parser = argparse.ArgumentParser(description="Painter")
+    parser.add_argument('--instruments',
+                        nargs='?',
+                        const='timing',
+                        choices=MODES,
+                        help="Time the drawing hot path, and optionally "
+                        "profile it or trace its memory")
+    parser.add_argument('--instruments-output',
+                        help="Where to write what the instruments found")
+    arguments, remaining = parser.parse_known_args()
+    instruments = Instruments.fromEnvironment(arguments.instruments,
+                                              arguments.instruments_output)
+    app = QApplication(sys.argv[:1] + remaining)
+    if instruments:
+        instruments.install()
+        app.aboutToQuit.connect(instruments.finish)
+    ex = Painter(instruments)
     sys.exit(app.exec_())
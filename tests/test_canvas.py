@@ -0,0 +1,130 @@
+'''
+    Canvas Tests
+    Each canvas owns its history, undoing restores what a change replaced,
+    and closing a canvas releases its memory
+
+    Usage:
+        python3 -m unittest discover -s tests
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import gc
+import unittest
+
+import numpy
+
+from benchmarks.harness import getApplication, getResidentMemory
+from PyQt5.QtCore import QPoint, QSize
+from PyQt5.QtGui import QColor
+
+CANVASES = 100
+WARM_UP = 10
+MAX_GROWTH = 16 * 1024 * 1024
+SIZE = (1920, 1080)
+
+
+class TestCanvas(unittest.TestCase):
+    '''
+        Canvases drawn on, undone and closed
+    '''
+    @classmethod
+    def setUpClass(cls):
+        getApplication()
+
+    def getCanvas(self, size=SIZE):
+        '''
+            A canvas with some undoable strokes on it
+
+            Args:
+                size (tuple): The (width, height) of the canvas
+
+            Returns:
+                (Canvas)
+        '''
+        from app.models.brush import Brush
+        from app.models.canvas import Canvas
+        canvas = Canvas(QSize(*size))
+        brush = Brush()
+        brush.setSize(40)
+        for stroke in range(10):
+            canvas.snapshotImage()
+            canvas.beginStroke(QPoint(0, stroke * 100), brush)
+            for step in range(1, 20):
+                canvas.extendStroke(
+                    QPoint(step * 100, stroke * 100 + step * 5))
+            canvas.brushAwayFromCanvas()
+        return canvas
+
+    def testHistoryIsPerCanvas(self):
+        first = self.getCanvas()
+        second = self.getCanvas()
+        self.assertIsNot(first.history, second.history)
+        size = second.history.getSize()
+        first.undo()
+        first.close()
+        self.assertEqual(first.history.getSize(), 0)
+        self.assertTrue(first.history.isEmpty())
+        self.assertEqual(second.history.getSize(), size)
+        self.assertFalse(second.history.isEmpty())
+        second.close()
+
+    def testUndoAfterCompressingInTheBackground(self):
+        from app.models.canvas import Canvas
+        from app.workers.compress_worker import CompressWorker
+        canvas = Canvas(QSize(*SIZE))
+        noise = numpy.random.default_rng(0).integers(
+            180, 221, (SIZE[1], SIZE[0], 4), numpy.uint8)
+        noise[..., 3] = 255
+        canvas.setArray(noise)
+        before = canvas.getArray().copy()
+        canvas.floodFill(QPoint(960, 540), QColor('#2060c0'), 32)
+        filled = canvas.getArray().copy()
+        canvas.floodFill(QPoint(960, 540), QColor('#ffffff'), 0)
+        # The first fill is compressed once the second follows it
+        CompressWorker.pool.waitForDone()
+        getApplication().processEvents()
+        canvas.undo()
+        self.assertTrue((canvas.getArray() == filled).all())
+        canvas.undo()
+        self.assertTrue((canvas.getArray() == before).all())
+        canvas.redo()
+        self.assertTrue((canvas.getArray() == filled).all())
+        canvas.close()
+
+    def testEffectPreviewShowsTheOtherLayers(self):
+        from app.lib.effects import Invert
+        from app.models.canvas import Canvas
+        canvas = Canvas(QSize(400, 200))
+        canvas.addLayer()
+        canvas.floodFill(QPoint(), QColor('#ff0000'), 0)
+        canvas.getLayers()[1].opacity = 0.5
+        canvas.setActiveLayer(0)
+        canvas.previewEffect(Invert())
+        preview = canvas.getOverlay().image
+        canvas.setArray(Invert().apply(canvas.getArray()))
+        expected = canvas.getImage().scaled(preview.size())
+        # The half transparent red layer is still over the background,
+        # inverted from white to black
+        self.assertEqual(preview.pixel(100, 50), expected.pixel(100, 50))
+        self.assertGreater(QColor(preview.pixel(100, 50)).red(), 100)
+        canvas.close()
+
+    def testClosedCanvasesReleaseMemory(self):
+        def useCanvas():
+            canvas = self.getCanvas()
+            canvas.undo()
+            canvas.close()
+
+        for _ in range(WARM_UP):
+            useCanvas()
+        gc.collect()
+        before = getResidentMemory()
+        for _ in range(CANVASES):
+            useCanvas()
+        gc.collect()
+        self.assertLessEqual(getResidentMemory() - before, MAX_GROWTH)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+'''
+    Canvas Controller Tests
+    The canvas only repaints when it changes
+
+    Usage:
+        python3 -m unittest discover -s tests
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import unittest
+
+from benchmarks.harness import (PaintCounter, getApplication, sendMouse,
+                                wait)
+from PyQt5.QtCore import QEvent, QPoint
+
+MAX_IDLE_RATE = 1.0
+SECONDS = 1.0
+
+
+class TestCanvasController(unittest.TestCase):
+    '''
+        Counts the paints of the canvas of a Painter window
+    '''
+    @classmethod
+    def setUpClass(cls):
+        getApplication()
+        from app.painter import Painter
+        cls.painter = Painter()
+        wait(0.5)
+        cls.controller = cls.painter.mainController.getCanvasController()
+        cls.counter = PaintCounter(cls.controller)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.controller.removeEventFilter(cls.counter)
+        cls.painter.close()
+
+    def testIdleDoesNotRepaint(self):
+        self.assertLessEqual(self.counter.measure(SECONDS), MAX_IDLE_RATE)
+
+    def testDrawingRepaints(self):
+        points = iter(QPoint(20 + i % 300, 20 + (i // 300) % 300)
+                      for i in range(1000000))
+        sendMouse(self.controller, QEvent.MouseButtonPress, next(points))
+        drawing = self.counter.measure(
+            SECONDS, lambda: sendMouse(self.controller, QEvent.MouseMove,
+                                       next(points)))
+        sendMouse(self.controller, QEvent.MouseButtonRelease, next(points))
+        self.assertGreater(drawing, 0)
+        wait(0.3)
+        self.assertLessEqual(self.counter.measure(SECONDS), MAX_IDLE_RATE)
+
+
+if __name__ == '__main__':
+    unittest.main()
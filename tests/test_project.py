@@ -0,0 +1,104 @@
+'''
+    Project Tests
+    Saving and opening projects closes the files it's done with, and tiles
+    left to load are still read after the project is saved elsewhere
+
+    Usage:
+        python3 -m unittest discover -s tests
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import os
+import tempfile
+import unittest
+
+from benchmarks.harness import getApplication
+from benchmarks.project_save import save
+from PyQt5.QtCore import QPoint, QSize
+from PyQt5.QtGui import QColor
+
+SAVES = 20
+SIZE = (600, 400)
+DESCRIPTORS = '/proc/self/fd'
+
+
+class TestProject(unittest.TestCase):
+    '''
+        Canvases saved as projects and opened again
+    '''
+    @classmethod
+    def setUpClass(cls):
+        getApplication()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def getPath(self, name):
+        '''
+            A path in the test's directory
+
+            Args:
+                name (str): The name of the project
+
+            Returns:
+                (str)
+        '''
+        return os.path.join(self.directory.name, name + '.painter')
+
+    def getCanvas(self):
+        '''
+            A canvas with a stroke across it
+
+            Returns:
+                (Canvas)
+        '''
+        from app.models.brush import Brush
+        from app.models.canvas import Canvas
+        canvas = Canvas(QSize(*SIZE))
+        brush = Brush()
+        brush.setSize(20)
+        brush.setColour(QColor('#203040'))
+        canvas.snapshotImage()
+        canvas.brushOnCanvas(QPoint(0, 0))
+        canvas.draw(QPoint(SIZE[0] - 1, SIZE[1] - 1), brush)
+        canvas.brushAwayFromCanvas()
+        return canvas
+
+    @unittest.skipUnless(os.path.isdir(DESCRIPTORS), "Needs /proc")
+    def testSavesCloseTheirProjects(self):
+        from app.models.canvas import Canvas
+        before = len(os.listdir(DESCRIPTORS))
+        canvas = self.getCanvas()
+        for index in range(SAVES):
+            # Alternate appending to a project and writing a new one
+            save(canvas, self.getPath(str(index % 2)))
+        opened = Canvas(QSize(1, 1))
+        opened.openProject(self.getPath('0'))
+        opened.openProject(self.getPath('1'))
+        save(opened, self.getPath('0'))
+        canvas.close()
+        opened.close()
+        self.assertLessEqual(len(os.listdir(DESCRIPTORS)), before)
+
+    def testSavingElsewhereKeepsTilesToLoad(self):
+        from app.models.canvas import Canvas
+        canvas = self.getCanvas()
+        save(canvas, self.getPath('first'))
+        expected = canvas.getImage()
+        canvas.close()
+        opened = Canvas(QSize(1, 1))
+        opened.openProject(self.getPath('first'))
+        # None of the tiles have been loaded, they're copied across and
+        # then read from the second project
+        save(opened, self.getPath('second'))
+        os.remove(self.getPath('first'))
+        self.assertEqual(opened.getImage(), expected)
+        opened.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+'''
+    Stroke Log Tests
+    Replaying a stroke log leaves the log it was replayed from intact
+
+    Usage:
+        python3 -m unittest discover -s tests
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import unittest
+
+from benchmarks.harness import getApplication
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QColor, QImage
+
+GREEN = QColor('#00ff00').rgb()
+
+
+class TestStrokeLog(unittest.TestCase):
+    '''
+        Replays of a canvas opened from an image, with an effect applied
+    '''
+    @classmethod
+    def setUpClass(cls):
+        getApplication()
+
+    def setUp(self):
+        from app.lib.effects import Invert
+        from app.models.canvas import Canvas
+        self.canvas = Canvas(QSize(300, 200))
+        image = QImage(300, 200, QImage.Format_RGB32)
+        image.fill(GREEN)
+        self.canvas.setImage(image)
+        self.canvas.setArray(Invert().apply(self.canvas.getArray()))
+        self.canvas.setArray(Invert().apply(self.canvas.getArray()))
+
+    def tearDown(self):
+        self.canvas.close()
+
+    def testClosingAReplayKeepsTheKeyframes(self):
+        from app.models.canvas import Canvas
+        for _ in range(2):
+            replayed = Canvas.fromLog(self.canvas.log)
+            self.assertEqual(replayed.getImage().pixel(150, 100), GREEN)
+            replayed.close()
+        self.assertEqual(self.canvas.getImage().pixel(150, 100), GREEN)
+
+    def testScaledReplayKeepsTheKeyframes(self):
+        from app.models.canvas import Canvas
+        replayed = Canvas.fromLog(self.canvas.log, 0.5)
+        self.assertEqual(replayed.getImage().pixel(75, 50), GREEN)
+        replayed.close()
+        replayed = Canvas.fromLog(self.canvas.log)
+        self.assertEqual(replayed.getImage().pixel(150, 100), GREEN)
+        replayed.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+'''
+    Throttle Tests
+    States are published at a limited rate, and held states aren't dropped
+
+    Usage:
+        python3 -m unittest discover -s tests
+
+    Author:
+        Matthew Barber <mfmbarber@gmail.com>
+'''
+import unittest
+
+from benchmarks.harness import getApplication, wait
+
+RATE = 10
+HOLD_MS = 300
+
+
+class TestStateThrottle(unittest.TestCase):
+    '''
+        States pushed and held through a throttle
+    '''
+    @classmethod
+    def setUpClass(cls):
+        getApplication()
+
+    def setUp(self):
+        from app.lib.throttle import StateThrottle
+        self.throttle = StateThrottle(RATE)
+        self.published = []
+        self.throttle.publish.connect(self.published.append)
+
+    def testOnlyTheLatestOfABurstIsPublished(self):
+        for state in range(5):
+            self.throttle.push(state)
+        self.assertEqual(self.published, [0])
+        wait(2 / RATE)
+        self.assertEqual(self.published, [0, 4])
+
+    def testHeldStatesArePublishedStraightAway(self):
+        self.throttle.push('state')
+        self.throttle.hold('Save failed', HOLD_MS)
+        self.assertEqual(self.published, ['state', 'Save failed'])
+
+    def testHeldStatesAreKept(self):
+        self.throttle.hold('Save failed', HOLD_MS)
+        self.throttle.push('first')
+        wait(2 / RATE)
+        self.throttle.push('second')
+        self.assertEqual(self.published, ['Save failed'])
+        wait(HOLD_MS / 1000 + 1 / RATE)
+        self.assertEqual(self.published, ['Save failed', 'second'])
+        # The rate goes back to normal once the hold is over
+        self.throttle.push('third')
+        wait(2 / RATE)
+        self.assertEqual(self.published, ['Save failed', 'second', 'third'])
+
+
+if __name__ == '__main__':
+    unittest.main()